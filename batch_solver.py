@@ -0,0 +1,190 @@
+"""Solves every level file of a directory on a process pool.
+
+Each level gets a fresh worker process with a wall time budget (--max-seconds)
+and an address space budget (--max-memory, in MB on top of what the worker
+already uses), so one hard level cannot stall or exhaust the machine. Results
+are printed as a table and kept in <model-dir>/solver_cache.json, keyed by a
+hash of the level's JSON content and the search options: levels that are
+unchanged since a run that solved them, or proved them unsolvable, are not
+searched again. Timeouts and exhausted budgets are not cached. A level whose
+file cannot be read or searched gets the status error, with the exception in
+the error column, and the other levels go on.
+
+    python batch_solver.py [levels_dir] [--algorithm astar] [--workers 4] [--max-seconds 60] [--csv results.csv] [--write]
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import time
+
+from solver import ALGORITHMS, MODEL_DIR, Solution, solve, write_solution
+
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gym_envs", "direkt", "levels")
+CACHE_FILE = "solver_cache.json"
+COLUMNS = ["level", "status", "length", "nodes", "states", "wall_time", "cached"]
+# results that stay true for a given level, everything else is tried again
+FINAL = ("solved", "unsolvable")
+
+
+# sha256 of the level's content, independent of its formatting and key order
+def level_hash(path):
+    with open(path) as f:
+        data = json.load(f)
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def cache_key(digest, options):
+    return digest + ':' + json.dumps(options, sort_keys=True)
+
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# written to a temporary file first, so an interrupted run leaves the old cache
+def save_cache(path, cache):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+# the result of a level without a search result, status "memory" or "error"
+def _failed(status, wall_time, error=None):
+    return {"status": status, "length": None, "nodes": None, "states": None, "wall_time": wall_time,
+            "actions": None, "error": error}
+
+
+# Solves one level in a pool worker. Returns the level name and its result,
+# a dict of the COLUMNS but cached plus the actions and, for status "error",
+# the exception.
+def _solve_level(task):
+    name, path, options, max_memory = task
+    if max_memory is not None:
+        # the worker only ever solves this level, maxtasksperchild=1
+        with open("/proc/self/statm") as f:
+            used = int(f.read().split()[0]) * resource.getpagesize()
+        resource.setrlimit(resource.RLIMIT_AS, (used + max_memory, resource.getrlimit(resource.RLIMIT_AS)[1]))
+
+    start_time = time.perf_counter()
+    try:
+        solution = solve(path, **options)
+    except MemoryError:
+        return name, _failed("memory", time.perf_counter() - start_time)
+    except Exception as e:
+        return name, _failed("error", time.perf_counter() - start_time, f"{type(e).__name__}: {e}")
+
+    if solution.actions is not None:
+        status = "solved"
+    elif options["max_seconds"] is not None and solution.wall_time >= options["max_seconds"]:
+        status = "timeout"
+    elif options["max_nodes"] is not None and solution.nodes_expanded >= options["max_nodes"]:
+        status = "node limit"
+    else:
+        status = "unsolvable"
+    return name, {
+        "status": status,
+        "length": None if solution.actions is None else len(solution.actions),
+        "nodes": solution.nodes_expanded,
+        "states": solution.states_seen,
+        "wall_time": solution.wall_time,
+        "actions": None if solution.actions is None else solution.action_string(),
+    }
+
+
+def _format_row(row):
+    cells = [row["level"], row["status"], "-" if row["length"] is None else row["length"],
+             "-" if row["nodes"] is None else row["nodes"], "-" if row["states"] is None else row["states"],
+             f"{row['wall_time']:.2f}", "yes" if row["cached"] else ""]
+    line = f"{cells[0]:<16}{cells[1]:<12}{cells[2]:>8}{cells[3]:>12}{cells[4]:>12}{cells[5]:>10}  {cells[6]}"
+    return line + f"  {row['error']}" if row.get("error") else line
+
+
+# Solves the levels of level_dir, returns the result rows sorted by level name.
+def solve_all(level_dir=LEVEL_DIR, options=None, workers=None, max_memory=None, model_dir=MODEL_DIR, force=False, write=False):
+    options = {"algorithm": "bfs", "weight": 1.0, "tt_size": 1 << 20, "max_nodes": None, "max_seconds": None, **(options or {})}
+    search_options = {k: options[k] for k in ("algorithm", "weight", "tt_size")}
+    os.makedirs(model_dir, exist_ok=True)
+    cache_path = os.path.join(model_dir, CACHE_FILE)
+    cache = load_cache(cache_path)
+
+    rows = []
+    tasks = []
+    keys = {}
+    for file in sorted(os.listdir(level_dir)):
+        if not file.endswith(".json"):
+            continue
+        name = os.path.splitext(file)[0]
+        path = os.path.abspath(os.path.join(level_dir, file))
+        try:
+            keys[name] = cache_key(level_hash(path), search_options)
+        except (OSError, ValueError) as e:
+            rows.append({"level": name, **_failed("error", 0.0, f"{type(e).__name__}: {e}"), "cached": False})
+            print(_format_row(rows[-1]))
+            continue
+        cached = cache.get(keys[name])
+        if cached is not None and not force:
+            rows.append({"level": name, **cached, "cached": True})
+            print(_format_row(rows[-1]))
+        else:
+            tasks.append((name, path, options, max_memory))
+
+    if tasks:
+        # a fresh process per level, so budgets and memory do not carry over
+        with multiprocessing.Pool(workers or os.cpu_count(), maxtasksperchild=1) as pool:
+            for name, result in pool.imap_unordered(_solve_level, tasks):
+                rows.append({"level": name, **result, "cached": False})
+                print(_format_row(rows[-1]))
+                if result["status"] in FINAL:
+                    cache[keys[name]] = result
+                    save_cache(cache_path, cache)
+                if write and result["status"] == "solved":
+                    actions = [int(a) for a in result["actions"].split('.')]
+                    solution = Solution(actions, result["nodes"], 0, result["states"], result["wall_time"])
+                    write_solution(name, solution, source=options["algorithm"], model_dir=model_dir)
+
+    rows.sort(key=lambda row: row["level"])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve every level of a directory in parallel.")
+    parser.add_argument("level_dir", nargs="?", default=LEVEL_DIR, help="directory of level files, defaults to gym_envs/direkt/levels")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="bfs")
+    parser.add_argument("--weight", type=float, default=1.0, help="A* heuristic weight, > 1 trades optimality for speed")
+    parser.add_argument("--tt-size", type=int, default=1 << 20, help="IDA* transposition table entries")
+    parser.add_argument("--workers", type=int, default=None, help="processes, defaults to the number of cores")
+    parser.add_argument("--max-seconds", type=float, default=None, help="wall time budget per level")
+    parser.add_argument("--max-memory", type=float, default=None, help="memory budget per level in MB")
+    parser.add_argument("--max-nodes", type=int, default=None, help="expanded states budget per level")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--force", action="store_true", help="search again even where the cache has a result")
+    parser.add_argument("--csv", default=None, help="also write the results table to this file")
+    parser.add_argument("--write", action="store_true", help="append new solutions to <model-dir>/<level>.npy_solution.csv")
+    args = parser.parse_args()
+
+    options = {"algorithm": args.algorithm, "weight": args.weight, "tt_size": args.tt_size,
+               "max_nodes": args.max_nodes, "max_seconds": args.max_seconds}
+    max_memory = None if args.max_memory is None else int(args.max_memory * 1e6)
+    print(f"{'level':<16}{'status':<12}{'length':>8}{'nodes':>12}{'states':>12}{'time (s)':>10}  cached")
+    start_time = time.perf_counter()
+    rows = solve_all(args.level_dir, options, args.workers, max_memory, args.model_dir, args.force, args.write)
+    solved = sum(row["status"] == "solved" for row in rows)
+    errors = sum(row["status"] == "error" for row in rows)
+    print(f"{solved}/{len(rows)} solved in {time.perf_counter() - start_time:.2f}s" + (f", {errors} errors" if errors else ""))
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS + ["actions", "error"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Cost of saving a large dense q table: a full ``np.save`` against an
+incremental ``MappedQTable.checkpoint`` of the rows touched since the last one.
+Both are synced to disk. Rows are written back whole pages at a time, so the
+checkpoint pays off when the dirty rows cover few of the table's pages.
+
+    python -m benchmarks.bench_checkpoint [--states N] [--dirty N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from q_store import MappedQTable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--states", type=int, default=40_000_000)
+    parser.add_argument("--dirty", type=int, default=20_000, help="rows updated between checkpoints")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        path = os.path.join(model_dir, "bench.npy")
+        start = time.perf_counter()
+        mapped = MappedQTable.create(path, (args.states, 7))
+        create = time.perf_counter() - start
+
+        full = incremental = 0.0
+        for _ in range(args.repeat):
+            rows = rng.integers(0, args.states, args.dirty)
+            mapped.table[rows] += 1
+            mapped.mark(rows)
+
+            start = time.perf_counter()
+            with open(os.path.join(model_dir, "full.npy"), 'wb') as f:
+                np.save(f, mapped.table)
+                f.flush()
+                os.fsync(f.fileno())
+            full += time.perf_counter() - start
+
+            start = time.perf_counter()
+            mapped.checkpoint()
+            incremental += time.perf_counter() - start
+
+        print(f"table: {args.states} states, {mapped.table.nbytes / 1e6:.0f} MB, {args.dirty} dirty rows per save")
+        print(f"create:      {create * 1e3:10.1f} ms")
+        print(f"np.save:     {full / args.repeat * 1e3:10.1f} ms")
+        print(f"checkpoint:  {incremental / args.repeat * 1e3:10.1f} ms  ({full / incremental:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
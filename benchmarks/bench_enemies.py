@@ -0,0 +1,119 @@
+"""Cost of the enemies of a Level per tick, by number of enemies.
+
+Builds open 12x12 levels with three gates, a trigger and 1, 10 and 50
+enemies in a temporary directory and times, "before" against "after":
+
+    moves     one tick of enemy moves, ``move_all_enemies`` plus
+              ``move_slow_enemies``: ``Level(enemy_cache=False)``, which moves
+              every enemy by ``Enemy.move`` and rescans the gates around it,
+              against the ``EnemyMoveCache`` lookups
+    did_lose  comparing the player against every enemy, as ``did_lose``
+              used to, against the lookup in the enemy count per cell
+    tick      ``take_action`` in random play, resetting when a game ends,
+              with the old ``did_lose`` against the current one
+
+    python -m benchmarks.bench_enemies [num_enemies ...]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+from gym_envs.direkt.direkt_v0 import Level
+
+SIZE = 12
+
+
+class ScanningLevel(Level):
+
+    # did_lose before the enemy counts per cell
+    def did_lose(self):
+        for enemy in self.fast_enemies:
+            if enemy.location == self.player.location:
+                return True
+
+        for enemy in self.normal_enemies:
+            if enemy.location == self.player.location:
+                return True
+
+        for enemy in self.slow_enemies:
+            if enemy.location == self.player.location:
+                return True
+
+        return False
+
+
+# writes a level with num_enemies enemies, a fifth fast, two fifths normal
+# and the rest slow, on random cells and headings
+def write_crowd(path, num_enemies, seed=0):
+    rng = random.Random(seed)
+    setup = [[1] * SIZE for _ in range(SIZE)]
+    setup[SIZE - 1][SIZE - 1] = 9
+    cells = [(r, c) for r in range(SIZE) for c in range(SIZE) if (r, c) not in ((0, 0), (SIZE - 1, SIZE - 1))]
+    rng.shuffle(cells)
+    enemies = [[r, c, rng.randrange(4)] for r, c in cells[:num_enemies]]
+    fast = num_enemies // 5
+    normal = fast + max(1, 2 * num_enemies // 5)
+    data = {
+        "level_setup": setup,
+        "player": [0, 0],
+        "fast_enemies": enemies[:fast],
+        "normal_enemies": enemies[fast:normal],
+        "slow_enemies": enemies[normal:],
+        "gates": [[3, 3, 0], [6, 6, 1]],
+        "straight_gates": [[8, 2, 0]],
+        "triggers": [[2, 2, 3, 3, 0]],
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def per_call(function, number):
+    return min(timeit.repeat(function, number=number, repeat=7)) / number
+
+
+# seconds per take_action of random play, the same games for every level class
+def per_step(level, steps=20000):
+    rng = random.Random(0)
+    level.reset()
+    start = timeit.default_timer()
+    for _ in range(steps):
+        if level.take_action(rng.choice(level.get_valid_actions())) != 0:
+            level.reset()
+    return (timeit.default_timer() - start) / steps
+
+
+def main(counts):
+    number = 2000
+    print(f"{'enemies':<10}{'':<10}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    with tempfile.TemporaryDirectory() as level_dir:
+        for num_enemies in counts:
+            # LevelTemplate.load joins the sheet to gym_envs/direkt, an absolute path wins
+            sheet = os.path.join(level_dir, f"crowd{num_enemies}.json")
+            write_crowd(sheet, num_enemies)
+            rows = []
+
+            times = []
+            for enemy_cache in (False, True):
+                level = Level(sheet, enemy_cache=enemy_cache)
+
+                def tick():
+                    level.move_all_enemies()
+                    level.move_slow_enemies()
+                times.append(per_call(tick, number))
+            rows.append(("moves", times))
+
+            # at the start no enemy is on the player's cell, the scan looks at all of them
+            levels = [ScanningLevel(sheet), Level(sheet)]
+            rows.append(("did_lose", [per_call(level.did_lose, number * 10) for level in levels]))
+
+            rows.append(("tick", [min(per_step(cls(sheet)) for _ in range(5)) for cls in (ScanningLevel, Level)]))
+
+            for name, (before, after) in rows:
+                print(f"{num_enemies:<10}{name:<10}{before * 1e6:>14.2f}{after * 1e6:>14.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [1, 10, 50])
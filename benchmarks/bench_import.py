@@ -0,0 +1,53 @@
+"""Start-up cost of the modules a solver or trainer process imports.
+
+Every statement runs in a fresh interpreter, --repeat times, and the best wall
+time is reported next to whether pygame ended up imported. "python" is the
+interpreter alone, the floor under every other row.
+
+    python -m benchmarks.bench_import [--repeat N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+STATEMENTS = [
+    ("python", "pass"),
+    ("numpy", "import numpy"),
+    ("gymnasium", "import gymnasium"),
+    ("gym_envs", "import gym_envs"),
+    ("direkt_v0", "import gym_envs.direkt.direkt_v0"),
+    ("make env", "import gymnasium, gym_envs; gymnasium.make('direkt-v0', level='levels/level19.json')"),
+    ("qvalue_learner", "import qvalue_learner"),
+    ("solver", "import solver"),
+    ("pygame", "import pygame"),
+]
+
+
+# best wall time of running statement in a new interpreter, and whether it imported pygame
+def import_time(statement, repeat):
+    code = f"{statement}\nimport sys\nprint('pygame' in sys.modules)"
+    env = {**os.environ, "PYGAME_HIDE_SUPPORT_PROMPT": "1"}
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        best = min(best, time.perf_counter() - start)
+    return best, out.split()[-1] == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'import':<16}{'time (ms)':>10}  pygame")
+    for name, statement in STATEMENTS:
+        best, pygame_loaded = import_time(statement, args.repeat)
+        print(f"{name:<16}{best * 1e3:>10.1f}  {'yes' if pygame_loaded else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Scaling of Runner.train_parallel with the number of worker processes.
+
+Trains a fresh dense q table in a temporary model directory with 1, 2, 4, ...
+workers up to the number of cores and reports episodes per second and the
+speedup over a single worker.
+
+    python -m benchmarks.bench_parallel [--episodes N] [--workers N ...] [level]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from qvalue_learner import Runner
+
+
+def episodes_per_second(level, num_workers, episodes):
+    with tempfile.TemporaryDirectory() as model_dir:
+        runner = Runner(level=level, load=False, model_dir=model_dir)
+        start = time.perf_counter()
+        runner.train_parallel(num_workers, num_episodes=episodes)
+        return episodes / (time.perf_counter() - start)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Runner.train_parallel scaling.")
+    parser.add_argument("level", nargs="?", default="level19")
+    parser.add_argument("--episodes", type=int, default=5000, help="episodes per worker")
+    parser.add_argument("--workers", type=int, nargs="*", default=[n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cores])
+    args = parser.parse_args()
+
+    print(f"{cores} cores")
+    print(f"{'workers':<10}{'episodes/s':>12}{'speedup':>10}")
+    single = None
+    for num_workers in args.workers:
+        rate = episodes_per_second(args.level, num_workers, args.episodes * num_workers)
+        single = single or rate
+        print(f"{num_workers:<10}{rate:>12.1f}{rate / single:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Cost of an rgb_array frame of Direkt_v0 in random play.
+
+    render  Direkt_v0.render, a new frame drawn by raster.Rasterizer
+    batch   Rasterizer.draw_batch of all the frames at once, per frame, into
+            a (T, H, W, 3) buffer that was drawn into before; it writes every
+            frame out to memory, while render reuses one that stays in cache
+
+    python -m benchmarks.bench_render [--frames N] [level ...]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from gym_envs.direkt.direkt_v0 import Direkt_v0
+
+
+# ms per render, the env and the snapshots of the frames
+def ms_per_frame(level, frames):
+    env = Direkt_v0(render_mode="rgb_array", level=f"levels/{level}.json")
+    env.reset()
+    rng = random.Random(0)
+    states = []
+    elapsed = 0.0
+    for _ in range(frames):
+        if env.step(rng.choice(env.get_valid_actions()))[2]:
+            env.reset()
+        start = time.perf_counter()
+        env.render()
+        elapsed += time.perf_counter() - start
+        states.append(env.get_state())
+    return elapsed / frames * 1e3, env, states
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("levels", nargs="*", default=["level4", "level19", "level20"])
+    parser.add_argument("--frames", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'level':<10}{'render (ms)':>13}{'batch (ms)':>12}")
+    for level in args.levels:
+        frame, env, states = ms_per_frame(level, args.frames)
+        out = np.empty((len(states), env.window_size, env.window_size, 3), dtype=np.uint8)
+        env._raster.draw_batch(states, out)
+        start = time.perf_counter()
+        env._raster.draw_batch(states, out)
+        batch = (time.perf_counter() - start) / len(states) * 1e3
+        print(f"{level:<10}{frame:>13.3f}{batch:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Cost of checking many candidate solutions: ``Direkt_v0.step`` through each
+sequence one after the other ("before") against ``replay.replay``, which plays
+them together on a ``DirektVector_v0`` ("after"). The candidates are random
+sequences of 50 actions, most of which lose long before their end.
+
+    python -m benchmarks.bench_replay [--sequences N] [level ...]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from gym_envs.direkt.direkt_v0 import Direkt_v0
+from replay import replay
+
+
+def step_through(level, sequences):
+    env = Direkt_v0(level=f"levels/{level}.json")
+    for actions in sequences:
+        env.reset()
+        for action in actions:
+            if env.step(action)[2]:
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("levels", nargs="*", default=["level4", "level19", "level20"])
+    parser.add_argument("--sequences", type=int, default=5000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'level':<10}{'before (s)':>12}{'after (s)':>12}{'speedup':>10}")
+    for level in args.levels:
+        sequences = rng.integers(0, 7, size=(args.sequences, 50)).tolist()
+        start = time.perf_counter()
+        step_through(level, sequences)
+        before = time.perf_counter() - start
+        start = time.perf_counter()
+        replay(level, sequences)
+        after = time.perf_counter() - start
+        print(f"{level:<10}{before:>12.3f}{after:>12.3f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
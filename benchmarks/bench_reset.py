@@ -0,0 +1,31 @@
+"""Compares the cost of starting a new episode before and after level templates.
+
+"before" re-reads and re-parses the level file and rebuilds every object, which
+is what ``Level.reset()`` used to do. "after" is the in-memory restore.
+
+    python -m benchmarks.bench_reset [level ...]
+"""
+import sys
+import timeit
+
+from gym_envs.direkt.direkt_v0 import Level, LevelTemplate
+
+
+def reparse(level_sheet):
+    LevelTemplate._cache.clear()
+    return Level(level_sheet)
+
+
+def main(levels):
+    number = 2000
+    print(f"{'level':<10}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name in levels:
+        sheet = f"levels/{name}.json"
+        level = Level(sheet)
+        before = min(timeit.repeat(lambda: reparse(sheet), number=number, repeat=3)) / number
+        after = min(timeit.repeat(level.reset, number=number, repeat=3)) / number
+        print(f"{name:<10}{before * 1e6:>14.2f}{after * 1e6:>14.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or ["level1", "level4", "level19", "level20"])
@@ -0,0 +1,101 @@
+"""Training throughput of qvalue_learner.Runner.
+
+Trains a fresh dense q table for a fixed number of episodes in a temporary
+model directory, so nothing under models/ is touched, once with the original
+end-of-episode update and once with ``Runner._q_update``, and reports episodes
+per second of both. The original update walks the episode and then the best
+trajectory step by step, scanning the seven q values of each next state and
+reading and writing q one value at a time.
+
+The updates of a third, recording run are then replayed on a zeroed table
+with either update, "before" and "after" per episode. Both apply the steps in
+order, so the replayed tables must come out equal.
+
+    python -m benchmarks.bench_train [--episodes N] [level ...]
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from qvalue_learner import Runner
+
+
+class RecordingRunner(Runner):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.updates = []
+
+    # the episode arrays are views of a buffer the next episode overwrites
+    def _q_update(self, trajectories, gamma):
+        self.updates.append([(tuple(a.copy() for a in t), reward, alpha) for t, reward, alpha in trajectories])
+        super()._q_update(trajectories, gamma)
+
+
+class OriginalRunner(Runner):
+
+    # the update train made before _q_update, with the scan of the seven q
+    # values _get_best_action_from did then
+    def _q_update(self, trajectories, gamma):
+        for (states, actions, next_states), reward, alpha in trajectories:
+            for s, a, ns in zip(states.tolist(), actions.tolist(), next_states.tolist()):
+                best_score = None
+                for action in range(7):
+                    action_score = self._q_table(ns, action)
+                    if best_score == None or action_score > best_score:
+                        best_score = action_score
+                old_q_value = self._q_table(s, a)
+                updated_q_value = old_q_value + alpha * (reward + gamma * best_score - old_q_value)
+                self._q_table_update(s, a, updated_q_value)
+
+
+# episodes per second of training a fresh table, and the runner
+def train_rate(runner_class, level, episodes):
+    with tempfile.TemporaryDirectory() as model_dir:
+        np.random.seed(0)
+        runner = runner_class(level=level, load=False, model_dir=model_dir)
+        start = time.perf_counter()
+        runner.train(num_episodes=episodes)
+        rate = episodes / (time.perf_counter() - start)
+        runner.q_table = np.array(runner.q_table)
+        runner.mapped = None
+    return rate, runner
+
+
+# seconds per episode of replaying updates with runner_class._q_update on a zeroed table
+def replay(runner, runner_class, updates, gamma):
+    runner.q_table = np.zeros_like(runner.q_table)
+    start = time.perf_counter()
+    for trajectories in updates:
+        runner_class._q_update(runner, trajectories, gamma)
+    return (time.perf_counter() - start) / len(updates), runner.q_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runner.train episodes per second.")
+    parser.add_argument("levels", nargs="*", default=["level19", "level20"])
+    parser.add_argument("--episodes", type=int, default=3000)
+    args = parser.parse_args()
+    gamma = .95
+
+    print(f"{'level':<10}{'steps/episode':>15}{'episodes/s before':>19}{'after':>8}"
+          f"{'update before (us)':>20}{'after':>8}{'speedup':>9}  equal")
+    for level in args.levels:
+        original_rate, _ = train_rate(OriginalRunner, level, args.episodes)
+        rate, _ = train_rate(Runner, level, args.episodes)
+        _, runner = train_rate(RecordingRunner, level, args.episodes)
+
+        updates = runner.updates
+        steps = sum(len(u[0][0][0]) for u in updates) / len(updates)
+        before, original_table = replay(runner, OriginalRunner, updates, gamma)
+        after, table = replay(runner, Runner, updates, gamma)
+        equal = np.array_equal(original_table, table)
+
+        print(f"{level:<10}{steps:>15.1f}{original_rate:>19.1f}{rate:>8.1f}"
+              f"{before * 1e6:>20.1f}{after * 1e6:>8.1f}{before / after:>8.1f}x  {'yes' if equal else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Env steps/sec of Direkt_v0 against DirektVector_v0 on uniformly random actions.
+
+"vector" is a full ``step`` (observations, autoreset and final observations),
+"core" only advances the simulation.
+
+    python -m benchmarks.bench_vector [--num-envs N] [level ...]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from gym_envs.direkt.direkt_v0 import Direkt_v0
+from gym_envs.direkt.direkt_vector import DirektVector_v0
+
+
+def single_steps_per_sec(level_sheet, engine, steps, rng):
+    env = Direkt_v0(level=level_sheet, engine=engine)
+    env.reset()
+    actions = rng.integers(0, 7, size=steps).tolist()
+    start = time.perf_counter()
+    for action in actions:
+        _, _, terminated, _, _ = env.step(action)
+        if terminated:
+            env.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def vector_steps_per_sec(level_sheet, num_envs, steps, rng, core=False):
+    env = DirektVector_v0(num_envs, level=level_sheet, max_episode_steps=100, copy=False)
+    env.reset()
+    actions = rng.integers(0, 7, size=(steps, num_envs))
+    step = env._tick if core else env.step
+    start = time.perf_counter()
+    for batch in actions:
+        step(batch)
+    return steps * num_envs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("levels", nargs="*", default=["level1", "level4", "level19", "level20"])
+    parser.add_argument("--num-envs", type=int, default=4096)
+    parser.add_argument("--steps", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'level':<10}{'object':>12}{'array':>12}{'vector':>14}{'core':>14}{'speedup':>10}")
+    for name in args.levels:
+        sheet = f"levels/{name}.json"
+        obj = single_steps_per_sec(sheet, "object", args.steps, rng)
+        arr = single_steps_per_sec(sheet, "array", args.steps, rng)
+        vec = vector_steps_per_sec(sheet, args.num_envs, max(1, args.steps // 100), rng)
+        core = vector_steps_per_sec(sheet, args.num_envs, max(1, args.steps // 100), rng, core=True)
+        print(f"{name:<10}{obj:>12.0f}{arr:>12.0f}{vec:>14.0f}{core:>14.0f}{vec / obj:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Benchmark suite of the simulator, the learner and the solver, with
+regression tracking.
+
+``run`` times, on every shipped level and on synthetic 12x12 levels crowded
+with 10 and 50 enemies (see bench_enemies.write_crowd):
+
+    reset           Level.reset
+    step_random     Direkt_v0.step on a fixed stream of random actions,
+                    invalid ones included, resetting when a game ends
+    step_scripted   Direkt_v0.step replaying a fixed script: the level's
+                    solution if the solver finds one within a small budget,
+                    otherwise a cycle through all seven actions
+    getobs_<mode>   Direkt_v0._getobs for each obs_mode the level fits
+    render          Direkt_v0.render in rgb_array mode
+    solve           solver.solve with A*, levels solved within the budget
+    train           Runner.train episodes per second, shipped levels only
+
+and writes them with the machine's metadata to a JSON file. ``compare``
+fails when a metric of a run is worse than in a stored baseline by more than
+a relative threshold; metrics missing from either file are not compared.
+
+    python -m benchmarks.suite run [--out benchmark.json] [--quick] [level ...]
+    python -m benchmarks.suite compare baseline.json benchmark.json [--threshold 0.15]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import timeit
+from datetime import datetime
+
+import gymnasium
+import numpy as np
+
+from benchmarks.bench_enemies import write_crowd
+from gym_envs.direkt.direkt_v0 import Direkt_v0, Level
+from qvalue_learner import Runner
+from solver import solve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+LEVEL_DIR = os.path.join(ROOT, "gym_envs", "direkt", "levels")
+SYNTHETIC = [10, 50]
+OBS_MODES = ["dict", "state_id", "vector"]
+# metric -> (unit, which way is better)
+METRICS = {
+    "reset": ("us", "lower"),
+    "step_random": ("us", "lower"),
+    "step_scripted": ("us", "lower"),
+    "getobs_dict": ("us", "lower"),
+    "getobs_state_id": ("us", "lower"),
+    "getobs_vector": ("us", "lower"),
+    "render": ("us", "lower"),
+    "solve": ("ms", "lower"),
+    "train": ("episodes/s", "higher"),
+}
+
+
+def machine_metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "gymnasium": gymnasium.__version__,
+        "commit": commit,
+    }
+
+
+# best time per call in microseconds, of repeats that each call function
+# for at least min_time seconds
+def per_call(function, min_time, repeat):
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(number=number, repeat=repeat)) / number * 1e6
+
+
+# best time per step in microseconds of playing actions, resetting when a game ends
+def per_step(env, actions, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        env.reset()
+        start = time.perf_counter()
+        for action in actions:
+            if env.step(action)[2]:
+                env.reset()
+        best = min(best, time.perf_counter() - start)
+    return best / len(actions) * 1e6
+
+
+def bench_level(name, sheet, quick, train):
+    min_time = .02 if quick else .2
+    repeat = 3 if quick else 5
+    steps = 2000 if quick else 20000
+    results = {}
+
+    level = Level(sheet)
+    results["reset"] = per_call(level.reset, min_time, repeat)
+
+    # the vector observation fits every level, the dict one only 20 enemies
+    env = Direkt_v0(level=sheet, obs_mode="vector")
+    rng = np.random.default_rng(0)
+    results["step_random"] = per_step(env, rng.integers(0, 7, steps).tolist(), repeat)
+
+    start = time.perf_counter()
+    solution = solve(sheet, algorithm="astar", max_nodes=20000)
+    solve_time = (time.perf_counter() - start) * 1e3
+    script = solution.actions if solution.actions else list(range(7))
+    results["step_scripted"] = per_step(env, (script * (steps // len(script) + 1))[:steps], repeat)
+    if solution.actions:
+        results["solve"] = solve_time
+
+    # observe a state a few random moves into the game
+    play = random.Random(0)
+    for obs_mode in OBS_MODES:
+        try:
+            env = Direkt_v0(level=sheet, obs_mode=obs_mode)
+            env.reset()
+            for _ in range(5):
+                env.step(play.choice(env.get_valid_actions()))
+        except (ValueError, IndexError):
+            continue
+        results[f"getobs_{obs_mode}"] = per_call(env._getobs, min_time, repeat)
+
+    env = Direkt_v0(render_mode="rgb_array", level=sheet, obs_mode="vector")
+    env.reset()
+    results["render"] = per_call(env.render, min_time, repeat)
+
+    if train:
+        episodes = 200 if quick else 2000
+        with tempfile.TemporaryDirectory() as model_dir:
+            np.random.seed(0)
+            runner = Runner(level=name, load=False, model_dir=model_dir)
+            start = time.perf_counter()
+            runner.train(num_episodes=episodes)
+            results["train"] = episodes / (time.perf_counter() - start)
+    return results
+
+
+def run(levels, out, quick):
+    metrics = {}
+    with tempfile.TemporaryDirectory() as level_dir:
+        sheets = [(name, f"levels/{name}.json", True) for name in levels]
+        for num_enemies in SYNTHETIC:
+            # LevelTemplate.load joins the sheet to gym_envs/direkt, an absolute path wins
+            sheet = os.path.join(level_dir, f"crowd{num_enemies}.json")
+            write_crowd(sheet, num_enemies)
+            sheets.append((f"crowd{num_enemies}", sheet, False))
+
+        for name, sheet, train in sheets:
+            results = bench_level(name, sheet, quick, train)
+            for metric, value in results.items():
+                unit, better = METRICS[metric]
+                metrics[f"{name}/{metric}"] = {"value": value, "unit": unit, "better": better}
+                print(f"{name + '/' + metric:<32}{value:>14.2f} {unit}")
+
+    with open(out, 'w') as f:
+        json.dump({"machine": machine_metadata(), "quick": quick, "metrics": metrics}, f, indent=1)
+    print(f"results: {out}")
+
+
+# Prints every metric both files have and returns the names of those that got
+# worse by more than threshold, relative to the baseline.
+def compare(baseline, current, threshold):
+    with open(baseline) as f:
+        base = json.load(f)
+    with open(current) as f:
+        cur = json.load(f)
+    if base["machine"]["host"] != cur["machine"]["host"] or base.get("quick") != cur.get("quick"):
+        print("warning: the runs were not made on the same machine with the same settings")
+
+    regressions = []
+    print(f"{'metric':<32}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, metric in base["metrics"].items():
+        if name not in cur["metrics"]:
+            continue
+        old = metric["value"]
+        new = cur["metrics"][name]["value"]
+        # positive change is worse
+        change = (new - old) / old if metric["better"] == "lower" else (old - new) / old
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32}{old:>12.2f}{new:>12.2f}{change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the suite")
+    run_parser.add_argument("levels", nargs="*", help="shipped levels, defaults to every file in levels/")
+    run_parser.add_argument("--out", default="benchmark.json")
+    run_parser.add_argument("--quick", action="store_true", help="fewer repetitions, for a smoke test")
+    compare_parser = commands.add_parser("compare", help="compare a run against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=.15, help="relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        levels = args.levels or sorted(os.path.splitext(f)[0] for f in os.listdir(LEVEL_DIR) if f.endswith(".json"))
+        run(levels, args.out, args.quick)
+    else:
+        regressions = compare(args.baseline, args.current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+            raise SystemExit(1)
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
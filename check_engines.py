@@ -0,0 +1,242 @@
+"""Differential check between the object and the array simulation engines.
+
+Replays random action sequences against ``Level`` with the reference
+``Enemy.move`` rules and the original per-enemy lose check and, side by
+side, each of ``ArrayLevel``, ``Level`` with its ``EnemyMoveCache`` and
+``Level`` with a tiny LRU cache. Stops at the first tick where they disagree
+on the valid actions, the action result, the resulting board or their
+``get_state`` snapshots, which are also restored into both engines now and
+then. ``--vector`` additionally steps ``DirektVector_v0`` against one
+``Direkt_v0`` per sub-environment. No shipped level has triggers, so every
+engine also plays scripted moves out of the trigger cells of a small built-in
+level, see check_triggers. Last, ``Direkt_v0`` on either engine must take
+actions outside 0-6 like invalid ones, see check_invalid_actions.
+
+    python check_engines.py [--episodes N] [--seed S] [--vector] [level ...]
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from gym_envs.direkt.direkt_v0 import Direkt_v0, Level, LevelTemplate
+from gym_envs.direkt.array_level import ArrayLevel, EnemyMoveCache, LevelArrays
+from gym_envs.direkt.direkt_vector import DirektVector_v0
+
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gym_envs/direkt/levels")
+
+
+def board(level):
+    return (
+        level.get_player_location(),
+        level.game_tick,
+        level.get_gate_directions(),
+        [level.get_enemy_states(kind) for kind in ("fast", "normal", "slow")],
+    )
+
+
+class ReferenceLevel(Level):
+
+    # the original scan over every enemy, so a wrong count in Level's
+    # per-cell enemy occupancy shows up as a mismatch
+    def did_lose(self):
+        location = self.player.location
+        return any(enemy.location == location for enemy in self.fast_enemies + self.normal_enemies + self.slow_enemies)
+
+
+# the engines checked against ReferenceLevel with the reference Enemy.move rules
+CANDIDATES = {
+    "array": ArrayLevel,
+    "cached": Level,
+    # a tiny least recently used cache that keeps evicting
+    "lru": lambda sheet: Level(sheet, enemy_cache=EnemyMoveCache(LevelArrays.load(LevelTemplate.load(sheet)), max_full=0, max_entries=16)),
+}
+
+
+# returns None if both engines agree, otherwise a description of the first mismatch
+def compare(level_sheet, make_candidate, episodes, max_steps, rng):
+    reference = ReferenceLevel(level_sheet, enemy_cache=False)
+    candidate = make_candidate(level_sheet)
+    for episode in range(episodes):
+        reference.reset()
+        candidate.reset()
+        actions = []
+        saved = None
+        for _ in range(max_steps):
+            # snapshots must agree and restore in either engine
+            if reference.get_state() != candidate.get_state():
+                return f"episode {episode} after {actions}: state {reference.get_state()} != {candidate.get_state()}"
+            if saved is None or rng.random() < .1:
+                saved = (reference.get_state(), len(actions))
+            elif rng.random() < .05:
+                reference.set_state(saved[0])
+                candidate.set_state(saved[0])
+                actions.append(f"restore@{saved[1]}")
+
+            valid = reference.get_valid_actions()
+            if valid != candidate.get_valid_actions():
+                return f"episode {episode} after {actions}: valid actions {valid} != {candidate.get_valid_actions()}"
+            if np.flatnonzero(candidate.get_action_mask()).tolist() != sorted(valid):
+                return f"episode {episode} after {actions}: action mask {candidate.get_action_mask()} != valid actions {valid}"
+
+            action = rng.choice(valid)
+            actions.append(action)
+            expected = reference.take_action(action)
+            got = candidate.take_action(action)
+            if expected != got or board(reference) != board(candidate):
+                return f"episode {episode} after {actions}: {expected} {board(reference)} != {got} {board(candidate)}"
+            if expected != 0:
+                break
+    return None
+
+
+# A board without enemies whose center cells carry triggers of the gate in
+# the top right corner: two on (1, 1), of which the later one, exiting south,
+# replaces the first, and one on (1, 2) exiting west, whose reverse is east.
+TRIGGER_LEVEL = {
+    "level_setup": [[1, 1, 1, 1], [1, 1, 1, 1], [1, 1, 1, 9]],
+    "player": [0, 0],
+    "gates": [[0, 3, 0]],
+    "triggers": [[1, 1, 0, 3, 0], [1, 1, 0, 3, 1], [1, 2, 0, 3, 2]],
+}
+# (row, col, direction the player faces and moves, times the gate turns)
+TRIGGER_MOVES = [(1, 1, 0, 0), (1, 1, 1, 1), (1, 1, 2, 0), (1, 1, 3, 3),
+                 (1, 2, 0, 3), (1, 2, 1, 0), (1, 2, 2, 1), (1, 2, 3, 0)]
+
+
+# moves a player facing each way out of the trigger cells of TRIGGER_LEVEL in
+# every engine, returns None if the gate turned as expected, otherwise the mismatch
+def check_triggers():
+    with tempfile.TemporaryDirectory() as level_dir:
+        # LevelTemplate.load joins the sheet to gym_envs/direkt, an absolute path wins
+        sheet = os.path.join(level_dir, "triggers.json")
+        with open(sheet, 'w') as f:
+            json.dump(TRIGGER_LEVEL, f)
+        reference = ReferenceLevel(sheet, enemy_cache=False)
+        cell_index = reference._cell_index
+        cells = reference.location_objects
+        states = [(cell_index[cells[r][c]], d, 0, (0,), (), ()) for r, c, d, _ in TRIGGER_MOVES]
+        expected = [times for _, _, _, times in TRIGGER_MOVES]
+
+        engines = {"reference": reference, "cached": Level(sheet), "array": ArrayLevel(sheet)}
+        for name, level in engines.items():
+            for state, (r, c, d, _), times in zip(states, TRIGGER_MOVES, expected):
+                level.set_state(state)
+                level.take_action(d)
+                if level.get_state()[3] != (times,):
+                    return f"{name}: leaving {(r, c)} facing {d} turned the gate to {level.get_state()[3]}, expected {(times,)}"
+
+        vector = DirektVector_v0(len(states), level=sheet)
+        vector.set_states(states)
+        vector.take_actions([d for _, _, d, _ in TRIGGER_MOVES])
+        got = [state[3][0] for state in vector.get_states()]
+        if got != expected:
+            return f"vector: gates turned to {got}, expected {expected}"
+    return None
+
+
+# steps Direkt_v0 with actions outside 0-6 from a few random states of every
+# engine, returns None if each only cost the step, otherwise the mismatch
+def check_invalid_actions(level_sheet, rng):
+    for engine in ("object", "array"):
+        env = Direkt_v0(level=level_sheet, engine=engine)
+        env.reset()
+        for _ in range(20):
+            for action in (-1, -7, 7, 100):
+                state = env.get_state()
+                _, reward, terminated, truncated, _ = env.step(action)
+                if (reward, terminated, truncated) != (-1, False, False) or env.get_state() != state:
+                    return f"{engine}: action {action} gave {(reward, terminated, truncated)}"
+            if env.step(rng.choice(env.get_valid_actions()))[2]:
+                env.reset()
+    return None
+
+
+def flatten(obs):
+    return np.concatenate([obs["player"], [obs["gates"]["num"]], obs["gates"]["rotation"], [obs["enemies"]["num"]], obs["enemies"]["location"], obs["enemies"]["rotation"]])
+
+
+# steps a vector env and one Direkt_v0 per sub-environment with the same
+# uniformly random (possibly invalid) actions
+def compare_vector(level_sheet, num_envs, steps, max_steps, rng):
+    vector = DirektVector_v0(num_envs, level=level_sheet, max_episode_steps=max_steps)
+    envs = [Direkt_v0(level=level_sheet) for _ in range(num_envs)]
+    vector.reset()
+    counts = [0] * num_envs
+    for env in envs:
+        env.reset()
+
+    for step in range(steps):
+        actions = rng.integers(0, 7, size=num_envs)
+        obs, rewards, terminated, truncated, info = vector.step(actions)
+        for i, env in enumerate(envs):
+            o, r, term, _, _ = env.step(int(actions[i]))
+            counts[i] += 1
+            trunc = not term and counts[i] >= max_steps
+            if (r, term, trunc) != (rewards[i], terminated[i], truncated[i]):
+                return f"step {step} env {i}: {(r, term, trunc)} != {(rewards[i], terminated[i], truncated[i])}"
+            if term or trunc:
+                if not np.array_equal(flatten(o), flatten(info["final_observation"][i])):
+                    return f"step {step} env {i}: final observation differs"
+                o, _ = env.reset()
+                counts[i] = 0
+            if not np.array_equal(flatten(o), flatten({k: _row(v, i) for k, v in obs.items()})):
+                return f"step {step} env {i}: observation differs"
+        states = vector.get_states()
+        if states != [env.get_state() for env in envs]:
+            return f"step {step}: snapshots differ"
+        if not np.array_equal(vector.get_action_masks(), [env.get_action_mask() for env in envs]):
+            return f"step {step}: action masks differ"
+        # restoring shuffled snapshots must give the same observations
+        if step % 50 == 0:
+            order = rng.permutation(num_envs)
+            obs = vector.set_states([states[i] for i in order])
+            envs = [envs[i] for i in order]
+            counts = [0] * num_envs
+            for i, env in enumerate(envs):
+                if not np.array_equal(flatten(env._getobs()), flatten({k: _row(v, i) for k, v in obs.items()})):
+                    return f"step {step} env {i}: observation after set_states differs"
+    return None
+
+
+def _row(value, i):
+    if isinstance(value, dict):
+        return {k: _row(v, i) for k, v in value.items()}
+    return value[i]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("levels", nargs="*", help="level names, defaults to every file in levels/")
+    parser.add_argument("--episodes", type=int, default=2000)
+    parser.add_argument("--max-steps", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--vector", action="store_true", help="also check DirektVector_v0")
+    parser.add_argument("--num-envs", type=int, default=64)
+    args = parser.parse_args()
+
+    levels = args.levels or sorted(os.path.splitext(os.path.basename(p))[0] for p in glob.glob(os.path.join(LEVEL_DIR, "*.json")))
+    mismatch = check_triggers()
+    print(f"triggers: {'ok' if mismatch is None else mismatch}")
+    failed = mismatch is not None
+    for name in levels:
+        for engine, make_candidate in CANDIDATES.items():
+            mismatch = compare(f"levels/{name}.json", make_candidate, args.episodes, args.max_steps, random.Random(args.seed))
+            print(f"{name} ({engine}): {'ok' if mismatch is None else mismatch}")
+            failed = failed or mismatch is not None
+        mismatch = check_invalid_actions(f"levels/{name}.json", random.Random(args.seed))
+        print(f"{name} (invalid actions): {'ok' if mismatch is None else mismatch}")
+        failed = failed or mismatch is not None
+        if args.vector:
+            mismatch = compare_vector(f"levels/{name}.json", args.num_envs, args.episodes, args.max_steps, np.random.default_rng(args.seed))
+            print(f"{name} (vector): {'ok' if mismatch is None else mismatch}")
+            failed = failed or mismatch is not None
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
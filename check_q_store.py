@@ -0,0 +1,80 @@
+"""Checks of the q_store.SparseQTable backend.
+
+Fills sparse tables with random updates past their ``max_bytes`` cap and
+checks that their arrays never outgrow it, that the states a batch of
+updates keeps read back what it wrote to them and that tables without a cap
+read exactly like a dense array given the same updates.
+
+    python check_q_store.py [--seed S]
+"""
+import argparse
+
+import numpy as np
+
+from q_store import SparseQTable
+
+MAX_BYTES = [200, 20_000, 1_000_000, 10_000_000]
+
+
+# returns None if a capped table stays under max_bytes, otherwise the overshoot
+def check_cap(max_bytes, rng):
+    table = SparseQTable(max_bytes=max_bytes)
+    if table.nbytes > max_bytes:
+        return f"max_bytes={max_bytes}: {table.nbytes} bytes when empty"
+    # many more distinct states than fit, in batches of varied size
+    for _ in range(40):
+        states = rng.integers(0, 1 << 40, rng.integers(1, 4 * table.max_states + 2))
+        actions = rng.integers(0, 7, len(states))
+        values = rng.random(len(states), dtype=np.float32)
+        table[states, actions] = values
+        if table.nbytes > max_bytes:
+            return f"max_bytes={max_bytes}: {table.nbytes} bytes holding {len(table)} states"
+
+        # the states of the batch that were kept read its last write to them
+        written = dict(zip(zip(states.tolist(), actions.tolist()), values.tolist()))
+        pairs = np.array(list(written), dtype=np.int64).reshape(-1, 2)
+        kept = table._rows(pairs[:, 0]) >= 0
+        got = table[pairs[kept, 0], pairs[kept, 1]]
+        expected = np.array(list(written.values()), dtype=np.float32)[kept]
+        if not np.array_equal(got, expected):
+            return f"max_bytes={max_bytes}: {np.count_nonzero(got != expected)} kept values differ from what was written"
+    if table.evictions == 0:
+        return f"max_bytes={max_bytes}: filled without evicting"
+    return None
+
+
+# returns None if an uncapped table reads like a dense array after the same updates
+def check_dense(rng):
+    num_states = 5000
+    dense = np.zeros((num_states, 7), dtype=np.float32)
+    table = SparseQTable()
+    for _ in range(200):
+        states = rng.integers(0, num_states, rng.integers(1, 100))
+        actions = rng.integers(0, 7, len(states))
+        values = rng.random(len(states), dtype=np.float32)
+        # with repeated pairs the last write wins in both
+        dense[states, actions] = values
+        table[states, actions] = values
+    if not np.array_equal(table[np.arange(num_states)], dense):
+        return "rows differ from the dense table"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failed = False
+    for max_bytes in MAX_BYTES:
+        mismatch = check_cap(max_bytes, np.random.default_rng(args.seed))
+        print(f"cap {max_bytes}: {'ok' if mismatch is None else mismatch}")
+        failed = failed or mismatch is not None
+    mismatch = check_dense(np.random.default_rng(args.seed))
+    print(f"dense: {'ok' if mismatch is None else mismatch}")
+    failed = failed or mismatch is not None
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
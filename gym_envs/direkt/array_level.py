@@ -0,0 +1,474 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from gym_envs.direkt.direkt_v0 import ACTION_MASKS, VALID_ACTIONS, LevelTemplate
+
+
+# gates are stored by their rotation, which is directions_blocked[0]
+def gate_blocked_dirs(rotation, is_straight):
+    if is_straight:
+        return [rotation, (rotation + 2) % 4]
+    return [rotation, (rotation + 1) % 4]
+
+
+# GATE_MASK[is_straight, rotation] -> 4-bit mask of the directions the gate blocks
+GATE_MASK = np.zeros((2, 4), dtype=np.uint8)
+for _straight in range(2):
+    for _rot in range(4):
+        for _d in gate_blocked_dirs(_rot, _straight):
+            GATE_MASK[_straight, _rot] |= 1 << _d
+
+# ENEMY_TURN[mask, direction] -> direction an enemy leaves in, or -1 if it is boxed in.
+# Enemies try forward, left, right and finally backwards.
+ENEMY_TURN = np.full((16, 4), -1, dtype=np.int8)
+for _mask in range(16):
+    for _d in range(4):
+        for _nd in (_d, (_d + 3) % 4, (_d + 1) % 4, (_d + 2) % 4):
+            if not _mask & (1 << _nd):
+                ENEMY_TURN[_mask, _d] = _nd
+                break
+
+
+class LevelArrays:
+    """NumPy tables describing a level, compiled once from a ``LevelTemplate``.
+
+    Walkable cells are numbered row-major. ``neighbor[cell, dir]`` is the cell
+    reached by leaving ``cell`` in ``dir`` (-1 if there is none). Gates are
+    numbered like ``Level.gates`` (normal gates first, then straight ones) and
+    enemies like ``fast + normal + slow``.
+    """
+
+    def __init__(self, template):
+        self.rows = template.rows
+        self.cols = template.cols
+
+        self.cell_index = np.full((self.rows, self.cols), -1, dtype=np.int32)
+        cells = [(r, c) for r in range(self.rows) for c in range(self.cols) if template.locations[r][c] in (1, 9)]
+        for i, (r, c) in enumerate(cells):
+            self.cell_index[r, c] = i
+        self.num_cells = len(cells)
+        self.cell_rc = np.array(cells, dtype=np.int32).reshape(-1, 2)
+        self.is_goal = np.array([template.locations[r][c] == 9 for r, c in cells], dtype=bool)
+
+        offsets = ((0, 1), (1, 0), (0, -1), (-1, 0))
+        self.neighbor = np.full((self.num_cells, 4), -1, dtype=np.int32)
+        for i, (r, c) in enumerate(cells):
+            for d, (dr, dc) in enumerate(offsets):
+                nr, nc = r + dr, c + dc
+                if 0 <= nr < self.rows and 0 <= nc < self.cols:
+                    self.neighbor[i, d] = self.cell_index[nr, nc]
+
+        # directions that are always closed because there is no cell there
+        self.wall_mask = np.zeros(self.num_cells, dtype=np.uint8)
+        for d in range(4):
+            self.wall_mask |= np.where(self.neighbor[:, d] < 0, 1 << d, 0).astype(np.uint8)
+
+        gates = [(r, c, o, False) for r, c, o in template.gates] + [(r, c, o, True) for r, c, o in template.straight_gates]
+        self.num_gates = len(gates)
+        self.gate_cell = np.array([self.cell_index[r, c] for r, c, _, _ in gates], dtype=np.int32)
+        self.gate_straight = np.array([s for _, _, _, s in gates], dtype=np.int8)
+        self.initial_gate_rot = np.array([o for _, _, o, _ in gates], dtype=np.int8)
+        self.cell_gate = np.full(self.num_cells, -1, dtype=np.int32)
+        self.cell_gate[self.gate_cell] = np.arange(self.num_gates, dtype=np.int32)
+
+        # cells whose exit mask depends on a gate: its own cell and the four around it
+        self.gate_affected = []
+        for cell in self.gate_cell.tolist():
+            affected = [cell] + [n for n in self.neighbor[cell].tolist() if n >= 0]
+            self.gate_affected.append(affected)
+
+        # trigger_gate[cell, dir] / trigger_times[cell, dir]: leaving cell in dir rotates a gate
+        self.trigger_gate = np.full((self.num_cells, 4), -1, dtype=np.int32)
+        self.trigger_times = np.zeros((self.num_cells, 4), dtype=np.int8)
+        for r, c, gr, gc, exit_dir in template.triggers:
+            cell = self.cell_index[r, c]
+            gate = self.cell_gate[self.cell_index[gr, gc]]
+            # like Level's exit_trigger_map, a later trigger on a cell replaces the earlier ones
+            self.trigger_gate[cell] = -1
+            self.trigger_times[cell] = 0
+            self.trigger_gate[cell, exit_dir] = gate
+            self.trigger_times[cell, exit_dir] = 1
+            self.trigger_gate[cell, (exit_dir + 2) % 4] = gate
+            self.trigger_times[cell, (exit_dir + 2) % 4] = 3
+
+        enemies = list(template.fast_enemies) + list(template.normal_enemies) + list(template.slow_enemies)
+        self.num_fast = len(template.fast_enemies)
+        self.num_normal = len(template.normal_enemies)
+        self.num_slow = len(template.slow_enemies)
+        self.num_enemies = len(enemies)
+        self.initial_enemy_cell = np.array([self.cell_index[r, c] for r, c, _ in enemies], dtype=np.int32)
+        self.initial_enemy_dir = np.array([d for _, _, d in enemies], dtype=np.int8)
+        self.initial_player_cell = int(self.cell_index[template.player[0], template.player[1]])
+
+        # enemy_next[mask, cell * 4 + direction] -> packed cell * 4 + direction of an
+        # enemy after one move out of a cell with that exit mask (unchanged if boxed in)
+        state = np.arange(self.num_cells * 4)
+        turn = ENEMY_TURN[:, state % 4].astype(np.int64)
+        moved = self.neighbor[state // 4, np.maximum(turn, 0)] * 4 + turn
+        self.enemy_next = np.where(turn >= 0, moved, state)
+
+    @classmethod
+    def load(cls, template):
+        arrays = getattr(template, "_arrays", None)
+        if arrays is None:
+            arrays = cls(template)
+            template._arrays = arrays
+        return arrays
+
+    # 4-bit masks of the directions an agent cannot leave each cell in, given gate rotations
+    def exit_masks(self, gate_rot):
+        return self.batch_exit_masks(np.asarray(gate_rot).reshape(1, -1))[0]
+
+    # exit_masks for a batch of gate rotations, (M, num_gates) -> (M, num_cells)
+    def batch_exit_masks(self, gate_rot):
+        masks = np.tile(self.wall_mask, (len(gate_rot), 1))
+        for g in range(self.num_gates):
+            blocked = GATE_MASK[self.gate_straight[g], gate_rot[:, g]]
+            cell = self.gate_cell[g]
+            masks[:, cell] |= blocked
+            # a gate blocking direction d keeps out anything entering from that side
+            for d in range(4):
+                n = self.neighbor[cell, d]
+                if n >= 0:
+                    masks[:, n] |= ((blocked >> d) & 1) << ((d + 2) % 4)
+        return masks
+
+    # exit masks of every gate configuration, indexed by sum(gate_rot[g] * 4**g).
+    # None when the table would be too large to be worth keeping around.
+    def exit_mask_table(self, max_entries=1 << 22):
+        if 4 ** self.num_gates * self.num_cells > max_entries:
+            return None
+        table = getattr(self, "_exit_mask_table", None)
+        if table is None:
+            # row k holds the base-4 digits of k, lowest gate first
+            configs = (np.arange(4 ** self.num_gates)[:, None] // 4 ** np.arange(self.num_gates)) % 4
+            table = self.batch_exit_masks(configs.astype(np.int8))
+            self._exit_mask_table = table
+        return table
+
+    # the level's EnemyMoveCache, shared by every game of it
+    def enemy_cache(self):
+        cache = getattr(self, "_enemy_cache", None)
+        if cache is None:
+            cache = self._enemy_cache = EnemyMoveCache(self)
+        return cache
+
+
+class EnemyMoveCache:
+    """Where an enemy moves next, by gate configuration and enemy state.
+
+    ``next(config, state)`` takes the gate configuration as
+    ``sum(gate_rot[g] * 4**g)`` and the enemy as ``cell * 4 + direction``
+    and returns the enemy's packed state after one move, unchanged if it is
+    boxed in. Levels with at most ``max_full`` (configuration, state) pairs
+    get every answer precomputed from ``LevelArrays.enemy_next``; larger ones
+    fill a least recently used dict of ``max_entries`` answers on demand.
+    ``hits``/``misses`` count the lookups, a precomputed table never misses.
+    """
+
+    def __init__(self, arrays, max_full=1 << 18, max_entries=1 << 16):
+        self.num_states = arrays.num_cells * 4
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.precomputed = 4 ** arrays.num_gates * self.num_states <= max_full
+        if self.precomputed:
+            state = np.arange(self.num_states)
+            masks = arrays.exit_mask_table()[:, state // 4]
+            self.table = arrays.enemy_next[masks, state].ravel().tolist()
+        else:
+            self._lru = OrderedDict()
+            self._neighbor = arrays.neighbor.tolist()
+            self._wall_mask = arrays.wall_mask.tolist()
+            self._cell_gate = arrays.cell_gate.tolist()
+            self._gate_straight = arrays.gate_straight.tolist()
+            self._gate_mask = GATE_MASK.tolist()
+            self._enemy_turn = ENEMY_TURN.tolist()
+
+    def __len__(self):
+        return len(self.table) if self.precomputed else len(self._lru)
+
+    def next(self, config, state):
+        if self.precomputed:
+            self.hits += 1
+            return self.table[config * self.num_states + state]
+
+        key = (config, state)
+        lru = self._lru
+        moved = lru.get(key)
+        if moved is not None:
+            self.hits += 1
+            lru.move_to_end(key)
+            return moved
+        self.misses += 1
+        moved = self._move(config, state)
+        lru[key] = moved
+        if len(lru) > self.max_entries:
+            lru.popitem(last=False)
+        return moved
+
+    # ArrayLevel._compute_exit_mask and move_enemies with the gate rotations
+    # read off the configuration
+    def _move(self, config, state):
+        cell = state >> 2
+        mask = self._wall_mask[cell]
+        g = self._cell_gate[cell]
+        if g >= 0:
+            mask |= self._gate_mask[self._gate_straight[g]][config // 4 ** g % 4]
+        for d, n in enumerate(self._neighbor[cell]):
+            if n < 0:
+                continue
+            g = self._cell_gate[n]
+            if g >= 0 and self._gate_mask[self._gate_straight[g]][config // 4 ** g % 4] & (1 << ((d + 2) % 4)):
+                mask |= 1 << d
+        nd = self._enemy_turn[mask][state & 3]
+        if nd < 0:
+            return state
+        return self._neighbor[cell][nd] * 4 + nd
+
+
+class ArrayLevel:
+    """Drop-in replacement for ``Level`` that simulates on flat arrays.
+
+    Gate rotations live in a small int array, enemies in cell/direction arrays
+    and every cell carries a 4-bit mask of blocked exits that is patched
+    whenever a gate turns. The rules, including their ordering quirks, are
+    the same as ``Level``'s.
+
+    The tables are NumPy (see ``LevelArrays``), but a single game is stepped on
+    flat int lists because scalar indexing into NumPy costs ~10x more than
+    into a list. ``gate_rot``, ``enemy_cell``, ``enemy_dir`` and ``exit_mask``
+    hand out NumPy copies of the current state.
+    """
+
+    MAX_CACHED_EXIT_MASKS = 4096
+
+    def __init__(self, level_sheet):
+        self.level_sheet = level_sheet
+        self.template = LevelTemplate.load(level_sheet)
+        self.arrays = LevelArrays.load(self.template)
+        a = self.arrays
+        self.num_gates = a.num_gates
+
+        # python mirrors of the tables, scalar indexing on them is much cheaper
+        self._neighbor = a.neighbor.tolist()
+        self._is_goal = a.is_goal.tolist()
+        self._cell_rc = [tuple(rc) for rc in a.cell_rc.tolist()]
+        self._cell_gate = a.cell_gate.tolist()
+        self._has_gate = [16 if g >= 0 else 0 for g in self._cell_gate]
+        self._gate_straight = a.gate_straight.tolist()
+        self._gate_affected = a.gate_affected
+        self._wall_mask = a.wall_mask.tolist()
+        self._gate_mask = GATE_MASK.tolist()
+        self._enemy_turn = ENEMY_TURN.tolist()
+        self._trigger_gate = a.trigger_gate.tolist()
+        self._trigger_times = a.trigger_times.tolist()
+        self._initial_exit_mask = a.exit_masks(a.initial_gate_rot)
+
+        self._fast = range(0, a.num_fast)
+        self._all = range(0, a.num_fast + a.num_normal)
+        self._slow = range(a.num_fast + a.num_normal, a.num_enemies)
+
+        self._initial_gates = a.initial_gate_rot.tolist()
+        self._initial_enemy_cell = a.initial_enemy_cell.tolist()
+        self._initial_enemy_dir = a.initial_enemy_dir.tolist()
+        self._initial_exit_mask = self._initial_exit_mask.tolist()
+        # exit masks by gate rotations, for set_state
+        self._exit_mask_cache = {}
+        self.reset()
+
+    def reset(self):
+        self._gates = list(self._initial_gates)
+        self._enemy_cell = list(self._initial_enemy_cell)
+        self._enemy_dir = list(self._initial_enemy_dir)
+        self._exit_mask = list(self._initial_exit_mask)
+        self.player_cell = self.arrays.initial_player_cell
+        self.player_dir = 0
+        self.game_tick = 0
+
+    # snapshot in the format of Level.get_state
+    def get_state(self):
+        return (self.player_cell, self.player_dir, self.game_tick, tuple(self._gates), tuple(self._enemy_cell), tuple(self._enemy_dir))
+
+    def set_state(self, state):
+        self.player_cell, self.player_dir, self.game_tick, gates, enemy_cell, enemy_dir = state
+        self._gates = list(gates)
+        self._enemy_cell = list(enemy_cell)
+        self._enemy_dir = list(enemy_dir)
+        exit_mask = self._exit_mask_cache.get(gates)
+        if exit_mask is None:
+            # only cells next to a gate have exit masks that depend on the gates
+            exit_mask = list(self._initial_exit_mask)
+            for affected in self._gate_affected:
+                for cell in affected:
+                    exit_mask[cell] = self._compute_exit_mask(cell)
+            if len(self._exit_mask_cache) >= self.MAX_CACHED_EXIT_MASKS:
+                self._exit_mask_cache.clear()
+            self._exit_mask_cache[tuple(gates)] = exit_mask
+        self._exit_mask = list(exit_mask)
+
+    @property
+    def gate_rot(self):
+        return np.array(self._gates, dtype=np.int8)
+
+    @property
+    def enemy_cell(self):
+        return np.array(self._enemy_cell, dtype=np.int32)
+
+    @property
+    def enemy_dir(self):
+        return np.array(self._enemy_dir, dtype=np.int8)
+
+    @property
+    def exit_mask(self):
+        return np.array(self._exit_mask, dtype=np.uint8)
+
+    # -------------------------------
+    # Same interface as Level
+    # -------------------------------
+    def get_valid_actions(self):
+        return list(VALID_ACTIONS[self._exit_mask[self.player_cell] | self._has_gate[self.player_cell]])
+
+    def get_action_mask(self):
+        return ACTION_MASKS[self._exit_mask[self.player_cell] | self._has_gate[self.player_cell]]
+
+    def take_action(self, action):
+        if action in [0,1,2,3]:
+            return self.action_move(action)
+
+        elif action == 4:
+            return self.action_rotate()
+
+        elif action == 6:
+            return self.action_rotate(counter=True)
+
+        else:
+            return self.action_wait()
+
+    def action_move(self, direction):
+        self.game_tick += 1
+
+        triggers = self.move_enemies(self._fast)
+        if self.did_lose():
+            return -1
+        self.execute_triggers(triggers)
+
+        triggers = []
+        if self.player_dir == direction:
+            g = self._trigger_gate[self.player_cell][direction]
+            if g >= 0:
+                triggers.append((g, self._trigger_times[self.player_cell][direction]))
+        self.player_dir = direction
+        self.player_cell = self._neighbor[self.player_cell][direction]
+        if self.did_lose():
+            return -1
+        if self.did_win():
+            return 1
+
+        triggers.extend(self.move_enemies(self._all))
+        if self.did_lose():
+            return -1
+
+        if self.game_tick % 2 == 0:
+            triggers.extend(self.move_enemies(self._slow))
+            if self.did_lose():
+                return -1
+
+        self.execute_triggers(triggers)
+        return 0
+
+    def action_wait(self):
+        self.game_tick += 1
+
+        # like Level.action_wait the fast enemy triggers stay in the list and fire again below
+        triggers = self.move_enemies(self._fast)
+        if self.did_lose():
+            return -1
+        self.execute_triggers(triggers)
+
+        triggers.extend(self.move_enemies(self._all))
+        if self.did_lose():
+            return -1
+
+        if self.game_tick % 2 == 0:
+            triggers.extend(self.move_enemies(self._slow))
+            if self.did_lose():
+                return -1
+
+        self.execute_triggers(triggers)
+        return 0
+
+    def action_rotate(self, counter=False):
+        times = 3
+        if not counter:
+            times = 1
+        self.rotate_gate(self._cell_gate[self.player_cell], times)
+        return 0
+
+    # -------------------------------
+    # Utility functions
+    # -------------------------------
+    def move_enemies(self, enemies):
+        triggers = []
+        cells = self._enemy_cell
+        dirs = self._enemy_dir
+        for i in enemies:
+            cell = cells[i]
+            d = dirs[i]
+            nd = self._enemy_turn[self._exit_mask[cell]][d]
+            if nd < 0:
+                continue
+            # only going forward can trigger a trigger
+            if nd == d:
+                g = self._trigger_gate[cell][d]
+                if g >= 0:
+                    triggers.append((g, self._trigger_times[cell][d]))
+            dirs[i] = nd
+            cells[i] = self._neighbor[cell][nd]
+        return triggers
+
+    def execute_triggers(self, triggers):
+        for gate, times in triggers:
+            self.rotate_gate(gate, times)
+
+    def rotate_gate(self, gate, times):
+        self._gates[gate] = (self._gates[gate] + times) % 4
+        for cell in self._gate_affected[gate]:
+            self._exit_mask[cell] = self._compute_exit_mask(cell)
+
+    def _compute_exit_mask(self, cell):
+        mask = self._wall_mask[cell]
+        g = self._cell_gate[cell]
+        if g >= 0:
+            mask |= self._gate_mask[self._gate_straight[g]][self._gates[g]]
+        for d, n in enumerate(self._neighbor[cell]):
+            if n < 0:
+                continue
+            g = self._cell_gate[n]
+            if g >= 0 and self._gate_mask[self._gate_straight[g]][self._gates[g]] & (1 << ((d + 2) % 4)):
+                mask |= 1 << d
+        return mask
+
+    def did_lose(self):
+        return self.player_cell in self._enemy_cell
+
+    def did_win(self):
+        return self._is_goal[self.player_cell]
+
+    # -------------------------------
+    # Engine independent views, see Level
+    # -------------------------------
+    def get_player_location(self):
+        return self._cell_rc[self.player_cell]
+
+    def get_player_direction(self):
+        return self.player_dir
+
+    def get_gate_directions(self):
+        return [gate_blocked_dirs(rot, straight) for rot, straight in zip(self._gates, self._gate_straight)]
+
+    def get_enemy_states(self, kind):
+        a = self.arrays
+        enemies = {"fast": self._fast, "normal": range(a.num_fast, a.num_fast + a.num_normal), "slow": self._slow}[kind]
+        return [self._cell_rc[self._enemy_cell[i]] + (self._enemy_dir[i],) for i in enemies]
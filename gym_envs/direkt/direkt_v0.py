@@ -2,40 +2,178 @@ import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 import json
-import pygame
 import os
 
+from gym_envs.direkt.profiling import ENV_PHASES, PhaseProfiler
+
+def make_observation_space():
+    return spaces.Dict(
+        {
+            # [row, col] location
+            "player": spaces.Box(0, 10, shape=(2,), dtype=int),
+            "gates": spaces.Dict(
+                {
+                    "num": spaces.Discrete(20),
+                    "rotation": spaces.Box(0,4, shape=(20,), dtype=int)
+                }
+            ),
+            "enemies": spaces.Dict(
+                {
+                    "num": spaces.Discrete(20),
+                    "location": spaces.Box(0, 10, shape=(40,), dtype=int),
+                    "rotation": spaces.Box(0, 4, shape=(20,), dtype=int)
+                }
+            )
+        }
+    )
+
+
+# VALID_ACTIONS[exit_mask | has_gate << 4] -> the actions open to a player on a
+# cell whose exits are blocked by the 4-bit exit_mask, in the order
+# get_valid_actions lists them; ACTION_MASKS is the same as (32, 7) booleans
+VALID_ACTIONS = []
+for _key in range(32):
+    _actions = [d for d in range(4) if not _key & (1 << d)]
+    if _key & 16:
+        _actions += [4, 6]
+    VALID_ACTIONS.append(_actions + [5])
+ACTION_MASKS = np.zeros((32, 7), dtype=bool)
+for _key, _actions in enumerate(VALID_ACTIONS):
+    ACTION_MASKS[_key, _actions] = True
+ACTION_MASKS.flags.writeable = False
+
+
+class StateLayout:
+    """Everything a level's game continues from, as a few small integers.
+
+    The fields are the player position, the player direction (only on levels
+    with triggers, where it decides whether a move fires one), the tick parity
+    (only with slow enemies, which move every other tick), the rotation of
+    every gate and position and direction of every enemy, fast, normal, then
+    slow. ``state_id`` packs them into one int, mixed radix with positions
+    numbered over the walkable cells; ``fill_vector`` writes them to an int8
+    array with positions as row and column.
+    """
+
+    def __init__(self, template):
+        cells = [(r, c) for r, row in enumerate(template.locations) for c, tile in enumerate(row) if tile != 0]
+        self.cell_index = {rc: i for i, rc in enumerate(cells)}
+        self.num_cells = len(cells)
+        self.num_gates = len(template.gates) + len(template.straight_gates)
+        self.num_enemies = len(template.fast_enemies) + len(template.normal_enemies) + len(template.slow_enemies)
+        self.track_direction = len(template.triggers) > 0
+        self.track_parity = len(template.slow_enemies) > 0
+
+        # state id digits, most significant first
+        self.radices = ([self.num_cells] + [4] * self.track_direction + [2] * self.track_parity
+                        + [4] * self.num_gates + [4 * self.num_cells] * self.num_enemies)
+        self.num_states = 1
+        for radix in self.radices:
+            self.num_states *= radix
+
+        # inclusive upper bound of every vector entry
+        self.vector_high = ([template.rows - 1, template.cols - 1] + [3] * self.track_direction + [1] * self.track_parity
+                            + [3] * self.num_gates + [template.rows - 1, template.cols - 1, 3] * self.num_enemies)
+
+    def observation_space(self, obs_mode):
+        if obs_mode == "state_id":
+            if self.num_states >= 2 ** 63:
+                raise ValueError(f"{self.num_states} states do not fit obs_mode='state_id', use 'vector'")
+            return spaces.Discrete(self.num_states)
+        return spaces.Box(0, np.array(self.vector_high, dtype=np.int8), dtype=np.int8)
+
+    def state_id(self, level):
+        cell_index = self.cell_index
+        state = cell_index[tuple(level.get_player_location())]
+        if self.track_direction:
+            state = state * 4 + level.get_player_direction()
+        if self.track_parity:
+            state = state * 2 + level.game_tick % 2
+        for blocked in level.get_gate_directions():
+            state = state * 4 + blocked[0]
+        n = 4 * self.num_cells
+        for kind in ("fast", "normal", "slow"):
+            for r, c, direction in level.get_enemy_states(kind):
+                state = state * n + cell_index[(r, c)] * 4 + direction
+        return state
+
+    def fill_vector(self, level, out):
+        out[0], out[1] = level.get_player_location()
+        i = 2
+        if self.track_direction:
+            out[i] = level.get_player_direction()
+            i += 1
+        if self.track_parity:
+            out[i] = level.game_tick % 2
+            i += 1
+        for blocked in level.get_gate_directions():
+            out[i] = blocked[0]
+            i += 1
+        for kind in ("fast", "normal", "slow"):
+            for r, c, direction in level.get_enemy_states(kind):
+                out[i], out[i + 1], out[i + 2] = r, c, direction
+                i += 3
+        return out
+
+
 class Direkt_v0(gym.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 10}
 
-    def __init__(self, render_mode=None, level=None):
+    # engine="object" simulates on linked Location/Gate/Enemy objects,
+    # engine="array" on the flat tables of array_level.ArrayLevel
+    #
+    # obs_mode="dict" observes make_observation_space(), which only covers
+    # slow and fast enemies. obs_mode="state_id" observes the StateLayout id
+    # of the full state as an int, obs_mode="vector" its fields as an int8
+    # array that is overwritten by the next reset/step, copy it to keep it.
+    #
+    # reset and step return the valid actions as info["action_mask"], seven
+    # read-only booleans. mask_obs=True also observes them, as the dict
+    # {"observation": obs, "action_mask": mask}.
+    #
+    # profile=True times the phases of reset and step, the level's enemy
+    # moves, lose checks and triggers and the observation, with a
+    # profiling.PhaseProfiler kept as self.profiler. reset and step return
+    # its phases, name -> [calls, total ns] since it was created or cleared,
+    # as info["profile"]. Without it the game runs untouched.
+    def __init__(self, render_mode=None, level=None, engine="object", obs_mode="dict", mask_obs=False, profile=False):
         self.level_file = level
-        self.level = Level(level)
-        self.observation_space = spaces.Dict(
-            {
-                # [row, col] location
-                "player": spaces.Box(0, 10, shape=(2,), dtype=int),
-                "gates": spaces.Dict(
-                    {
-                        "num": spaces.Discrete(20),
-                        "rotation": spaces.Box(0,4, shape=(20,), dtype=int)
-                    }
-                ),
-                "enemies": spaces.Dict(
-                    {
-                        "num": spaces.Discrete(20),
-                        "location": spaces.Box(0, 10, shape=(40,), dtype=int),
-                        "rotation": spaces.Box(0, 4, shape=(20,), dtype=int)
-                    }
-                )
-            }
-        )
+        if engine == "object":
+            self.level = Level(level)
+        elif engine == "array":
+            from gym_envs.direkt.array_level import ArrayLevel
+            self.level = ArrayLevel(level)
+        else:
+            raise ValueError(f"unknown engine {engine!r}, expected 'object' or 'array'")
+        self.engine = engine
+        self.obs_mode = obs_mode
+        if obs_mode == "dict":
+            self.observation_space = make_observation_space()
+        elif obs_mode in ("state_id", "vector"):
+            self.layout = StateLayout(self.level.template)
+            self.observation_space = self.layout.observation_space(obs_mode)
+            self._vector = np.zeros(len(self.layout.vector_high), dtype=np.int8)
+        else:
+            raise ValueError(f"unknown obs_mode {obs_mode!r}, expected 'dict', 'state_id' or 'vector'")
+        self.mask_obs = mask_obs
+        if mask_obs:
+            self.observation_space = spaces.Dict({"observation": self.observation_space, "action_mask": spaces.MultiBinary(7)})
         self.action_space = spaces.Discrete(7)
         self.render_mode = render_mode
-        self.window = None
+        # rendering is set up on first use, so headless envs never import pygame
+        self._raster = None
+        self._window = None
         self.size = 512
         self.window_size = 512
-        self.clock = None
+        self._frame = None
+        if render_mode == "rgb_array":
+            self._frame = np.empty((self.window_size, self.window_size, 3), dtype=np.uint8)
+        self.profiler = None
+        if profile:
+            self.profiler = PhaseProfiler()
+            self.profiler.attach_level(self.level)
+            for name in ENV_PHASES:
+                self.profiler.wrap(self, name, f"env.{name}")
     
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
@@ -43,28 +181,47 @@ class Direkt_v0(gym.Env):
         if self.render_mode == "human":
             self._render_frame()
 
-        return self._getobs(), {}
+        mask = self.level.get_action_mask()
+        info = {"action_mask": mask}
+        if self.profiler is not None:
+            info["profile"] = self.profiler.phases
+        return self._getobs(mask), info
+
+    def _getobs(self, mask=None):
+        obs = self._observe()
+        if not self.mask_obs:
+            return obs
+        if mask is None:
+            mask = self.level.get_action_mask()
+        return {"observation": obs, "action_mask": mask}
+
+    def _observe(self):
+        if self.obs_mode == "state_id":
+            return self.layout.state_id(self.level)
+        if self.obs_mode == "vector":
+            return self.layout.fill_vector(self.level, self._vector)
 
-    def _getobs(self):
         gates = [0] * 20
-        for i, g in enumerate(self.level.gates):
-            gates[i] = g.directions_blocked[0]
+        for i, blocked in enumerate(self.level.get_gate_directions()):
+            gates[i] = blocked[0]
         
         e_loc = [0] * 40
         e_rot = [0] * 20
-        for i, e in enumerate(self.level.slow_enemies):
-            e_loc[2*i] = e.location.draw_loc[0]
-            e_loc[2*i+1] = e.location.draw_loc[1]
-            e_rot[i] = e.direction
-        num_slow = len(self.level.slow_enemies)
-        for i, e in enumerate(self.level.fast_enemies):
+        slow_enemies = self.level.get_enemy_states("slow")
+        for i, (r, c, direction) in enumerate(slow_enemies):
+            e_loc[2*i] = r
+            e_loc[2*i+1] = c
+            e_rot[i] = direction
+        num_slow = len(slow_enemies)
+        fast_enemies = self.level.get_enemy_states("fast")
+        for i, (r, c, direction) in enumerate(fast_enemies):
             i_offset = i + num_slow
-            e_loc[2*i_offset] = e.location.draw_loc[0]
-            e_loc[2*i_offset+1] = e.location.draw_loc[1]
-            e_rot[i_offset] = e.direction
+            e_loc[2*i_offset] = r
+            e_loc[2*i_offset+1] = c
+            e_rot[i_offset] = direction
         
         obs = {
-            "player": np.asarray(self.level.player.location.draw_loc),
+            "player": np.asarray(self.level.get_player_location()),
             "gates":
                 {
                     "num": self.level.num_gates,
@@ -72,7 +229,7 @@ class Direkt_v0(gym.Env):
                 },
             "enemies":
                 {
-                    "num": (len(self.level.slow_enemies) + len(self.level.fast_enemies)),
+                    "num": (len(slow_enemies) + len(fast_enemies)),
                     "location": np.asarray(e_loc),
                     "rotation": np.asarray(e_rot)
                 }
@@ -86,11 +243,15 @@ class Direkt_v0(gym.Env):
     def get_valid_actions(self):
         return self.level.get_valid_actions()
 
+    def get_action_mask(self):
+        return self.level.get_action_mask()
+
     def step(self, action):
         terminated = False
         reward = -1
 
-        if action in self.level.get_valid_actions():
+        # an action outside 0-6 only costs the step, like an invalid one
+        if 0 <= action < 7 and self.level.get_action_mask()[action]:
             result = self.level.take_action(action)
             terminated = result != 0
             if result == -1:
@@ -98,175 +259,86 @@ class Direkt_v0(gym.Env):
             elif result == 1:
                 reward = 200
 
-        return self._getobs(), reward, terminated, False, {}
-
+        mask = self.level.get_action_mask()
+        info = {"action_mask": mask}
+        if self.profiler is not None:
+            info["profile"] = self.profiler.phases
+        return self._getobs(mask), reward, terminated, False, info
+
+    # Hashable snapshot of the game, see Level.get_state. Restoring one with
+    # set_state is much cheaper than a reset and a replay of the actions;
+    # set_state returns the observation of the restored state.
+    def get_state(self):
+        return self.level.get_state()
+
+    def set_state(self, state):
+        self.level.set_state(state)
+        return self._getobs()
+
+    # rgb_array frames are drawn by raster.Rasterizer without pygame into one
+    # frame buffer, which the next render overwrites, copy a frame to keep it;
+    # the human window is drawn by window.Window with pygame
     def render(self):
+        if self.render_mode == "rgb_array":
+            if self._raster is None:
+                from gym_envs.direkt.raster import Rasterizer
+                self._raster = Rasterizer(self.level.template, self.window_size)
+            return self._raster.draw(self.level.get_state(), out=self._frame)
         if self.render_mode == "human":
             return self._render_frame()
     
     def _render_frame(self):
-        if self.window is None and self.render_mode == "human":
-            pygame.init()
-            pygame.display.init()
-            self.window = pygame.display.set_mode((self.window_size, self.window_size))
-        if self.clock is None and self.render_mode == "human":
-            self.clock = pygame.time.Clock()
-
-        canvas = pygame.Surface((self.window_size, self.window_size))
-        canvas.fill((255, 255, 255))
-        
-        # draw walkable tiles
-        for row in self.level.location_objects:
-            for l in row:
-                if l == None:
-                    continue
-
-                r = l.draw_loc[0]
-                c = l.draw_loc[1]
-                color = (200,200,200)
-                if l.is_goal:
-                    color = (255,0,0)
-                pygame.draw.rect(canvas, color, (25*c, 25*r, 23,23))
-
-        # draw gates       
-        for row in self.level.location_objects:
-            for l in row:
-                if l == None:
-                    continue
-
-                r = l.draw_loc[0]
-                c = l.draw_loc[1]
-                if l.gate is not None:
-                    color = (0,0,0)
-                    
-                    if l.gate.is_straight:
-                        tl = (25*c, 25*r)
-                        if l.gate.directions_blocked == [3,1] or l.gate.directions_blocked == [1,3]:
-                            p1 = tl
-                            p2 = tuple(np.add(tl, (23,0)))
-                            p3 = tuple(np.add(tl, (23,23)))
-                            p4 = tuple(np.add(tl, (0,23)))
-                        elif l.gate.directions_blocked == [2,0] or l.gate.directions_blocked == [0,2]:
-                            p1 = tl
-                            p2 = tuple(np.add(tl, (0,23)))
-                            p3 = tuple(np.add(tl, (23,23)))
-                            p4 = tuple(np.add(tl, (23,0)))
-                        pygame.draw.lines(canvas, color, False, (p1,p2), 3)
-                        pygame.draw.lines(canvas, color, False, (p3,p4), 3)
-                        continue
-                    tl = (25*c+1, 25*r+1)
-                    # normal L gate
-                    if l.gate.directions_blocked == [3,0]:
-                        p1 = tl
-                        p2 = tuple(np.add(tl, (23,0)))
-                        p3 = tuple(np.add(tl, (23,23)))
-                    elif l.gate.directions_blocked == [2,3]:
-                        p1 = tuple(np.add(tl, (23,0)))
-                        p2 = tl
-                        p3 = tuple(np.add(tl, (0,23)))
-                    elif l.gate.directions_blocked == [1,2]:
-                        p1 = tuple(np.add(tl, (23,23)))
-                        p2 = tuple(np.add(tl, (0,23)))
-                        p3 = tl
-                    elif l.gate.directions_blocked == [0,1]:
-                        p1 = tuple(np.add(tl, (23,0)))
-                        p2 = tuple(np.add(tl, (23,23)))
-                        p3 = tuple(np.add(tl, (0,23)))
-                    pygame.draw.lines(canvas, color, False, (p1,p2,p3), 3)
-        
-        # print("render " + str(self.level.player.location.draw_loc))
-        pygame.draw.circle(canvas, (255,255,255), (25*self.level.player.location.draw_loc[1]+12.5, 25*self.level.player.location.draw_loc[0]+12.5), 10)
-
-        for enemy in self.level.slow_enemies:
-            center = (25*enemy.location.draw_loc[1]+12.5, 25*enemy.location.draw_loc[0]+12.5)
-            if enemy.direction == 2:
-                p1 = tuple(np.add(center, (-10,0)))
-                p2 = tuple(np.add(center, (8,-8)))
-                p3 = tuple(np.add(center, (8,8)))
-            elif enemy.direction == 3:
-                p1 = tuple(np.add(center, (0,-10)))
-                p2 = tuple(np.add(center, (-8,8)))
-                p3 = tuple(np.add(center, (8,8)))
-            if enemy.direction == 0:
-                p1 = tuple(np.add(center, (10,0)))
-                p2 = tuple(np.add(center, (-8,8)))
-                p3 = tuple(np.add(center, (-8,-8)))
-            elif enemy.direction == 1:
-                p1 = tuple(np.add(center, (0,10)))
-                p2 = tuple(np.add(center, (8,-8)))
-                p3 = tuple(np.add(center, (-8,-8)))
-
-            pygame.draw.polygon(canvas, (30,30,30), (p1,p2,p3))
-        
-        for enemy in self.level.normal_enemies:
-            center = (25*enemy.location.draw_loc[1]+12.5, 25*enemy.location.draw_loc[0]+12.5)
-            if enemy.direction == 2:
-                p1 = tuple(np.add(center, (-10,0)))
-                p2 = tuple(np.add(center, (8,-8)))
-                p3 = tuple(np.add(center, (8,8)))
-            elif enemy.direction == 3:
-                p1 = tuple(np.add(center, (0,-10)))
-                p2 = tuple(np.add(center, (-8,8)))
-                p3 = tuple(np.add(center, (8,8)))
-            if enemy.direction == 0:
-                p1 = tuple(np.add(center, (10,0)))
-                p2 = tuple(np.add(center, (-8,8)))
-                p3 = tuple(np.add(center, (-8,-8)))
-            elif enemy.direction == 1:
-                p1 = tuple(np.add(center, (0,10)))
-                p2 = tuple(np.add(center, (8,-8)))
-                p3 = tuple(np.add(center, (-8,-8)))
-
-            pygame.draw.polygon(canvas, (90,90,90), (p1,p2,p3))
-
-        for enemy in self.level.fast_enemies:
-            center = (25*enemy.location.draw_loc[1]+12.5, 25*enemy.location.draw_loc[0]+12.5)
-            if enemy.direction == 2:
-                p1 = tuple(np.add(center, (-10,0)))
-                p2 = tuple(np.add(center, (8,-8)))
-                p3 = tuple(np.add(center, (8,8)))
-            elif enemy.direction == 3:
-                p1 = tuple(np.add(center, (0,-10)))
-                p2 = tuple(np.add(center, (-8,8)))
-                p3 = tuple(np.add(center, (8,8)))
-            if enemy.direction == 0:
-                p1 = tuple(np.add(center, (10,0)))
-                p2 = tuple(np.add(center, (-8,8)))
-                p3 = tuple(np.add(center, (-8,-8)))
-            elif enemy.direction == 1:
-                p1 = tuple(np.add(center, (0,10)))
-                p2 = tuple(np.add(center, (8,-8)))
-                p3 = tuple(np.add(center, (-8,-8)))
-
-            pygame.draw.polygon(canvas, (150,150,150), (p1,p2,p3))
-
-
-        temp_surf = canvas.copy()
-        canvas.fill((255,255,255))
-        canvas.blit(temp_surf, (50, 50))
-
-        if self.render_mode == "human":
-            # The following line copies our drawings from `canvas` to the visible window
-            self.window.blit(canvas, canvas.get_rect())
-            pygame.event.pump()
-            pygame.display.update()
-
-            # We need to ensure that human-rendering occurs at the predefined framerate.
-            # The following line will automatically add a delay to keep the framerate stable.
-            self.clock.tick(60)
-        else:  # rgb_array
-            return np.transpose(
-                np.array(pygame.surfarray.pixels3d(canvas)), axes=(1, 0, 2)
-            )
+        if self._window is None:
+            from gym_envs.direkt.window import Window
+            self._window = Window(self.level.template, self.window_size)
+        self._window.draw(self.level)
+
+
+class LevelTemplate:
+    """Parsed, read-only description of a level file.
+
+    A template is built once per level file (see ``LevelTemplate.load``) and
+    shared by every ``Level`` playing that file, so starting a new episode never
+    has to touch the disk or re-parse JSON.
+    """
+
+    _cache = {}
+
+    def __init__(self, data):
+        self.locations = tuple(tuple(row) for row in data["level_setup"])
+        self.rows = len(self.locations)
+        self.cols = len(self.locations[0])
+        self.gates = tuple(tuple(g) for g in data.get("gates", []))
+        self.straight_gates = tuple(tuple(g) for g in data.get("straight_gates", []))
+        self.triggers = tuple(tuple(t) for t in data.get("triggers", []))
+        self.slow_enemies = tuple(tuple(e) for e in data.get("slow_enemies", []))
+        self.normal_enemies = tuple(tuple(e) for e in data.get("normal_enemies", []))
+        self.fast_enemies = tuple(tuple(e) for e in data.get("fast_enemies", []))
+        self.player = tuple(data["player"])
+
+    @classmethod
+    def load(cls, level_sheet):
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)), level_sheet)
+        template = cls._cache.get(path)
+        if template is None:
+            with open(path) as f:
+                template = cls(json.load(f))
+            cls._cache[path] = template
+        return template
 
 
 class Level:
 
-    def __init__(self, level_sheet):
+    # Enemies move by lookups in the level's shared EnemyMoveCache, or in
+    # the one passed as enemy_cache, and the valid actions are looked up in
+    # the exit masks of the current gate configuration. enemy_cache=False
+    # plays by the reference rules instead, Enemy.move and
+    # Location.get_valid_directions, which rescan the gates every call.
+    MAX_CACHED_EXIT_MASKS = 4096
+
+    def __init__(self, level_sheet, enemy_cache=True):
         self.level_sheet = level_sheet
-        self.reset()
-    
-    def reset(self):
+        self.template = LevelTemplate.load(level_sheet)
         self.fast_enemies = []
         self.slow_enemies = []
         self.normal_enemies = []
@@ -274,13 +346,101 @@ class Level:
         self.gates = []
         self.player = None
         self.location_objects = None
-        self.init_level(self.level_sheet)
+        self.init_level(self.template)
+
+        # everything a reset has to put back; the board itself never changes
+        self._initial_gates = [list(g.directions_blocked) for g in self.gates]
+        self._initial_enemies = [(e.location, e.direction) for e in self.fast_enemies + self.normal_enemies + self.slow_enemies]
+        self._initial_player = (self.player.location, self.player.direction)
+
+        # walkable cells in row-major order, the numbering of ArrayLevel's cells
+        self._cells = [loc for row in self.location_objects for loc in row if loc is not None]
+        self._cell_index = {loc: i for i, loc in enumerate(self._cells)}
+        for i, loc in enumerate(self._cells):
+            loc.cell = i
+        self._agents = self.fast_enemies + self.normal_enemies + self.slow_enemies
+        self._fast_and_normal = self.fast_enemies + self.normal_enemies
+        self._count_enemies()
+
+        from gym_envs.direkt.array_level import LevelArrays
+        self._arrays = LevelArrays.load(self.template)
+        if enemy_cache is True:
+            enemy_cache = self._arrays.enemy_cache()
+        self.enemy_cache = None if enemy_cache is False else enemy_cache
+        self._gate_weight = [4 ** g for g in range(len(self.gates))]
+        self._has_gate = [16 if loc.gate is not None else 0 for loc in self._cells]
+        # exit masks of the cells by gate configuration, for the valid actions
+        self._exit_masks = {}
+        self._gate_config()
+
+    # restores the mutable parts of the level to their initial values
+    def reset(self):
+        for gate, blocked in zip(self.gates, self._initial_gates):
+            gate.directions_blocked = list(blocked)
 
-    def init_level(self, level_sheet):
-        f = open(os.path.join(os.path.dirname(os.path.realpath(__file__)), level_sheet))
-        data = json.load(f)
+        for enemy, (location, direction) in zip(self.fast_enemies + self.normal_enemies + self.slow_enemies, self._initial_enemies):
+            enemy.location = location
+            enemy.direction = direction
+
+        self.player.location, self.player.direction = self._initial_player
+        self.game_tick = 0
+        self._count_enemies()
+        self._gate_config()
+
+    # Snapshot of everything that changes during a game, as a hashable tuple
+    # (player cell, player direction, game_tick, gate rotations, enemy cells,
+    # enemy directions). Cells are numbered like ArrayLevel's and enemies are
+    # ordered fast, normal, slow, so both engines take each other's snapshots.
+    def get_state(self):
+        index = self._cell_index
+        return (
+            index[self.player.location],
+            self.player.direction,
+            self.game_tick,
+            tuple(gate.directions_blocked[0] for gate in self.gates),
+            tuple(index[e.location] for e in self._agents),
+            tuple(e.direction for e in self._agents),
+        )
 
-        locations = data["level_setup"]
+    def set_state(self, state):
+        player_cell, self.player.direction, self.game_tick, gates, enemy_cell, enemy_dir = state
+        self.player.location = self._cells[player_cell]
+        for gate, rot in zip(self.gates, gates):
+            gate.directions_blocked = [rot, (rot + 2) % 4] if gate.is_straight else [rot, (rot + 1) % 4]
+        for enemy, cell, direction in zip(self._agents, enemy_cell, enemy_dir):
+            enemy.location = self._cells[cell]
+            enemy.direction = direction
+        self._count_enemies()
+        self._gate_config()
+
+    # enemies per cell, kept up to date as they move so did_lose is one lookup
+    def _count_enemies(self):
+        occupancy = [0] * len(self._cells)
+        for enemy in self._agents:
+            occupancy[enemy.location.cell] += 1
+        self._occupancy = occupancy
+
+    # sum(rotation * 4**g) of the gates, the key of the enemy moves and exit
+    # masks; only rotating and triggers turn gates, and they update it
+    def _gate_config(self):
+        config = 0
+        for gate, weight in zip(self.gates, self._gate_weight):
+            config += gate.directions_blocked[0] * weight
+        self._config = config
+
+    # exit_mask | has_gate << 4 of the player's cell, see VALID_ACTIONS
+    def _action_key(self):
+        masks = self._exit_masks.get(self._config)
+        if masks is None:
+            masks = self._arrays.exit_masks([gate.directions_blocked[0] for gate in self.gates]).tolist()
+            if len(self._exit_masks) >= self.MAX_CACHED_EXIT_MASKS:
+                self._exit_masks.clear()
+            self._exit_masks[self._config] = masks
+        cell = self.player.location.cell
+        return masks[cell] | self._has_gate[cell]
+
+    def init_level(self, template):
+        locations = template.locations
         location_objects = [[None for i in range(len(locations[0]))] for j in range(len(locations))]
         for r in range(len(locations)):
             for c in range(len(locations[0])):
@@ -308,46 +468,43 @@ class Level:
                 if r - 1 >= 0:
                     location_objects[r][c].neighbors[3] = location_objects[r-1][c]
         
-        gates = data["gates"]
-        for r, c, init_orientation in gates:
+        for r, c, init_orientation in template.gates:
             self.num_gates += 1
             gate = Gate(init_orientation)
             location_objects[r][c].gate = gate
             self.gates.append(gate)
         
-        s_gates = data["straight_gates"]
-        for r, c, init_orientation in s_gates:
+        for r, c, init_orientation in template.straight_gates:
             self.num_gates += 1
             gate = Gate(init_orientation, is_straight=True)
             location_objects[r][c].gate = gate
             self.gates.append(gate)
         
-        triggers = data["triggers"]
-        for r, c, gr, gc, exit_dir_that_rotates_once in triggers:
-            gate = location_objects[gr][gc]
+        # exiting (r, c) towards exit_dir_that_rotates_once turns the gate at
+        # (gr, gc) once clockwise, exiting the opposite way turns it back; a
+        # later trigger on (r, c) replaces the earlier ones
+        for r, c, gr, gc, exit_dir_that_rotates_once in template.triggers:
+            gate = location_objects[gr][gc].gate
             location = location_objects[r][c]
             m = {
-                exit_dir_that_rotates_once: 1,
-                exit_dir_that_rotates_once + 2 % 4: 3
+                exit_dir_that_rotates_once: (gate, 1),
+                (exit_dir_that_rotates_once + 2) % 4: (gate, 3)
             }
             location.exit_trigger_map = m
         
-        slow_enemies = data["slow_enemies"]
-        for r, c, direction in slow_enemies:
+        for r, c, direction in template.slow_enemies:
             enemy = Enemy(is_fast=False, direction=direction, location=location_objects[r][c])
             self.slow_enemies.append(enemy)
         
-        normal_enemies = data["normal_enemies"]
-        for r, c, direction in normal_enemies:
+        for r, c, direction in template.normal_enemies:
             enemy = Enemy(is_fast=False, direction=direction, location=location_objects[r][c])
             self.normal_enemies.append(enemy)
         
-        fast_enemies = data["fast_enemies"]
-        for r, c, direction in fast_enemies:
+        for r, c, direction in template.fast_enemies:
             enemy = Enemy(is_fast=True, direction=direction, location=location_objects[r][c])
             self.fast_enemies.append(enemy)
         
-        player = data["player"]
+        player = template.player
         player_start = location_objects[player[0]][player[1]]
         self.player = Player(0, player_start)
         self.location_objects = location_objects
@@ -376,6 +533,9 @@ class Level:
     # rotate: 4,6
     # wait: 5
     def get_valid_actions(self):
+        if self.enemy_cache is not None:
+            return list(VALID_ACTIONS[self._action_key()])
+
         location = self.player.location
         x = location.get_valid_directions()
 
@@ -386,6 +546,15 @@ class Level:
         x.append(5)
         return x
 
+    # get_valid_actions as a read-only row of ACTION_MASKS, (7,) booleans
+    def get_action_mask(self):
+        if self.enemy_cache is not None:
+            return ACTION_MASKS[self._action_key()]
+
+        mask = np.zeros(7, dtype=bool)
+        mask[self.get_valid_actions()] = True
+        return mask
+
     def take_action(self, action):
         if action in [0,1,2,3]:
             return self.action_move(action)
@@ -469,6 +638,7 @@ class Level:
         if not counter:
             times = 1
         self.player.location.gate.rotate(times)
+        self._gate_config()
         return 0
     
 
@@ -476,58 +646,87 @@ class Level:
     # Utility functions
     # -------------------------------
     def move_fast_enemies(self):
-        triggers = []
-        for enemy in self.fast_enemies:
-            t = enemy.move()
-            if t is not None:
-                triggers.append(t)
-        return triggers
+        return self._move_enemies(self.fast_enemies)
     
     def move_slow_enemies(self):
-        triggers = []
-        for enemy in self.slow_enemies:
-            t = enemy.move()
-            if t is not None:
-                triggers.append(t)
-        return triggers
+        return self._move_enemies(self.slow_enemies)
     
     # moves normal + fast enemies
     def move_all_enemies(self):
+        return self._move_enemies(self._fast_and_normal)
+
+    # returns the triggers the enemies fired
+    def _move_enemies(self, enemies):
         triggers = []
-        for enemy in self.fast_enemies:
-            t = enemy.move()
-            if t is not None:
-                triggers.append(t)
-        
-        for enemy in self.normal_enemies:
-            t = enemy.move()
-            if t is not None:
-                triggers.append(t)
-        
+        cache = self.enemy_cache
+        if not enemies:
+            return triggers
+        occupancy = self._occupancy
+        if cache is None:
+            for enemy in enemies:
+                location = enemy.location
+                t = enemy.move()
+                if t is not None:
+                    triggers.append(t)
+                occupancy[location.cell] -= 1
+                occupancy[enemy.location.cell] += 1
+            return triggers
+
+        # gates only turn between moves, so every enemy sees the same ones
+        config = self._config
+        if cache.precomputed:
+            # inline cache.next, the lookups are counted all at once
+            table = cache.table
+            offset = config * cache.num_states
+            cache.hits += len(enemies)
+        for enemy in enemies:
+            location = enemy.location
+            state = location.cell * 4 + enemy.direction
+            moved = table[offset + state] if cache.precomputed else cache.next(config, state)
+            if moved == state:
+                continue
+            direction = moved & 3
+            # only going forward can trigger a trigger
+            if direction == enemy.direction and location.exit_trigger_map is not None:
+                t = location.get_triggered(direction)
+                if t is not None:
+                    triggers.append(t)
+            enemy.direction = direction
+            occupancy[location.cell] -= 1
+            occupancy[moved >> 2] += 1
+            enemy.location = self._cells[moved >> 2]
         return triggers
     
     def execute_triggers(self, triggers):
         for trigger, times in triggers:
             trigger.rotate(times)
+        if triggers:
+            self._gate_config()
 
     def did_lose(self):
-        for enemy in self.fast_enemies:
-            if enemy.location == self.player.location:
-                return True
-        
-        for enemy in self.normal_enemies:
-            if enemy.location == self.player.location:
-                return True
-        
-        for enemy in self.slow_enemies:
-            if enemy.location == self.player.location:
-                return True
-
-        return False
+        return self._occupancy[self.player.location.cell] > 0
 
     def did_win(self):
         return self.player.location.is_goal
 
+    # -------------------------------
+    # Engine independent views, used by Direkt_v0 to observe and draw
+    # either this or array_level.ArrayLevel
+    # -------------------------------
+    def get_player_location(self):
+        return self.player.location.draw_loc
+
+    def get_player_direction(self):
+        return self.player.direction
+
+    def get_gate_directions(self):
+        return [gate.directions_blocked for gate in self.gates]
+
+    # (row, col, direction) of every enemy of a kind: "slow", "normal" or "fast"
+    def get_enemy_states(self, kind):
+        enemies = {"slow": self.slow_enemies, "normal": self.normal_enemies, "fast": self.fast_enemies}[kind]
+        return [(e.location.draw_loc[0], e.location.draw_loc[1], e.direction) for e in enemies]
+
 
 
 class Location:
@@ -538,6 +737,8 @@ class Location:
         self.exit_trigger_map = exit_trigger_map
         self.is_goal = is_goal
         self.draw_loc = draw_loc
+        # row-major number among the walkable cells, set by Level
+        self.cell = None
     
     def get_valid_directions(self):
         valid = []
@@ -0,0 +1,338 @@
+import numpy as np
+from gymnasium import spaces
+from gymnasium.vector import VectorEnv
+
+from gym_envs.direkt.direkt_v0 import ACTION_MASKS, LevelTemplate, make_observation_space
+from gym_envs.direkt.array_level import LevelArrays
+
+
+class DirektVector_v0(VectorEnv):
+    """``num_envs`` copies of one direkt level stepped together on NumPy arrays.
+
+    Every sub-environment follows the same rules as ``Direkt_v0``: invalid
+    actions burn a step for -1, losing pays -100 and winning 200. Finished
+    sub-environments are reset inside ``step`` and, like gymnasium's
+    ``SyncVectorEnv``, their last observation is reported under
+    ``info["final_observation"]``.
+
+    The state is stored one row per gate/enemy and one column per
+    sub-environment: ``player_cell``/``player_dir`` (num_envs,), ``gate_rot``
+    (num_gates, num_envs), ``enemy_state`` (num_enemies, num_envs) holding
+    ``cell * 4 + direction`` with enemies ordered fast, normal, slow, and
+    ``game_tick``. Enemies of one phase are moved all at once, which is safe
+    because gates only turn at the end of a phase and enemies never block
+    each other.
+
+    As in ``SyncVectorEnv``, ``copy=False`` returns the internal observation
+    buffers, which the next ``step``/``reset`` overwrites.
+    """
+
+    metadata = {"render_modes": [], "autoreset": True}
+
+    def __init__(self, num_envs, level=None, max_episode_steps=None, copy=True):
+        super().__init__(num_envs, make_observation_space(), spaces.Discrete(7))
+        self.level_file = level
+        self.template = LevelTemplate.load(level)
+        self.arrays = a = LevelArrays.load(self.template)
+        self.max_episode_steps = max_episode_steps
+        self.copy = copy
+
+        self._fast = slice(0, a.num_fast)
+        self._all = slice(0, a.num_fast + a.num_normal)
+        self._slow = slice(a.num_fast + a.num_normal, a.num_enemies)
+        # Direkt_v0 observes slow enemies first, then fast ones
+        self._obs_enemies = np.r_[np.arange(a.num_fast + a.num_normal, a.num_enemies), np.arange(a.num_fast)]
+        self._has_triggers = bool((a.trigger_gate >= 0).any())
+
+        # everything below is indexed flat, which is several times cheaper than 2-d gathers
+        self._num_states = a.num_cells * 4
+        self._neighbor = a.neighbor.ravel().astype(np.int64)
+        self._enemy_next = a.enemy_next.ravel()
+        self._trigger_gate = a.trigger_gate.ravel().astype(np.int64)
+        self._trigger_times = a.trigger_times.ravel()
+        self._cell_gate = a.cell_gate.astype(np.int64)
+        self._row_col = a.cell_rc.T.astype(np.int64)
+
+        # with few gates every exit mask is a lookup by gate configuration,
+        # otherwise each sub-environment keeps its own row of masks
+        self._mask_table = a.exit_mask_table()
+        if self._mask_table is not None:
+            self._mask_table = self._mask_table.ravel().astype(np.int64)
+        self._gate_weights = 4 ** np.arange(a.num_gates, dtype=np.int64)
+
+        self.player_cell = np.zeros(num_envs, dtype=np.int64)
+        self.player_dir = np.zeros(num_envs, dtype=np.int64)
+        self.gate_rot = np.zeros((a.num_gates, num_envs), dtype=np.int64)
+        self.enemy_state = np.zeros((a.num_enemies, num_envs), dtype=np.int64)
+        self.game_tick = np.zeros(num_envs, dtype=np.int64)
+        self.episode_steps = np.zeros(num_envs, dtype=np.int64)
+        # offset of each sub-environment's row in the flat exit mask table
+        self._mask_offset = np.zeros(num_envs, dtype=np.int64)
+        self._exit_mask = None
+        self._actions = np.zeros(num_envs, dtype=np.int64)
+
+        # observation buffers, the padding never changes so only the used columns are rewritten
+        k = len(self._obs_enemies)
+        self._obs = {
+            "player": np.zeros((num_envs, 2), dtype=np.int64),
+            "gates":
+                {
+                    "num": np.full(num_envs, a.num_gates, dtype=np.int64),
+                    "rotation": np.zeros((num_envs, 20), dtype=np.int64)
+                },
+            "enemies":
+                {
+                    "num": np.full(num_envs, k, dtype=np.int64),
+                    "location": np.zeros((num_envs, 40), dtype=np.int64),
+                    "rotation": np.zeros((num_envs, 20), dtype=np.int64)
+                }
+            }
+
+    def reset_wait(self, seed=None, options=None):
+        self._reset_rows(np.ones(self.num_envs, dtype=bool))
+        return self._getobs(), {}
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.int64)
+
+    def step_wait(self):
+        result = self._tick(self._actions)
+        self.episode_steps += 1
+
+        rewards = np.where(result == -1, -100, np.where(result == 1, 200, -1))
+        terminated = result != 0
+        truncated = np.zeros(self.num_envs, dtype=bool)
+        if self.max_episode_steps is not None:
+            truncated = ~terminated & (self.episode_steps >= self.max_episode_steps)
+
+        infos = {}
+        done = terminated | truncated
+        if done.any():
+            finished = np.flatnonzero(done)
+            final = _select(self._getobs(), finished)
+            final_observation = np.full(self.num_envs, None, dtype=object)
+            final_info = np.full(self.num_envs, None, dtype=object)
+            for j, i in enumerate(finished):
+                final_observation[i] = _select(final, j)
+                final_info[i] = {}
+            infos = {
+                "final_observation": final_observation,
+                "_final_observation": done,
+                "final_info": final_info,
+                "_final_info": done,
+            }
+            self._reset_rows(done)
+
+        return self._getobs(), rewards, terminated, truncated, infos
+
+    # -------------------------------
+    # Level.get_state snapshots, one per sub-environment
+    # -------------------------------
+    def get_states(self):
+        enemy_cell = (self.enemy_state >> 2).T.tolist()
+        enemy_dir = (self.enemy_state & 3).T.tolist()
+        gates = self.gate_rot.T.tolist()
+        return [
+            (cell, direction, tick, tuple(gates[i]), tuple(enemy_cell[i]), tuple(enemy_dir[i]))
+            for i, (cell, direction, tick) in enumerate(zip(self.player_cell.tolist(), self.player_dir.tolist(), self.game_tick.tolist()))
+        ]
+
+    # restores every sub-environment from a snapshot and restarts its episode
+    # step count, returns the observations
+    def set_states(self, states):
+        if len(states) != self.num_envs:
+            raise ValueError(f"expected {self.num_envs} states, got {len(states)}")
+        a = self.arrays
+        player_cell, player_dir, game_tick, gates, enemy_cell, enemy_dir = zip(*states)
+        self.player_cell[:] = player_cell
+        self.player_dir[:] = player_dir
+        self.game_tick[:] = game_tick
+        self.gate_rot[:] = np.array(gates, dtype=np.int64).reshape(self.num_envs, a.num_gates).T
+        enemy_cell = np.array(enemy_cell, dtype=np.int64).reshape(self.num_envs, a.num_enemies)
+        enemy_dir = np.array(enemy_dir, dtype=np.int64).reshape(self.num_envs, a.num_enemies)
+        self.enemy_state[:] = (enemy_cell * 4 + enemy_dir).T
+        self.episode_steps[:] = 0
+        self._gates_changed()
+        return self._getobs()
+
+    # copies of the state arrays for restore; unlike get_states nothing leaves
+    # NumPy, so this is cheap enough to do every step
+    def snapshot(self):
+        return (self.player_cell.copy(), self.player_dir.copy(), self.gate_rot.copy(),
+                self.enemy_state.copy(), self.game_tick.copy(), self.episode_steps.copy())
+
+    def restore(self, snapshot):
+        player_cell, player_dir, gate_rot, enemy_state, game_tick, episode_steps = snapshot
+        self.player_cell[:] = player_cell
+        self.player_dir[:] = player_dir
+        self.gate_rot[:] = gate_rot
+        self.enemy_state[:] = enemy_state
+        self.game_tick[:] = game_tick
+        self.episode_steps[:] = episode_steps
+        self._gates_changed()
+
+    # -------------------------------
+    # Batched version of Level.get_valid_actions, (num_envs, 7) booleans
+    # -------------------------------
+    def get_action_masks(self):
+        has_gate = self._cell_gate[self.player_cell] >= 0
+        return ACTION_MASKS[self._masks_at(self.player_cell) | (has_gate << 4)]
+
+    # -------------------------------
+    # Batched Level.take_action, returns -1 / 0 / 1 per sub-environment
+    # -------------------------------
+    # Public form of it for planners, without observations, rewards, episode
+    # counts or resets; finished sub-environments carry on from where they
+    # ended until they are reset or restored.
+    def take_actions(self, actions):
+        return self._tick(np.asarray(actions, dtype=np.int64))
+
+    # puts every sub-environment back at the start, without building an
+    # observation; the counterpart of take_actions to reset
+    def reset_states(self):
+        self._reset_rows(np.ones(self.num_envs, dtype=bool))
+
+    def _tick(self, actions):
+        direction = np.minimum(actions, 3)
+        exits = self._masks_at(self.player_cell)
+        is_move = (actions < 4) & ((exits >> direction) & 1 == 0)
+        is_wait = actions == 5
+        gate_here = self._cell_gate[self.player_cell]
+        is_rotate = ((actions == 4) | (actions == 6)) & (gate_here >= 0)
+
+        # rotation takes no time, so it cannot lose
+        if is_rotate.any():
+            envs = np.flatnonzero(is_rotate)
+            g = gate_here[envs]
+            times = np.where(actions[envs] == 4, 1, 3)
+            self.gate_rot[g, envs] = (self.gate_rot[g, envs] + times) % 4
+            self._gates_changed()
+
+        result = np.zeros(self.num_envs, dtype=np.int8)
+        live = is_move | is_wait
+        self.game_tick += live
+
+        # fast enemies
+        fast_triggers = self._move_enemies(self._fast, live)
+        live = self._check_lose(live, result)
+        self._execute_triggers([fast_triggers], live)
+
+        # player, a move only triggers if the player was already facing that way
+        moving = live & is_move
+        player_triggers = None
+        if self._has_triggers:
+            packed = self.player_cell * 4 + direction
+            facing = moving & (self.player_dir == actions)
+            player_triggers = (np.where(facing, self._trigger_gate[packed], -1)[None], self._trigger_times[packed][None])
+        self.player_dir = np.where(moving, actions, self.player_dir)
+        self.player_cell = np.where(moving, self._neighbor[self.player_cell * 4 + direction], self.player_cell)
+        live = self._check_lose(live, result)
+        won = live & moving & self.arrays.is_goal[self.player_cell]
+        result[won] = 1
+        live &= ~won
+
+        # normal + fast enemies
+        all_triggers = self._move_enemies(self._all, live)
+        live = self._check_lose(live, result)
+
+        # slow enemies
+        slow_triggers = self._move_enemies(self._slow, live & (self.game_tick % 2 == 0))
+        live = self._check_lose(live, result)
+
+        # like Level.action_wait, waiting fires the fast enemy triggers a second time
+        if self._has_triggers:
+            repeated = None
+            if fast_triggers is not None:
+                repeated = (np.where(is_wait, fast_triggers[0], -1), fast_triggers[1])
+            self._execute_triggers([player_triggers, repeated, all_triggers, slow_triggers], live)
+        return result
+
+    def _move_enemies(self, enemies, live):
+        state = self.enemy_state[enemies]
+        if len(state) == 0:
+            return None
+        masks = self._masks_at(state >> 2)
+        moved = self._enemy_next[masks * self._num_states + state]
+        moved = np.where(live, moved, state)
+
+        triggers = None
+        if self._has_triggers:
+            # only going forward can trigger a trigger
+            forward = (moved != state) & ((moved & 3) == (state & 3))
+            triggers = (np.where(forward, self._trigger_gate[state], -1), self._trigger_times[state])
+
+        self.enemy_state[enemies] = moved
+        return triggers
+
+    # triggers are (gate, times) arrays of shape (k, num_envs), gate -1 meaning nothing fired
+    def _execute_triggers(self, triggers, live):
+        if not self._has_triggers:
+            return
+        changed = False
+        for trigger in triggers:
+            if trigger is None:
+                continue
+            gate, times = trigger
+            fired = (gate >= 0) & live
+            if fired.any():
+                k, envs = np.nonzero(fired)
+                np.add.at(self.gate_rot, (gate[k, envs], envs), times[k, envs])
+                changed = True
+        if changed:
+            self.gate_rot %= 4
+            self._gates_changed()
+
+    def _check_lose(self, live, result):
+        if self.arrays.num_enemies == 0:
+            return live
+        lost = live & ((self.enemy_state >> 2) == self.player_cell).any(axis=0)
+        result[lost] = -1
+        return live & ~lost
+
+    # exit masks of the given cells, shape (num_envs,) or (k, num_envs)
+    def _masks_at(self, cells):
+        if self._mask_table is not None:
+            return self._mask_table[self._mask_offset + cells]
+        return self._exit_mask[self._mask_offset + cells]
+
+    def _gates_changed(self):
+        a = self.arrays
+        if self._mask_table is not None:
+            self._mask_offset = (self._gate_weights @ self.gate_rot) * a.num_cells
+        else:
+            self._exit_mask = a.batch_exit_masks(self.gate_rot.T).ravel().astype(np.int64)
+            self._mask_offset = np.arange(self.num_envs, dtype=np.int64) * a.num_cells
+
+    def _reset_rows(self, rows):
+        a = self.arrays
+        self.player_cell[rows] = a.initial_player_cell
+        self.player_dir[rows] = 0
+        self.gate_rot[:, rows] = a.initial_gate_rot[:, None]
+        self.enemy_state[:, rows] = (a.initial_enemy_cell * 4 + a.initial_enemy_dir)[:, None]
+        self.game_tick[rows] = 0
+        self.episode_steps[rows] = 0
+        self._gates_changed()
+
+    def _getobs(self):
+        a = self.arrays
+        k = len(self._obs_enemies)
+        obs = self._obs
+
+        obs["player"][:, 0] = self._row_col[0, self.player_cell]
+        obs["player"][:, 1] = self._row_col[1, self.player_cell]
+        obs["gates"]["rotation"][:, :a.num_gates] = self.gate_rot.T
+        enemies = self.enemy_state[self._obs_enemies]
+        obs["enemies"]["location"][:, 0:2*k:2] = self._row_col[0, enemies >> 2].T
+        obs["enemies"]["location"][:, 1:2*k:2] = self._row_col[1, enemies >> 2].T
+        obs["enemies"]["rotation"][:, :k] = (enemies & 3).T
+
+        if self.copy:
+            return _select(obs, slice(None))
+        return obs
+
+
+# index every array of a (nested) batched observation, copying unless i is a scalar
+def _select(obs, i):
+    if isinstance(obs, dict):
+        return {key: _select(value, i) for key, value in obs.items()}
+    return obs[i].copy() if isinstance(i, slice) else obs[i]
@@ -0,0 +1,64 @@
+import time
+
+# methods of Level and ArrayLevel timed by attach_level, those an engine lacks
+# are skipped; ArrayLevel moves every kind of enemy with move_enemies
+LEVEL_PHASES = ("take_action", "move_fast_enemies", "move_all_enemies", "move_slow_enemies", "move_enemies",
+                "did_lose", "did_win", "execute_triggers")
+ENV_PHASES = ("reset", "step", "_getobs")
+
+
+class PhaseProfiler:
+    """Call counts and ``perf_counter_ns`` totals of the phases of a game.
+
+    A phase is a method that ``wrap`` replaces, on the one instance only, by a
+    timing wrapper; nothing is wrapped unless profiling was asked for, so an
+    unprofiled game runs the plain methods. Totals include those of phases
+    called inside, a step contains its did_lose checks, and two clock reads
+    per call, about 0.1 us, which is much of a did_lose.
+
+    ``phases`` maps a phase name to its [calls, total ns] and is updated in
+    place, ``clear`` starts over.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    # times every call of obj.name as phase, by default name
+    def wrap(self, obj, name, phase=None):
+        method = getattr(obj, name)
+        counter = self.phases.setdefault(phase or name, [0, 0])
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = clock()
+            result = method(*args, **kwargs)
+            counter[1] += clock() - start
+            counter[0] += 1
+            return result
+
+        setattr(obj, name, timed)
+
+    # times the LEVEL_PHASES a Level or ArrayLevel has, as "level.<method>"
+    def attach_level(self, level):
+        for name in LEVEL_PHASES:
+            if hasattr(level, name):
+                self.wrap(level, name, f"level.{name}")
+
+    def clear(self):
+        for counter in self.phases.values():
+            counter[:] = [0, 0]
+
+    # (phase, calls, total ms, mean us, share of total_ns) rows, the most
+    # expensive phase first; share is None without total_ns
+    def summary(self, total_ns=None):
+        rows = []
+        for phase, (calls, ns) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            share = ns / total_ns if total_ns else None
+            rows.append((phase, calls, ns / 1e6, ns / calls / 1e3 if calls else 0.0, share))
+        return rows
+
+    def format(self, total_ns=None):
+        lines = [f"{'phase':<28}{'calls':>10}{'total ms':>12}{'mean us':>10}{'share':>8}"]
+        for phase, calls, total, mean, share in self.summary(total_ns):
+            lines.append(f"{phase:<28}{calls:>10}{total:>12.1f}{mean:>10.2f}" + (f"{share:>8.1%}" if share is not None else ""))
+        return "\n".join(lines)
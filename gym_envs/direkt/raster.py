@@ -0,0 +1,141 @@
+import numpy as np
+
+from gym_envs.direkt.array_level import LevelArrays
+
+# Geometry of a rendered frame, shared with the pygame window (window.py).
+# The board is drawn BOARD_OFFSET pixels from the top left of the frame,
+# cells are CELL pixels apart
+BOARD_OFFSET = 50
+CELL = 25
+ENEMY_COLORS = {"slow": (30,30,30), "normal": (90,90,90), "fast": (150,150,150)}
+# enemy triangle by direction, around the center of its cell
+ENEMY_POINTS = [((10,0), (-8,8), (-8,-8)), ((0,10), (8,-8), (-8,-8)), ((-10,0), (8,-8), (8,8)), ((0,-10), (-8,8), (8,8))]
+# L gate walls by rotation, from a pixel into its cell
+GATE_POINTS = [((23,0), (23,23), (0,23)), ((23,23), (0,23), (0,0)), ((23,0), (0,0), (0,23)), ((0,0), (23,0), (23,23))]
+# the two walls of a straight gate by rotation % 2, from the corner of its cell
+STRAIGHT_GATE_POINTS = [(((0,0), (0,23)), ((23,23), (23,0))), (((0,0), (23,0)), ((23,23), (0,23)))]
+
+# sprites are rasterized on a grid a little larger than a cell, drawings spill
+# at most a pixel into the neighbouring cells
+_MARGIN = 2
+_ys, _xs = np.mgrid[-_MARGIN:CELL + _MARGIN + 1, -_MARGIN:CELL + _MARGIN + 1]
+
+
+# 3 pixel wide walls along axis-aligned polylines, from the cell's corner
+def _walls(*polylines):
+    mask = np.zeros(_xs.shape, dtype=bool)
+    for points in polylines:
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            mask |= ((_xs >= min(x0, x1) - (y0 != y1)) & (_xs <= max(x0, x1) + (y0 != y1))
+                     & (_ys >= min(y0, y1) - (x0 != x1)) & (_ys <= max(y0, y1) + (x0 != x1)))
+    return mask
+
+
+# pixels on or inside a triangle whose corners are truncated to whole pixels, like pygame's
+def _triangle(points):
+    points = [(int(x), int(y)) for x, y in points]
+    sides = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]):
+        sides.append((x1 - x0) * (_ys - y0) - (y1 - y0) * (_xs - x0))
+    sides = np.stack(sides)
+    return (sides >= 0).all(axis=0) | (sides <= 0).all(axis=0)
+
+
+# pixels whose centers lie within radius of a center truncated to a whole pixel
+def _disc(center, radius):
+    cx, cy = int(center[0]), int(center[1])
+    return (_xs + .5 - cx) ** 2 + (_ys + .5 - cy) ** 2 <= radius ** 2
+
+
+GATE_SPRITES = [_walls([(1 + dx, 1 + dy) for dx, dy in points]) for points in GATE_POINTS]
+STRAIGHT_GATE_SPRITES = [_walls(*STRAIGHT_GATE_POINTS[rot % 2]) for rot in range(4)]
+PLAYER_SPRITE = _disc((12.5, 12.5), 10)
+ENEMY_SPRITES = [_triangle([(12.5 + dx, 12.5 + dy) for dx, dy in points]) for points in ENEMY_POINTS]
+
+
+class Rasterizer:
+    """Draws direkt games into uint8 (H, W, 3) NumPy frames, without pygame.
+
+    Frames have the geometry and colors of ``Direkt_v0``'s pygame window: 23
+    pixel tiles 25 pixels apart, 50 pixels from the top left, the goal red,
+    gate walls black, the player a white disc and slow, normal and fast
+    enemies dark to light grey triangles pointing where they head. Edges
+    can differ from pygame's by a pixel.
+
+    Games are drawn from ``Level.get_state`` snapshots, which every engine
+    and ``DirektVector_v0.get_states`` hand out. Each sprite is kept as the
+    flat pixel indices it covers at every cell it was drawn at, so a batch of
+    frames costs one background copy and one fancy assignment per layer.
+    """
+
+    def __init__(self, template, size=512):
+        a = LevelArrays.load(template)
+        self.size = size
+        self._cell_rc = a.cell_rc.tolist()
+
+        self.background = np.full((size, size, 3), 255, dtype=np.uint8)
+        for r, row in enumerate(template.locations):
+            for c, tile in enumerate(row):
+                if tile == 0:
+                    continue
+                x = BOARD_OFFSET + CELL*c
+                y = BOARD_OFFSET + CELL*r
+                self.background[y:y+23, x:x+23] = (255, 0, 0) if tile == 9 else (200, 200, 200)
+
+        # sprite numbers: L gates by rotation, straight gates by rotation,
+        # the player, enemies by direction
+        self._sprites = GATE_SPRITES + STRAIGHT_GATE_SPRITES + [PLAYER_SPRITE] + ENEMY_SPRITES
+        self._gate_cell = a.gate_cell.tolist()
+        self._gate_sprite = [4 if straight else 0 for straight in a.gate_straight.tolist()]
+        # enemies of a snapshot are ordered fast, normal, slow; layers are
+        # drawn gates, player, slow, normal, fast
+        self._enemy_layer = [4] * a.num_fast + [3] * a.num_normal + [2] * a.num_slow
+        self._colors = [(0,0,0), (255,255,255), ENEMY_COLORS["slow"], ENEMY_COLORS["normal"], ENEMY_COLORS["fast"]]
+        self._pixels = {}
+
+    # flat indices into a frame of the pixels a sprite covers at a cell,
+    # clipped to the board
+    def _indices(self, cell, sprite):
+        key = cell * len(self._sprites) + sprite
+        indices = self._pixels.get(key)
+        if indices is None:
+            r, c = self._cell_rc[cell]
+            ys, xs = np.nonzero(self._sprites[sprite])
+            ys = ys + BOARD_OFFSET + CELL*r - _MARGIN
+            xs = xs + BOARD_OFFSET + CELL*c - _MARGIN
+            inside = (ys >= BOARD_OFFSET) & (ys < self.size) & (xs >= BOARD_OFFSET) & (xs < self.size)
+            indices = self._pixels[key] = ys[inside] * self.size + xs[inside]
+        return indices
+
+    # draws one snapshot into out, a C-contiguous (H, W, 3) uint8 array,
+    # or a new array
+    def draw(self, state, out=None):
+        if out is None:
+            out = np.empty((self.size, self.size, 3), dtype=np.uint8)
+        self.draw_batch([state], out[None])
+        return out
+
+    # draws a sequence of snapshots, a trajectory or the sub-environments of a
+    # vector env, into out, a C-contiguous (T, H, W, 3) uint8 array, or a new array
+    def draw_batch(self, states, out=None):
+        if out is None:
+            out = np.empty((len(states), self.size, self.size, 3), dtype=np.uint8)
+        out[:] = self.background
+        # a view, so a non-contiguous out fails instead of being drawn into a copy
+        flat = out.view()
+        flat.shape = (-1, 3)
+
+        frame_pixels = self.size * self.size
+        layers = [[] for _ in self._colors]
+        for t, (player_cell, _, _, gates, enemy_cells, enemy_dirs) in enumerate(states):
+            base = t * frame_pixels
+            for cell, sprite, rot in zip(self._gate_cell, self._gate_sprite, gates):
+                layers[0].append(self._indices(cell, sprite + rot) + base)
+            layers[1].append(self._indices(player_cell, 8) + base)
+            for layer, cell, direction in zip(self._enemy_layer, enemy_cells, enemy_dirs):
+                layers[layer].append(self._indices(cell, 9 + direction) + base)
+
+        for layer, color in zip(layers, self._colors):
+            if layer:
+                flat[np.concatenate(layer)] = color
+        return out
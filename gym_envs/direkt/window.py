@@ -0,0 +1,109 @@
+import pygame
+
+from gym_envs.direkt.raster import BOARD_OFFSET, CELL, ENEMY_COLORS, ENEMY_POINTS, GATE_POINTS, STRAIGHT_GATE_POINTS
+
+
+class Window:
+    """The pygame window of ``Direkt_v0``'s human render mode.
+
+    Only imported once a human render is asked for, so headless envs never
+    load pygame. The walkable tiles are drawn once into a background; of the
+    gates and agents only the cells whose contents changed since the last
+    frame are redrawn and pushed to the display.
+    """
+
+    def __init__(self, template, size=512, fps=60):
+        pygame.init()
+        pygame.display.init()
+        self.size = size
+        self.fps = fps
+        self.surface = pygame.display.set_mode((size, size))
+        self.clock = pygame.time.Clock()
+        self.board = pygame.Rect(BOARD_OFFSET, BOARD_OFFSET, size - BOARD_OFFSET, size - BOARD_OFFSET)
+        self.background = _draw_background(template, size)
+        self.canvas = None
+        self._cells = None
+
+    def draw(self, level):
+        scene = _scene(level)
+        cells = {}
+        for item in scene:
+            cells.setdefault(item[1:3], []).append(item)
+
+        canvas = self.canvas
+        if canvas is None:
+            canvas = self.canvas = self.background.copy()
+            canvas.set_clip(self.board)
+            for item in scene:
+                _draw_item(canvas, item)
+            dirty = [canvas.get_rect()]
+        else:
+            dirty = []
+            for cell in cells.keys() | self._cells.keys():
+                if cells.get(cell) == self._cells.get(cell):
+                    continue
+                # drawings spill at most a pixel into the neighbouring cells
+                r, c = cell
+                rect = pygame.Rect(BOARD_OFFSET + CELL*c - 2, BOARD_OFFSET + CELL*r - 2, CELL + 4, CELL + 4).clip(self.board)
+                canvas.set_clip(rect)
+                canvas.blit(self.background, rect, rect)
+                for item in scene:
+                    if abs(item[1] - r) <= 1 and abs(item[2] - c) <= 1:
+                        _draw_item(canvas, item)
+                dirty.append(rect)
+        self._cells = cells
+
+        # The following lines copy the changed parts of `canvas` to the visible window
+        for rect in dirty:
+            self.surface.blit(canvas, rect, rect)
+        pygame.event.pump()
+        pygame.display.update(dirty)
+
+        # We need to ensure that human-rendering occurs at the predefined framerate.
+        # The following line will automatically add a delay to keep the framerate stable.
+        self.clock.tick(self.fps)
+
+
+# white window with the walkable tiles, the goal in red
+def _draw_background(template, size):
+    background = pygame.Surface((size, size))
+    background.fill((255, 255, 255))
+    for r, row in enumerate(template.locations):
+        for c, tile in enumerate(row):
+            if tile == 0:
+                continue
+
+            color = (200,200,200)
+            if tile == 9:
+                color = (255,0,0)
+            pygame.draw.rect(background, color, (BOARD_OFFSET + CELL*c, BOARD_OFFSET + CELL*r, 23,23))
+    return background
+
+
+# everything drawn over the background, in drawing order: gates, the
+# player, then slow, normal and fast enemies, see _draw_item
+def _scene(level):
+    template = level.template
+    gate_cells = [(r, c, "gate") for r, c, _ in template.gates] + [(r, c, "straight") for r, c, _ in template.straight_gates]
+    scene = [(kind, r, c, blocked[0]) for (r, c, kind), blocked in zip(gate_cells, level.get_gate_directions())]
+    player = level.get_player_location()
+    scene.append(("player", player[0], player[1], 0))
+    for kind in ("slow", "normal", "fast"):
+        scene += [(kind, r, c, direction) for r, c, direction in level.get_enemy_states(kind)]
+    return scene
+
+
+# draws one item of _scene, (kind, row, col, rotation or direction)
+def _draw_item(canvas, item):
+    kind, r, c, rot = item
+    x = BOARD_OFFSET + CELL*c
+    y = BOARD_OFFSET + CELL*r
+    if kind == "gate":
+        pygame.draw.lines(canvas, (0,0,0), False, [(x+1+dx, y+1+dy) for dx, dy in GATE_POINTS[rot]], 3)
+    elif kind == "straight":
+        for points in STRAIGHT_GATE_POINTS[rot % 2]:
+            pygame.draw.lines(canvas, (0,0,0), False, [(x+dx, y+dy) for dx, dy in points], 3)
+    elif kind == "player":
+        pygame.draw.circle(canvas, (255,255,255), (x+12.5, y+12.5), 10)
+    else:
+        pygame.draw.polygon(canvas, ENEMY_COLORS[kind], [(x+12.5+dx, y+12.5+dy) for dx, dy in ENEMY_POINTS[rot]])
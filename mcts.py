@@ -0,0 +1,505 @@
+"""Monte Carlo tree search for direkt levels.
+
+Plans against ``Level``/``ArrayLevel`` through their ``get_state``/
+``set_state`` snapshots, so memory grows with the states the search visits
+rather than with every state the level could be in, which is what a dense q
+table has to allocate.
+
+Each simulation walks down the tree by UCT over the valid actions of every
+state, adds the first new state it reaches and plays a rollout from there:
+with probability --greedy a move that brings the player closer to the goal,
+otherwise any valid action, and an action that loses is taken back for
+another one while there is one. Rollouts that run out of steps are scored by
+their rewards minus the distance still to go. The game is deterministic, so
+actions keep the best return seen after them rather than the mean, and as
+soon as any simulation wins its actions are a solution. Tree nodes are keyed
+by the snapshot with the player direction and tick reduced like
+``solver.Search`` does, so transpositions share one node.
+
+After --simulations simulations from the current state the action with the
+best return is played, until a win is found or --max-moves run out. --batch
+N selects N leaves at a time and plays their rollouts together on a
+``DirektVector_v0``; on one core that only pays off from a few hundred.
+--workers N runs N independent searches per move, one in each of N
+processes with seeds --seed + i, and merges their root statistics.
+
+    python mcts.py level19 level20 [--simulations N] [--batch N] [--workers N] [--episodes N]
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+import numpy as np
+
+from gym_envs.direkt.array_level import ArrayLevel, LevelArrays
+from gym_envs.direkt.direkt_v0 import Level, StateLayout
+from gym_envs.direkt.direkt_vector import DirektVector_v0
+from solver import Solution, goal_distances, level_sheet, write_solution
+
+# Direkt_v0's reward for an action result, except that the search charges
+# more for losing: with -100 a game lost at once outscores one that survives
+# for over 100 steps, and rollouts that survive should always rank higher
+REWARD = {-1: -300, 0: -1, 1: 200}
+# returns are divided by this before the UCT exploration term is added
+VALUE_SCALE = 500.0
+
+
+class Node:
+    __slots__ = ("actions", "children", "results", "n", "best", "visits")
+
+    def __init__(self, actions):
+        self.actions = actions
+        # per valid action: snapshot key of the next state and the action
+        # result, both None until the action was tried once
+        self.children = [None] * len(actions)
+        self.results = [None] * len(actions)
+        # visits and the best return seen through each action
+        self.n = [0] * len(actions)
+        self.best = [-math.inf] * len(actions)
+        self.visits = 0
+
+
+class MCTS:
+
+    def __init__(self, level, engine="array", simulations=1000, c=.5, rollout_depth=50, greedy=.5, batch_size=1, seed=None):
+        sheet = level_sheet(level)
+        if engine == "object":
+            self.game = Level(sheet)
+        elif engine == "array":
+            self.game = ArrayLevel(sheet)
+        else:
+            raise ValueError(f"unknown engine {engine!r}, expected 'object' or 'array'")
+        self.layout = StateLayout(self.game.template)
+        arrays = LevelArrays.load(self.game.template)
+        self.goal_distance = goal_distances(arrays)
+        self.neighbor = arrays.neighbor.tolist()
+
+        self.simulations = simulations
+        self.c = c
+        self.rollout_depth = rollout_depth
+        self.greedy = greedy
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+
+        if batch_size > 1:
+            self.vector = DirektVector_v0(batch_size, level=sheet, copy=False)
+            self.np_rng = np.random.default_rng(seed)
+            # distances padded with a last entry for the missing neighbor -1
+            self._distance = np.append(np.array(self.goal_distance, dtype=float), math.inf)
+            self._neighbor = arrays.neighbor.astype(np.int64)
+
+        self.clear()
+
+    # forgets the tree and the counters
+    def clear(self):
+        self.table = {}
+        self.num_simulations = 0
+        self.search_time = 0.0
+        self.transpositions = 0
+
+    # snapshot with the player direction and tick reduced to what can change
+    # how the game continues, so equivalent states share one node
+    def key(self, state):
+        cell, direction, tick, gates, enemy_cell, enemy_dir = state
+        return (
+            cell,
+            direction if self.layout.track_direction else 0,
+            tick % 2 if self.layout.track_parity else 0,
+            gates,
+            enemy_cell,
+            enemy_dir,
+        )
+
+    # Runs simulations from the game state and returns the root node and the
+    # shortest winning action sequence found from it (None if there is none).
+    def search(self, state, simulations=None):
+        simulations = self.simulations if simulations is None else simulations
+        root = self.key(state)
+        if root not in self.table:
+            self.game.set_state(root)
+            self.table[root] = Node(self.game.get_valid_actions())
+
+        start = time.perf_counter()
+        if self.batch_size > 1:
+            best = self._search_batch(root, simulations)
+        else:
+            best = None
+            for _ in range(simulations):
+                path, actions, rewards, leaf = self._descend(root)
+                value = 0.0
+                if leaf is not None:
+                    value, rollout_actions, result = self._rollout(leaf)
+                    actions += rollout_actions
+                else:
+                    result = path[-1][0].results[path[-1][1]]
+                if result == 1 and (best is None or len(actions) < len(best)):
+                    best = actions
+                self._backup(path, rewards, value)
+        self.num_simulations += simulations
+        self.search_time += time.perf_counter() - start
+        return self.table[root], best
+
+    # Plays one game from the start of the level, returns a Solution whose
+    # actions are None if no win was found within max_moves. With a
+    # SearchPool its workers search every move instead of this planner.
+    def solve(self, max_moves=100, pool=None):
+        start = time.perf_counter()
+        self.clear()
+        nodes = 0
+        self.game.reset()
+        state = self.game.get_state()
+        played = []
+        while len(played) < max_moves:
+            if pool is None:
+                node, best = self.search(state)
+                edges = list(zip(node.actions, node.n, node.best, node.results, node.children))
+            else:
+                # the workers search at the same time, so their time is the wall time
+                searched = time.perf_counter()
+                found = pool.search(state, len(played) == 0)
+                self.search_time += time.perf_counter() - searched
+                self.num_simulations += sum(f[2] for f in found)
+                nodes = sum(f[3] for f in found)
+                edges, best = _merge(found)
+            if best is not None:
+                played += best
+                break
+
+            action, _, _, result, child = max(edges, key=lambda e: (e[2], e[1]))
+            played.append(action)
+            if result != 0:
+                played = None
+                break
+            state = child
+        else:
+            played = None
+
+        if pool is None:
+            nodes = len(self.table)
+        return Solution(played, nodes, self.transpositions, nodes, time.perf_counter() - start)
+
+    # -------------------------------
+    # Tree
+    # -------------------------------
+    def _select(self, node):
+        untried = [i for i, n in enumerate(node.n) if n == 0]
+        if untried:
+            return self.rng.choice(untried)
+        log_visits = math.log(node.visits)
+        best = 0
+        best_score = -math.inf
+        for i, (n, value) in enumerate(zip(node.n, node.best)):
+            score = value / VALUE_SCALE + self.c * math.sqrt(log_visits / n)
+            if score > best_score:
+                best = i
+                best_score = score
+        return best
+
+    # Walks down by UCT until an action ends the game or reaches a state that
+    # is new or already on the path. Returns the (node, edge) path, its
+    # actions and rewards and the state to roll out from, None if the game ended.
+    def _descend(self, root):
+        game = self.game
+        path = []
+        actions = []
+        rewards = []
+        state = root
+        seen = {root}
+        while True:
+            node = self.table[state]
+            i = self._select(node)
+            path.append((node, i))
+            actions.append(node.actions[i])
+            result = node.results[i]
+            at_child = False
+            if result is None:
+                game.set_state(state)
+                result = node.results[i] = game.take_action(node.actions[i])
+                if result == 0:
+                    node.children[i] = self.key(game.get_state())
+                    at_child = True
+            rewards.append(REWARD[result])
+            if result != 0:
+                return path, actions, rewards, None
+
+            state = node.children[i]
+            if state not in self.table:
+                if not at_child:
+                    game.set_state(state)
+                self.table[state] = Node(game.get_valid_actions())
+                return path, actions, rewards, state
+            if at_child:
+                self.transpositions += 1
+            if state in seen:
+                return path, actions, rewards, state
+            seen.add(state)
+
+    # The game is deterministic, so an action is worth the best return ever
+    # seen after it; averaging would rate a state by how likely random play
+    # from it is to lose, which makes losing at once look better than most
+    # other moves. visit=False when _search_batch already counted the visit.
+    def _backup(self, path, rewards, value, visit=True):
+        for (node, i), reward in zip(reversed(path), reversed(rewards)):
+            value += reward
+            if value > node.best[i]:
+                node.best[i] = value
+            if visit:
+                node.n[i] += 1
+                node.visits += 1
+
+    # -------------------------------
+    # Rollouts
+    # -------------------------------
+    # Returns the rollout's return, its actions and the result it ended with.
+    def _rollout(self, state):
+        game = self.game
+        game.set_state(state)
+        rng = self.rng
+        distance = self.goal_distance
+        neighbor = self.neighbor
+        cell = state[0]
+        total = 0.0
+        actions = []
+        for _ in range(self.rollout_depth):
+            valid = game.get_valid_actions()
+            closer = None
+            if rng.random() < self.greedy:
+                closer = [a for a in valid if a < 4 and distance[neighbor[cell][a]] < distance[cell]]
+            action = rng.choice(closer or valid)
+            # an action that loses is taken back and another one tried, the
+            # rollout only loses when every action does
+            before = game.get_state()
+            result = game.take_action(action)
+            if result == -1:
+                others = [a for a in valid if a != action]
+                rng.shuffle(others)
+                for action in others:
+                    game.set_state(before)
+                    result = game.take_action(action)
+                    if result != -1:
+                        break
+            actions.append(action)
+            total += REWARD[result]
+            if result != 0:
+                return total, actions, result
+            if action < 4:
+                cell = neighbor[cell][action]
+        return total - min(distance[cell], self.rollout_depth), actions, 0
+
+    # _rollout for up to batch_size states at once
+    def _rollout_batch(self, states):
+        env = self.vector
+        size = self.batch_size
+        k = len(states)
+        env.set_states(states + [states[0]] * (size - k))
+        alive = np.arange(size) < k
+        total = np.zeros(size)
+        result = np.zeros(size, dtype=np.int8)
+        length = np.full(size, self.rollout_depth)
+        actions = np.zeros((self.rollout_depth, size), dtype=np.int64)
+        distance = self._distance
+        # REWARD by result, -1 indexes the last entry
+        rewards = np.array([REWARD[0], REWARD[1], REWARD[-1]], dtype=float)
+
+        for t in range(self.rollout_depth):
+            cell = env.player_cell
+            valid = env.get_action_masks()
+            score = self.np_rng.random((size, 7))
+            greedy = self.np_rng.random(size) < self.greedy
+            closer = distance[self._neighbor[cell]] < distance[cell][:, None]
+            score[:, :4] += closer & greedy[:, None]
+            score[~valid] = -1
+            action = score.argmax(axis=1)
+
+            # like _rollout, rows that lose retry with another action; every
+            # row is stepped again, the others get the same result
+            before = env.snapshot()
+            while True:
+                step = env.take_actions(action)
+                lost = alive & (step == -1)
+                valid[lost, action[lost]] = False
+                retry = lost & valid.any(axis=1)
+                if not retry.any():
+                    break
+                score[~valid] = -1
+                action = np.where(retry, score.argmax(axis=1), action)
+                env.restore(before)
+            actions[t] = action
+
+            ended = alive & (step != 0)
+            result[ended] = step[ended]
+            total += np.where(alive, rewards[step], 0)
+            length[ended] = t + 1
+            alive &= step == 0
+            if not alive.any():
+                break
+
+        # rows that are still running
+        total[alive] -= np.minimum(distance[env.player_cell[alive]], self.rollout_depth)
+        return [(total[i], actions[:length[i], i].tolist(), result[i]) for i in range(k)]
+
+    # Collects batch_size leaves, counting each visit before its rollout is
+    # played (a virtual loss of exploration bonus) to steer the following
+    # selections elsewhere, then rolls them out together.
+    def _search_batch(self, root, simulations):
+        best = None
+        done = 0
+        while done < simulations:
+            pending = []
+            for _ in range(min(self.batch_size, simulations - done)):
+                path, actions, rewards, leaf = self._descend(root)
+                if leaf is None:
+                    if path[-1][0].results[path[-1][1]] == 1 and (best is None or len(actions) < len(best)):
+                        best = actions
+                    self._backup(path, rewards, 0.0)
+                    continue
+                for node, i in path:
+                    node.n[i] += 1
+                    node.visits += 1
+                pending.append((path, actions, rewards, leaf))
+            done += self.batch_size
+
+            if not pending:
+                continue
+            rollouts = self._rollout_batch([leaf for _, _, _, leaf in pending])
+            for (path, actions, rewards, _), (value, rollout_actions, result) in zip(pending, rollouts):
+                if result == 1 and (best is None or len(actions) + len(rollout_actions) < len(best)):
+                    best = actions + rollout_actions
+                self._backup(path, rewards, value, visit=False)
+        return best
+
+
+# -------------------------------
+# Root parallelism, one MCTS per worker process
+# -------------------------------
+class SearchPool:
+    """``num_workers`` processes that each keep their own MCTS of a level.
+
+    Worker i plans with seed ``seed + i`` and has its own inbox, so every
+    ``search`` runs exactly one search in each worker, on the tree that worker
+    kept from the moves before. ``close`` stops the workers.
+    """
+
+    def __init__(self, level, kwargs, num_workers, seed=None):
+        self.num_workers = num_workers
+        self.inboxes = [multiprocessing.Queue() for _ in range(num_workers)]
+        self.outbox = multiprocessing.Queue()
+        self.workers = []
+        for worker, inbox in enumerate(self.inboxes):
+            args = (level, kwargs, seed + worker if seed is not None else None, worker, inbox, self.outbox)
+            self.workers.append(multiprocessing.Process(target=_search_worker, args=args, daemon=True))
+        for process in self.workers:
+            process.start()
+
+    # what every worker found searching state, in worker order, see
+    # _search_worker; fresh drops the trees of an earlier game first
+    def search(self, state, fresh):
+        for inbox in self.inboxes:
+            inbox.put((state, fresh))
+        found = [None] * self.num_workers
+        for _ in range(self.num_workers):
+            while True:
+                try:
+                    worker, result = self.outbox.get(timeout=1)
+                    break
+                except queue.Empty:
+                    if any(p.exitcode not in (None, 0) for p in self.workers):
+                        raise Exception("a search worker died")
+            found[worker] = result
+        return found
+
+    def close(self):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.workers:
+            process.join()
+
+
+# searches every state put in the inbox until it gets None, puts the root
+# edges, the win found, the simulations run and the tree size in the outbox
+def _search_worker(level, kwargs, seed, worker, inbox, outbox):
+    planner = MCTS(level, seed=seed, **kwargs)
+    while True:
+        task = inbox.get()
+        if task is None:
+            break
+        state, fresh = task
+        if fresh:
+            planner.clear()
+        node, best = planner.search(state)
+        edges = list(zip(node.actions, node.n, node.best, node.results, node.children))
+        outbox.put((worker, (edges, best, planner.simulations, len(planner.table))))
+
+
+# sums the root visits of every worker and keeps the best return per action
+# and the shortest win
+def _merge(found):
+    merged = {}
+    best = None
+    for edges, worker_best, _, _ in found:
+        for action, n, value, result, child in edges:
+            if result is None:
+                continue
+            _, total, best_value, _, _ = merged.get(action, (action, 0, -math.inf, result, child))
+            merged[action] = (action, total + n, max(best_value, value), result, child)
+        if worker_best is not None and (best is None or len(worker_best) < len(best)):
+            best = worker_best
+    return list(merged.values()), best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve direkt levels by Monte Carlo tree search.")
+    parser.add_argument("levels", nargs="+", help="level names (level19) or paths relative to gym_envs/direkt")
+    parser.add_argument("--simulations", type=int, default=1000, help="simulations per move (per worker)")
+    parser.add_argument("--episodes", type=int, default=5, help="games played per level")
+    parser.add_argument("--max-moves", type=int, default=100)
+    parser.add_argument("--rollout-depth", type=int, default=50)
+    parser.add_argument("--greedy", type=float, default=.5, help="chance of a rollout step towards the goal")
+    parser.add_argument("--c", type=float, default=.5, help="UCT exploration constant")
+    parser.add_argument("--batch", type=int, default=1, help="rollouts played together on a vector env")
+    parser.add_argument("--workers", type=int, default=1, help="processes searching from the root in parallel")
+    parser.add_argument("--engine", choices=["object", "array"], default="array")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--write", action="store_true", help="append the shortest solution to models/<level>.npy_solution.csv")
+    args = parser.parse_args()
+
+    kwargs = dict(engine=args.engine, simulations=args.simulations, c=args.c, rollout_depth=args.rollout_depth,
+                  greedy=args.greedy, batch_size=args.batch)
+    # nodes is the mean tree size per game, summed over the workers
+    print(f"{'level':<12}{'solved':>8}{'best':>6}{'mean':>8}{'sims/s':>10}{'nodes':>10}{'time (s)':>10}")
+    for level in args.levels:
+        planner = MCTS(level, seed=args.seed, **kwargs)
+        pool = None
+        if args.workers > 1:
+            pool = SearchPool(level, kwargs, args.workers, args.seed)
+
+        solutions = []
+        simulations = 0
+        search_time = 0.0
+        try:
+            for _ in range(args.episodes):
+                solutions.append(planner.solve(max_moves=args.max_moves, pool=pool))
+                simulations += planner.num_simulations
+                search_time += planner.search_time
+        finally:
+            if pool is not None:
+                pool.close()
+
+        solved = [s for s in solutions if s.actions is not None]
+        best = min(solved, key=lambda s: len(s.actions)) if solved else None
+        mean = sum(len(s.actions) for s in solved) / len(solved) if solved else math.nan
+        name = os.path.splitext(os.path.basename(level))[0]
+        nodes = sum(s.nodes_expanded for s in solutions) // len(solutions)
+        wall_time = sum(s.wall_time for s in solutions)
+        print(f"{name:<12}{len(solved):>4}/{len(solutions):<3}{len(best.actions) if best else '-':>6}{mean:>8.1f}"
+              f"{simulations / search_time:>10.0f}{nodes:>10}{wall_time:>10.2f}")
+        if args.write and best is not None:
+            write_solution(name, best, source="mcts")
+
+
+if __name__ == "__main__":
+    main()
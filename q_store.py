@@ -0,0 +1,380 @@
+"""Q-table backends for qvalue_learner.
+
+The dense backend is a plain ``(num_states, 7)`` NumPy array, memory-mapped
+from its .npy model by ``MappedQTable`` so only the rows training touches are
+read into RAM and a checkpoint only writes the rows changed since the last
+one. ``SparseQTable``
+only stores the states that were actually updated: an open-addressing hash
+maps state ids to rows of a growable float32 array, so levels whose full
+state space would need gigabytes train in a few megabytes. With ``max_bytes``
+set, the least visited states are evicted whenever the table would grow past
+the cap, and evicted states read as 0 again, like states never seen.
+
+Both backends support the indexing the learner uses: ``q[state]`` for a row,
+``q[state, action]`` for a value, and the same with arrays of states/actions.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+EMPTY = -1
+# multiplicative hashing, 2**64 / golden ratio
+_GOLDEN = 0x9E3779B97F4A7C15
+_U64 = (1 << 64) - 1
+
+
+class SparseQTable:
+
+    # bytes per stored state besides the hash: the float32 row, its visit
+    # count and its key
+    @staticmethod
+    def bytes_per_state(num_actions):
+        return num_actions * 4 + 4 + 8
+
+    # the most states, and the hash slots for them, whose arrays fit in
+    # max_bytes; the hash has a power of two slots of key + row index, at
+    # least two per state
+    @classmethod
+    def capacity(cls, max_bytes, num_actions):
+        row_bytes = cls.bytes_per_state(num_actions)
+        best = (0, 0)
+        slots = 2
+        while slots * (8 + 4) + row_bytes <= max_bytes:
+            states = min(slots // 2, (max_bytes - slots * (8 + 4)) // row_bytes)
+            if states > best[0]:
+                best = (states, slots)
+            slots *= 2
+        if best[0] == 0:
+            raise ValueError(f"max_bytes={max_bytes} cannot hold a single state")
+        return best
+
+    def __init__(self, num_actions=7, max_bytes=None, initial_capacity=1024, evict_fraction=0.25):
+        self.num_actions = num_actions
+        self.max_bytes = max_bytes
+        self.evict_fraction = evict_fraction
+        self.max_states = None
+        self.max_slots = None
+        if max_bytes is not None:
+            self.max_states, self.max_slots = self.capacity(max_bytes, num_actions)
+            initial_capacity = min(initial_capacity, self.max_states)
+        self.evictions = 0
+        # what the last save or the loaded file was checkpointed with, see save
+        self.meta = {}
+
+        self.size = 0
+        self._values = np.zeros((initial_capacity, num_actions), dtype=np.float32)
+        self._visits = np.zeros(initial_capacity, dtype=np.uint32)
+        self._row_keys = np.full(initial_capacity, EMPTY, dtype=np.int64)
+        self._make_hash(2 * initial_capacity)
+
+    # a power of two slots, at least `slots`, at most max_slots
+    def _make_hash(self, slots):
+        bits = max(1, int(slots - 1).bit_length())
+        if self.max_slots is not None:
+            bits = min(bits, self.max_slots.bit_length() - 1)
+        self._shift = 64 - bits
+        self._mask = (1 << bits) - 1
+        self._keys = np.full(1 << bits, EMPTY, dtype=np.int64)
+        self._slot_rows = np.zeros(1 << bits, dtype=np.int32)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self._values.nbytes + self._visits.nbytes + self._row_keys.nbytes + self._keys.nbytes + self._slot_rows.nbytes
+
+    # -------------------------------
+    # Hash lookups
+    # -------------------------------
+    def _slot(self, state):
+        i = ((state * _GOLDEN) & _U64) >> self._shift
+        keys = self._keys
+        while True:
+            k = keys[i]
+            if k == state or k == EMPTY:
+                return i
+            i = (i + 1) & self._mask
+
+    # vectorised _slot for an int64 array of states
+    def _slots(self, states):
+        slots = ((states.astype(np.uint64) * np.uint64(_GOLDEN)) >> np.uint64(self._shift)).astype(np.int64)
+        pending = np.arange(len(states))
+        while pending.size:
+            k = self._keys[slots[pending]]
+            searching = (k != states[pending]) & (k != EMPTY)
+            pending = pending[searching]
+            slots[pending] = (slots[pending] + 1) & self._mask
+        return slots
+
+    # rows of the given states, -1 for states that are not stored
+    def _rows(self, states):
+        slots = self._slots(states)
+        return np.where(self._keys[slots] == states, self._slot_rows[slots], -1)
+
+    # -------------------------------
+    # Inserting, growing and evicting
+    # -------------------------------
+    def _insert(self, states):
+        """Stores the given distinct, not yet stored states with zero rows."""
+        n = len(states)
+        if self.max_states is not None and self.size + n > self.max_states:
+            self._evict(self.size + n - self.max_states)
+            n = min(n, self.max_states)
+            states = states[:n]
+        if self.size + n > len(self._values):
+            self._grow_rows(self.size + n)
+        if 2 * (self.size + n) > len(self._keys):
+            self._rehash(4 * (self.size + n))
+
+        rows = np.arange(self.size, self.size + n, dtype=np.int32)
+        self._row_keys[rows] = states
+        self._values[rows] = 0
+        self._visits[rows] = 0
+        self.size += n
+        self._place(states, rows)
+
+    def _place(self, states, rows):
+        while len(states):
+            slots = self._slots(states)
+            # several new states can land on the same empty slot, the first one wins
+            free, first = np.unique(slots, return_index=True)
+            self._keys[free] = states[first]
+            self._slot_rows[free] = rows[first]
+            left = np.ones(len(states), dtype=bool)
+            left[first] = False
+            states = states[left]
+            rows = rows[left]
+
+    def _grow_rows(self, needed):
+        capacity = max(needed, 2 * len(self._values))
+        if self.max_states is not None:
+            capacity = min(capacity, self.max_states)
+        values = np.zeros((capacity, self.num_actions), dtype=np.float32)
+        values[:self.size] = self._values[:self.size]
+        visits = np.zeros(capacity, dtype=np.uint32)
+        visits[:self.size] = self._visits[:self.size]
+        row_keys = np.full(capacity, EMPTY, dtype=np.int64)
+        row_keys[:self.size] = self._row_keys[:self.size]
+        self._values, self._visits, self._row_keys = values, visits, row_keys
+
+    def _rehash(self, slots):
+        self._make_hash(slots)
+        self._place(self._row_keys[:self.size].copy(), np.arange(self.size, dtype=np.int32))
+
+    # drops at least `needed` (and at least evict_fraction of) the least visited states
+    def _evict(self, needed):
+        drop = min(self.size, max(needed, int(self.size * self.evict_fraction)))
+        keep = np.sort(np.argsort(self._visits[:self.size], kind="stable")[drop:])
+        kept = len(keep)
+        self._values[:kept] = self._values[keep]
+        # halve the counts so states that were popular long ago can be evicted later
+        self._visits[:kept] = self._visits[keep] >> 1
+        self._row_keys[:kept] = self._row_keys[keep]
+        self._row_keys[kept:self.size] = EMPTY
+        self.size = kept
+        self.evictions += drop
+        self._rehash(len(self._keys))
+
+    # rows of the given states, inserting the missing ones. When a batch does
+    # not fit under max_bytes some of its states can end up with row -1.
+    def _rows_for_update(self, states):
+        rows = self._rows(states)
+        missing = rows < 0
+        if missing.any():
+            self._insert(np.unique(states[missing]))
+            rows = self._rows(states)
+        return rows
+
+    # -------------------------------
+    # ndarray-like indexing
+    # -------------------------------
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            states, actions = key
+        else:
+            states, actions = key, None
+
+        if np.ndim(states) == 0:
+            state = int(states)
+            slot = self._slot(state)
+            if self._keys[slot] != state:
+                row = np.zeros(self.num_actions, dtype=np.float32)
+            else:
+                row = self._values[self._slot_rows[slot]]
+            return row.copy() if actions is None else row[actions]
+
+        states = np.asarray(states, dtype=np.int64)
+        rows = self._rows(states)
+        values = np.where((rows >= 0)[:, None], self._values[np.maximum(rows, 0)], 0).astype(np.float32)
+        if actions is None:
+            return values
+        return values[np.arange(len(states)), actions]
+
+    def __setitem__(self, key, value):
+        states, actions = key
+        if np.ndim(states) == 0:
+            state = int(states)
+            slot = self._slot(state)
+            if self._keys[slot] != state:
+                self._insert(np.array([state], dtype=np.int64))
+                slot = self._slot(state)
+            row = self._slot_rows[slot]
+            self._values[row, actions] = value
+            self._visits[row] += 1
+            return
+
+        states = np.asarray(states, dtype=np.int64)
+        rows = self._rows_for_update(states)
+        stored = rows >= 0
+        self._values[rows[stored], np.broadcast_to(actions, rows.shape)[stored]] = np.broadcast_to(value, rows.shape)[stored]
+        np.add.at(self._visits, rows[stored], 1)
+
+    # -------------------------------
+    # Persistence
+    # -------------------------------
+    # writes an .npz archive to exactly `path` (np.savez would append .npz),
+    # through a temporary file so a crash leaves the previous save; meta, a
+    # JSON-able dict, is stored along and read back by from_npz
+    def save(self, path, meta=None):
+        self.meta = dict(meta or {})
+        _atomic_write(path, lambda f: np.savez(f, keys=self._row_keys[:self.size], values=self._values[:self.size],
+                                               visits=self._visits[:self.size], max_bytes=np.int64(-1 if self.max_bytes is None else self.max_bytes),
+                                               meta=json.dumps(self.meta)))
+
+    @classmethod
+    def from_npz(cls, data):
+        keys = data["keys"]
+        max_bytes = int(data["max_bytes"])
+        table = cls(num_actions=data["values"].shape[1], max_bytes=None if max_bytes < 0 else max_bytes,
+                    initial_capacity=max(1024, len(keys)))
+        table._insert(keys)
+        rows = table._rows(keys)
+        table._values[rows] = data["values"]
+        table._visits[rows] = data["visits"]
+        if "meta" in data:
+            table.meta = json.loads(str(data["meta"]))
+        return table
+
+
+class MappedQTable:
+    """Crash-consistent, incremental checkpoints of a dense .npy q table.
+
+    ``table`` is a copy-on-write memory map of the model: reads come from the
+    file, updates stay private to this process until ``checkpoint()``, so the
+    file on disk only ever holds a complete checkpoint. Callers report the
+    states they update with ``mark()``. A checkpoint
+
+      1. writes those rows to <model>_journal.npz and renames it into place,
+         which commits the checkpoint,
+      2. writes the rows into the model and flushes it,
+      3. renames the new <model>_meta.json into place and drops the journal.
+
+    A journal left behind by a crash between 1 and 3 is replayed when the
+    model is opened again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = f"{path}_journal.npz"
+        self.meta_path = f"{path}_meta.json"
+        self._dirty = []
+        self.meta = {"checkpoint": 0}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        if os.path.exists(self.journal_path):
+            with np.load(self.journal_path) as journal:
+                self._write_rows(journal["rows"], journal["values"])
+                meta = json.loads(str(journal["meta"]))
+            self._commit_meta(meta)
+        self._map()
+
+    # an all-zero model, written sparsely so creating a huge table is instant
+    @classmethod
+    def create(cls, path, shape, dtype=np.float64):
+        for stale in (f"{path}_journal.npz", f"{path}_meta.json"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape).flush()
+        return cls(path)
+
+    def _map(self):
+        # a plain ndarray view, memmap's subclass overhead is noticeable on small gathers
+        self.table = np.load(self.path, mmap_mode="c").view(np.ndarray)
+
+    # records that the rows of these states changed since the last checkpoint
+    def mark(self, states):
+        self._dirty.append(states)
+
+    def checkpoint(self, **meta):
+        rows = np.unique(np.concatenate(self._dirty)) if self._dirty else np.zeros(0, dtype=np.int64)
+        values = self.table[rows]
+        meta = dict(meta, checkpoint=self.meta["checkpoint"] + 1, rows=len(rows), time=time.time())
+
+        _atomic_write(self.journal_path, lambda f: np.savez(f, rows=rows, values=values, meta=json.dumps(meta)))
+        self._write_rows(rows, values)
+        self._commit_meta(meta)
+        self._dirty = []
+
+    # replaces the whole model, for tables that were updated elsewhere
+    def replace(self, q_table, **meta):
+        _atomic_write(self.path, lambda f: np.save(f, q_table))
+        meta = dict(meta, checkpoint=self.meta["checkpoint"] + 1, rows=len(q_table), time=time.time())
+        self._commit_meta(meta)
+        self._dirty = []
+        self._map()
+
+    def _write_rows(self, rows, values):
+        if len(rows) == 0:
+            return
+        model = np.load(self.path, mmap_mode="r+")
+        model[rows] = values
+        model.flush()
+        del model
+
+    def _commit_meta(self, meta):
+        _atomic_write(self.meta_path, lambda f: f.write(json.dumps(meta).encode()))
+        self.meta = meta
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+# writes a file through a temporary one that is synced and renamed over it
+def _atomic_write(path, write):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# meta is only kept by sparse tables, dense ones checkpoint it with MappedQTable
+def save_q_table(path, q_table, meta=None):
+    if isinstance(q_table, SparseQTable):
+        q_table.save(path, meta)
+    else:
+        np.save(path, q_table)
+
+
+def load_q_table(path):
+    data = np.load(path)
+    if isinstance(data, np.lib.npyio.NpzFile):
+        with data:
+            return SparseQTable.from_npz(data)
+    return data
+
+
+# Opens a model for training, returns (q_table, MappedQTable or None): dense
+# .npy models are memory-mapped, sparse .npz ones are loaded.
+def open_q_table(path):
+    data = np.load(path, mmap_mode="r")
+    if isinstance(data, np.lib.npyio.NpzFile):
+        with data:
+            return SparseQTable.from_npz(data), None
+    del data
+    mapped = MappedQTable(path)
+    return mapped.table, mapped
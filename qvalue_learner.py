@@ -5,200 +5,492 @@ import gym_envs
 import gymnasium as gym
 from datetime import datetime
 import math
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+from q_store import MappedQTable, SparseQTable, open_q_table, save_q_table
+
+
+class StateEncoder:
+    """Mixed-radix encoding of a Direkt_v0 observation into one integer.
+
+    The digits are, most significant first, player row and column, then row,
+    column and rotation of every enemy, then the rotation of every gate. This
+    is the axis order of the old N-dimensional q tables, so their C-order
+    reshape to (num_states, 7) lines up with the ids produced here.
+    """
+
+    def __init__(self, rows, cols, num_enemies, num_gates):
+        self.radices = [rows, cols] + [rows, cols, 4] * num_enemies + [4] * num_gates
+        # python ints, the product overflows int64 on large levels
+        self.num_states = math.prod(int(r) for r in self.radices)
+        if self.num_states >= 2 ** 63:
+            raise ValueError(f"{self.num_states} states do not fit an int64 state id, use obs_mode='state_id'")
+
+        # which entry of the flattened observation (see _flatten) feeds each digit
+        order = [0, 1]
+        for i in range(num_enemies):
+            order += [2 + num_gates + 2*i, 2 + num_gates + 2*i + 1, 2 + num_gates + 2*num_enemies + i]
+        order += [2 + g for g in range(num_gates)]
+        self._order = np.array(order, dtype=np.intp)
+        self._weights = np.array([math.prod(self.radices[i+1:]) for i in range(len(self.radices))], dtype=np.int64)
+        self.num_enemies = num_enemies
+        self.num_gates = num_gates
+
+    def _flatten(self, obs):
+        return np.concatenate((
+            obs["player"],
+            obs["gates"]["rotation"][:self.num_gates],
+            obs["enemies"]["location"][:2*self.num_enemies],
+            obs["enemies"]["rotation"][:self.num_enemies],
+        ))
+
+    def encode(self, obs):
+        return int(self._flatten(obs)[self._order] @ self._weights)
+
+
+# Reshapes an N-dimensional q table saved by older versions into (num_states, 7).
+# Returns True if the file was rewritten.
+def migrate_model(model_path):
+    data = np.load(model_path, mmap_mode="r")
+    if not isinstance(data, np.ndarray):
+        # a sparse .npz model, always (num_states, 7)
+        data.close()
+        return False
+    if data.ndim == 2:
+        return False
+    q_table = np.array(data)
+    del data
+    np.save(model_path, q_table.reshape(-1, q_table.shape[-1]))
+    return True
+
+
+# Runner attributes a resumed training run takes over from its checkpoint
+TRAINING_HYPERPARAMETERS = ("alpha", "bias_best", "gamma", "max_epsilon", "max_episode_steps", "mask_actions")
+
 
 class Runner:
 
-    def __init__(self, level, load=True, overwrite=False):
-        self.env = gym.make("direkt-v0", render_mode=None, level=f"levels/{level}.json")
+    # training hyper params
+    alpha = .01
+    bias_best = 1
+    gamma = .95
+    max_epsilon = .8
+    max_episode_steps = 100
+    # explore and exploit among the valid actions only, by the action_mask
+    # Direkt_v0 returns in info; False also draws invalid actions from the
+    # q table, which burn a step
+    mask_actions = True
+
+    # q_store="dense" keeps a (num_states, 7) array memory-mapped from the
+    # model (q_store.MappedQTable), q_store="sparse" a q_store.SparseQTable of
+    # the visited states only, capped at max_q_bytes
+    # model_dir defaults to models/ next to this file
+    # q_table, if given, is used as is instead of loading or creating one
+    # obs_mode="state_id" learns on Direkt_v0's id of the full game state,
+    # obs_mode="dict" on the StateEncoder id of the dict observation, which
+    # misses normal enemies; models trained before state ids need it
+    # profile=True times the game's phases (see Direkt_v0) and the learner's,
+    # and train writes where the time went to _profile.csv next to _progress.csv
+    def __init__(self, level, load=True, overwrite=False, q_store="dense", max_q_bytes=None, model_dir=None, q_table=None, obs_mode="state_id", profile=False):
+        if obs_mode not in ("state_id", "dict"):
+            raise ValueError(f"unknown obs_mode {obs_mode!r}, expected 'state_id' or 'dict'")
+        self.level = level
+        self.obs_mode = obs_mode
+        self.env = gym.make("direkt-v0", render_mode=None, level=f"levels/{level}.json", obs_mode=obs_mode, profile=profile)
+        self.profiler = self.env.unwrapped.profiler
+        if profile:
+            for name in ("_play_episode", "_get_greedy_action", "_q_update", "_checkpoint"):
+                self.profiler.wrap(self, name, f"runner.{name}")
 
         dir = os.path.dirname(os.path.realpath(__file__))
-        self.model_path = os.path.join(dir, f"models/{level}.npy")
+        if model_dir is None:
+            model_dir = os.path.join(dir, "models")
+        self.model_path = os.path.join(model_dir, f"{level}.npy")
         level_path = os.path.join(dir, f"gym_envs/direkt/levels/{level}.json")
         ld = json.load(open(level_path))
-        self.num_enemies = len(ld["slow_enemies"]) + len(ld["fast_enemies"])
-        self.num_gates = len(ld["gates"])
+        self.num_enemies = len(ld.get("slow_enemies", [])) + len(ld.get("fast_enemies", []))
+        self.num_gates = len(ld.get("gates", []))
 
-        if load:
-            self.q_table = np.load(self.model_path)
+        # q table needs entire state, encoded into a single state id, and one
+        # column per player action [0,6]. For obs_mode="dict" the state is
+        #   player r, player c
+        #   enemy1 r, enemy1 c, enemy1 rot ... enemyN r, enemyN c, enemyN rot 
+        #   gate1 rotation [0,3], ... gateN rotation [0,3]
+        if obs_mode == "state_id":
+            self.encoder = None
+            self.num_states = self.env.unwrapped.layout.num_states
+            self._encode = int
+        else:
+            dim = np.array(ld["level_setup"]).shape
+            self.encoder = StateEncoder(dim[0], dim[1], self.num_enemies, self.num_gates)
+            self.num_states = self.encoder.num_states
+            self._encode = self.encoder.encode
+
+        self.mapped = None
+        if q_table is not None:
+            self.q_table = q_table
+        elif load:
+            migrate_model(self.model_path)
+            self.q_table, self.mapped = open_q_table(self.model_path)
+            if isinstance(self.q_table, np.ndarray) and len(self.q_table) != self.num_states:
+                message = f"{self.model_path} has {len(self.q_table)} states, obs_mode={obs_mode!r} needs {self.num_states}"
+                if obs_mode == "state_id":
+                    message += "; models trained before state ids need obs_mode='dict'"
+                raise Exception(message)
         else:
             already_exists = os.path.exists(self.model_path)
             if not overwrite and already_exists:
                 raise Exception("You are about to erase existing trained data")
-            
-            
-            dim = np.array(ld["level_setup"]).shape
 
-            # q table needs entire state which is
-            #   player r, player c
-            #   enemy1 r, enemy1 c, enemy1 rot ... enemyN r, enemyN c, enemyN rot 
-            #   gate1 rotation [0,3], ... gateN rotation [0,3]
-            #   player action [0,6]
-            shape = []
-            shape.append(dim[0])
-            shape.append(dim[1])
-            for _ in range(self.num_enemies):
-                shape.append(dim[0])
-                shape.append(dim[1])
-                shape.append(4)
-            for _ in range(self.num_gates):
-                shape.append(4)
-            shape.append(7)
-
-            self.q_table = np.zeros(shape)
-            np.save(self.model_path, self.q_table)
+            if q_store == "dense":
+                self.mapped = MappedQTable.create(self.model_path, (self.num_states, 7))
+                self.q_table = self.mapped.table
+            elif q_store == "sparse":
+                self.q_table = SparseQTable(num_actions=7, max_bytes=max_q_bytes)
+                save_q_table(self.model_path, self.q_table)
+            else:
+                raise ValueError(f"unknown q_store {q_store!r}, expected 'dense' or 'sparse'")
             
         
 
     
-    def train(self):
-        # training hyper params
-        alpha = .01
-        bias_best = 1
-        num_episodes = 50000000
-        gamma = .95
-        max_epsilon = .8
-        max_episode_steps = 100
-
-        best_found_reward = -math.inf
-        best_history = ([], 0)
-
-        if os.path.exists(f'{self.model_path}_solution.csv'):
-            with open(f'{self.model_path}_solution.csv', 'rb') as f:
-                try:  # catch OSError in case of a one line file 
-                    f.seek(-2, os.SEEK_END)
-                    while f.read(1) != b'\n':
-                        f.seek(-2, os.SEEK_CUR)
-                except OSError:
-                    f.seek(0)
-                last_line = f.readline().decode()
-                data = last_line.split(',')
-                best_found_reward = int(data[3])
-        
-        for episode in range(num_episodes):
+    # resume=True continues the run that saved the model's last checkpoint,
+    # from the training state it was saved with (see _training_state): the
+    # next episode, the epsilon schedule over that run's num_episodes, the
+    # best trajectory, the hyperparameters and the NumPy RNG state, so the
+    # episodes after the checkpoint play out as they would have without the
+    # interruption. A model without one, or saved by train_parallel, starts
+    # over at episode 0.
+    def train(self, num_episodes=50000000, resume=False):
+        start = time.perf_counter_ns()
+        first_episode = 0
+        best_found_reward = self._read_best_reward()
+        best_history = ((np.zeros(0, dtype=np.int64),) * 3, 0)
+        state = self._checkpoint_meta().get("training") if resume else None
+        if state is not None:
+            first_episode, num_episodes, best_found_reward, best_history = self._restore_training(state)
+        # state id, action and next state id of every step of the current episode
+        history_buffer = np.zeros((3, self.max_episode_steps), dtype=np.int64)
+
+        for episode in range(first_episode, num_episodes):
             
-            epsilon = np.power(1 - episode / num_episodes,2) * max_epsilon
-            state, _ = self.env.reset()
+            epsilon = np.power(1 - episode / num_episodes,2) * self.max_epsilon
+            reward, actions, episode_action_list = self._play_episode(epsilon, history_buffer)
+            history = tuple(history_buffer[:, :actions])
 
-            terminated = False
-            reward = 0
-            actions = 0
-            episode_action_list = []
-            history = []
+            if reward > best_found_reward:
+                best_history = (tuple(history_buffer[:, :actions].copy()), reward)
+                best_found_reward = reward
+                self._write_solution(episode, epsilon, reward, episode_action_list)
             
-            while not terminated and actions < max_episode_steps:
-                # 1. decide action
-                action = self._get_greedy_action(state, epsilon)
+            # standard q learning update - learn from our last episode, then
+            # bias towards our best solution by retraining on it
+            self._q_update([(history, reward, self.alpha), (best_history[0], best_history[1], self.bias_best * self.alpha)], self.gamma)
 
-                # 2. take action
-                new_state, r, terminated, _, _ = self.env.step(action)
-                reward += r
-                actions += 1
-                episode_action_list.append(action)
-                if actions == max_episode_steps: # an additional penalty for running out of time
-                    reward -= 100
+            if episode % 1000 == 0 or episode == num_episodes - 1:
+                training = self._training_state(episode + 1, num_episodes, epsilon, best_found_reward, best_history)
+                self._checkpoint(episode=episode, training=training)
+                self._write_progress(episode, epsilon, reward, actions)
+                if self.profiler is not None:
+                    self._write_profile(time.perf_counter_ns() - start)
 
-                # print(f"p {state['player']} a {action} ns {new_state['player']}" )
+        if self.profiler is not None:
+            print(self.profiler.format(time.perf_counter_ns() - start))
 
-                # 3. save history for update later. 
-                history.append((state, action, new_state))
+    # Hogwild training: num_workers processes each play their own Direkt_v0
+    # and update one dense q table in shared memory without locking. Worker i
+    # runs num_episodes / num_workers episodes with seed seed + i and its own
+    # epsilon schedule, starting at max_epsilon * (1 - i / (2 * num_workers))
+    # so the workers range from exploring to exploiting. This process merges
+    # the best solutions the workers find, hands every new best to all of
+    # them to bias towards, and writes the _solution.csv/_progress.csv files.
+    # Episode numbers in them count the episodes of all workers.
+    def train_parallel(self, num_workers, num_episodes=50000000, seed=0):
+        if not isinstance(self.q_table, np.ndarray):
+            raise ValueError("parallel training needs the dense q_store")
 
-                # 4. update state to wherever we went
-                state = new_state
-            
-            # don't care if you fail quick or fail slow
-            if reward < 0:
-                reward = -100
+        shm = shared_memory.SharedMemory(create=True, size=self.q_table.nbytes)
+        try:
+            shared = np.ndarray(self.q_table.shape, dtype=self.q_table.dtype, buffer=shm.buf)
+            shared[:] = self.q_table
+            best_reward = multiprocessing.Value('d', self._read_best_reward())
+            inboxes = [multiprocessing.Queue() for _ in range(num_workers)]
+            outbox = multiprocessing.Queue()
+            workers = []
+            for worker in range(num_workers):
+                args = (self.level, self.obs_mode, os.path.dirname(self.model_path), shm.name, shared.shape, shared.dtype.str,
+                        worker, num_workers, num_episodes // num_workers + (worker < num_episodes % num_workers),
+                        seed + worker, best_reward, inboxes[worker], outbox)
+                workers.append(multiprocessing.Process(target=_train_worker, args=args, daemon=True))
+            for process in workers:
+                process.start()
 
-            if reward > best_found_reward:
-                best_history = (history, reward)
-                best_found_reward = reward
-                with open(f'{self.model_path}_solution.csv','a') as fd:
-                    episode_action_str = '.'.join([str(a) for a in episode_action_list])
-                    fd.write(','.join([datetime.now().strftime('%Y-%m-%d %H:%M:%S'), str(episode), str(epsilon), str(reward), episode_action_str]) + '\n')
-            
-            # standard q learning update - learn from our last episode
-            for (s, a, ns) in history:
+            running = num_workers
+            progress_reports = 0
+            while running:
+                try:
+                    message = outbox.get(timeout=1)
+                except queue.Empty:
+                    if any(p.exitcode not in (None, 0) for p in workers):
+                        raise Exception("a training worker died")
+                    continue
 
-                _, best_score = self._get_best_action_from(ns)
-                old_q_value = self._q_table(s, a)
-                updated_q_value = old_q_value + alpha * (reward + gamma * best_score - old_q_value)
-                self._q_table_update(s, a, updated_q_value)
+                kind, worker, episode, epsilon, reward = message[:5]
+                episode = episode * num_workers + worker
+                if kind == "best":
+                    if reward > best_reward.value:
+                        best_reward.value = reward
+                        self._write_solution(episode, epsilon, reward, message[5])
+                        for other, inbox in enumerate(inboxes):
+                            if other != worker:
+                                inbox.put((message[6], reward))
+                elif kind == "progress":
+                    self._write_progress(episode, epsilon, reward, message[5])
+                    progress_reports += 1
+                    if progress_reports % num_workers == 0:
+                        self._save_table(shared, episode=episode)
+                elif kind == "done":
+                    running -= 1
 
-            # bias towards our best solution by retraining on it
-            # print(f"doing biasing on best solution towards {best_history[1]}")
-            for (s, a, ns) in best_history[0]:
-                _, best_score = self._get_best_action_from(ns)
-                old_q_value = self._q_table(s, a)
-                updated_q_value = old_q_value + bias_best * alpha * (best_history[1] + gamma * best_score - old_q_value)
-                self._q_table_update(s, a, updated_q_value)
+            for process in workers:
+                process.join()
+            self.q_table = shared.copy()
+            self._save_table(self.q_table, episode=num_episodes - 1)
+        finally:
+            # views of the buffer must be gone before it can be closed
+            shared = None
+            shm.close()
+            shm.unlink()
 
-            if episode % 1000 == 0 or episode == num_episodes - 1:
-                np.save(self.model_path, self.q_table)
+    # saves the q table, only the rows updated since the last save if it is
+    # memory-mapped, with meta, which a plain array q table drops
+    def _checkpoint(self, **meta):
+        if self.mapped is not None:
+            self.mapped.checkpoint(**meta)
+        else:
+            save_q_table(self.model_path, self.q_table, meta)
+
+    # meta of the last checkpoint of the model
+    def _checkpoint_meta(self):
+        if self.mapped is not None:
+            return self.mapped.meta
+        if isinstance(self.q_table, SparseQTable):
+            return self.q_table.meta
+        return {}
 
-                with open(f'{self.model_path}_progress.csv','a') as fd:
-                    fd.write(','.join([datetime.now().strftime('%Y-%m-%d %H:%M:%S'), str(episode), str(epsilon), str(reward), str(actions)]) + '\n')
+    # Everything train needs to go on after episode - 1 besides the q table,
+    # as JSON for the checkpoint's meta. It is committed with the q table,
+    # so the two always match, even after a crash during a checkpoint.
+    def _training_state(self, episode, num_episodes, epsilon, best_found_reward, best_history):
+        rng = np.random.get_state()
+        return {
+            "episode": episode,
+            "num_episodes": num_episodes,
+            "epsilon": float(epsilon),
+            "best_found_reward": best_found_reward,
+            "best_history": [a.tolist() for a in best_history[0]],
+            "best_history_reward": best_history[1],
+            "rng": [rng[0], rng[1].tolist(), *rng[2:]],
+            "hyperparameters": {name: getattr(self, name) for name in TRAINING_HYPERPARAMETERS},
+            "obs_mode": self.obs_mode,
+        }
+
+    # restores a _training_state, returns the episode to go on from, the
+    # run's num_episodes, best reward and best history
+    def _restore_training(self, state):
+        if state["obs_mode"] != self.obs_mode:
+            raise Exception(f"{self.model_path} was trained with obs_mode={state['obs_mode']!r}, not {self.obs_mode!r}")
+        for name, value in state["hyperparameters"].items():
+            setattr(self, name, value)
+        rng = state["rng"]
+        np.random.set_state((rng[0], np.array(rng[1], dtype=np.uint32), *rng[2:]))
+        best_history = (tuple(np.array(a, dtype=np.int64) for a in state["best_history"]), state["best_history_reward"])
+        return state["episode"], state["num_episodes"], state["best_found_reward"], best_history
+
+    # saves a table that was updated outside of _q_update, a mapped model is
+    # replaced as a whole and mapped again
+    def _save_table(self, q_table, **meta):
+        if self.mapped is not None:
+            self.mapped.replace(q_table, **meta)
+            self.q_table = self.mapped.table
+        else:
+            save_q_table(self.model_path, q_table)
+
+    # plays one episode, recording the state id, action and next state id of
+    # every step in history_buffer. Returns the reward as training scores it,
+    # the number of steps and the list of actions.
+    def _play_episode(self, epsilon, history_buffer):
+        obs, info = self.env.reset()
+        state = self._encode(obs)
+
+        terminated = False
+        reward = 0
+        actions = 0
+        episode_action_list = []
+        
+        while not terminated and actions < self.max_episode_steps:
+            # 1. decide action
+            action = self._get_greedy_action(state, epsilon, info["action_mask"] if self.mask_actions else None)
+
+            # 2. take action
+            new_obs, r, terminated, _, info = self.env.step(action)
+            new_state = self._encode(new_obs)
+            reward += r
+            actions += 1
+            episode_action_list.append(action)
+            if actions == self.max_episode_steps: # an additional penalty for running out of time
+                reward -= 100
+
+            # 3. save history for update later. 
+            history_buffer[0, actions - 1] = state
+            history_buffer[1, actions - 1] = action
+            history_buffer[2, actions - 1] = new_state
+
+            # 4. update state to wherever we went
+            state = new_state
+
+        # don't care if you fail quick or fail slow
+        if reward < 0:
+            reward = -100
+        return reward, actions, episode_action_list
+
+    # reward of the last line of _solution.csv, -inf if there is none
+    def _read_best_reward(self):
+        if not os.path.exists(f'{self.model_path}_solution.csv'):
+            return -math.inf
+        with open(f'{self.model_path}_solution.csv', 'rb') as f:
+            try:  # catch OSError in case of a one line file 
+                f.seek(-2, os.SEEK_END)
+                while f.read(1) != b'\n':
+                    f.seek(-2, os.SEEK_CUR)
+            except OSError:
+                f.seek(0)
+            last_line = f.readline().decode()
+            data = last_line.split(',')
+            return int(data[3])
+
+    def _write_solution(self, episode, epsilon, reward, episode_action_list):
+        with open(f'{self.model_path}_solution.csv','a') as fd:
+            episode_action_str = '.'.join([str(a) for a in episode_action_list])
+            fd.write(','.join([datetime.now().strftime('%Y-%m-%d %H:%M:%S'), str(episode), str(epsilon), str(reward), episode_action_str]) + '\n')
+
+    def _write_progress(self, episode, epsilon, reward, actions):
+        with open(f'{self.model_path}_progress.csv','a') as fd:
+            fd.write(','.join([datetime.now().strftime('%Y-%m-%d %H:%M:%S'), str(episode), str(epsilon), str(reward), str(actions)]) + '\n')
     
-    # helper function to access q_table
+    # rewrites _profile.csv with the phases so far, their share of the elapsed ns of training
+    def _write_profile(self, elapsed):
+        with open(f'{self.model_path}_profile.csv','w') as fd:
+            fd.write('phase,calls,total_ms,mean_us,share\n')
+            fd.write(f'train,1,{elapsed / 1e6:.3f},{elapsed / 1e3:.3f},1\n')
+            for phase, calls, total, mean, share in self.profiler.summary(elapsed):
+                fd.write(f'{phase},{calls},{total:.3f},{mean:.3f},{share:.4f}\n')
+
+    # Q learning update for whole trajectories. Each trajectory is
+    # ((state ids, actions, next state ids), reward, alpha), with int64 arrays,
+    # and its steps are applied one after the other, in the given order, each
+    # target seeing the updates before it, like updating q after every step.
+    #
+    # Trajectories are short, so per step numpy indexing would cost more than
+    # the arithmetic: the rows of every state involved are gathered once into
+    # python lists, updated there and the changed values scattered back.
+    def _q_update(self, trajectories, gamma):
+        index = {}
+        steps = []
+        for (states, actions, next_states), reward, alpha in trajectories:
+            states = [index.setdefault(s, len(index)) for s in states.tolist()]
+            next_states = [index.setdefault(s, len(index)) for s in next_states.tolist()]
+            steps.append((zip(states, actions.tolist(), next_states), reward, alpha))
+        if not index:
+            return
+
+        ids = np.fromiter(index, dtype=np.int64, count=len(index))
+        rows = self.q_table[ids].tolist()
+        changed = set()
+        for trajectory, reward, alpha in steps:
+            for s, a, ns in trajectory:
+                row = rows[s]
+                row[a] += alpha * (reward + gamma * max(rows[ns]) - row[a])
+                changed.add(s * 7 + a)
+
+        s, a = np.divmod(np.fromiter(changed, dtype=np.int64, count=len(changed)), 7)
+        values = [rows[i][j] for i, j in zip(s.tolist(), a.tolist())]
+        s = ids[s]
+        if self.mapped is not None:
+            self.mapped.mark(s)
+        self.q_table[s, a] = values
+
+    # helper function to access q_table, states are encoded state ids
     def _q_table(self, state, action):
-        t = self.q_table
-        # plug in player
-        t = t[state["player"][0]]
-        t = t[state["player"][1]]
-
-        # plug in enemies
-        for i in range(self.num_enemies):
-            t = t[state["enemies"]["location"][2*i]] 
-            t = t[state["enemies"]["location"][2*i+1]]
-            t = t[state["enemies"]["rotation"][i]]
-        
-        # plug in gates
-        for i in range(self.num_gates):
-            t = t[state["gates"]["rotation"][i]]
-        
-        # plug in action
-        return t[action]
+        return self.q_table[state, action]
 
     # helper function to access q_table
     def _q_table_update(self, state, action, val):
-        t = self.q_table
-        
-        # plug in player
-        t = t[state["player"][0]]
-        t = t[state["player"][1]]
-
-        # plug in enemies
-        for i in range(self.num_enemies):
-            t = t[state["enemies"]["location"][2*i]] 
-            t = t[state["enemies"]["location"][2*i+1]]
-            t = t[state["enemies"]["rotation"][i]]
-        
-        # plug in gates
-        for i in range(self.num_gates):
-            t = t[state["gates"]["rotation"][i]]
-        
-        # plug in action and update
-        t[action] = val
+        self.q_table[state, action] = val
         
-    def _get_greedy_action(self, state, epsilon):
+    # action_mask, seven booleans, limits both choices to the valid actions
+    def _get_greedy_action(self, state, epsilon, action_mask=None):
         if np.random.uniform(0,1) < epsilon:
-            return np.random.choice(self.env.get_valid_actions())
+            if action_mask is None:
+                return np.random.choice(self.env.get_valid_actions())
+            return np.random.choice(np.flatnonzero(action_mask))
     
-        best_action, _ = self._get_best_action_from(state)
+        best_action, _ = self._get_best_action_from(state, action_mask)
+        return best_action
+
+    # first action with the highest q value, like scanning the actions in order
+    def _get_best_action_from(self, state, action_mask=None):
+        row = self.q_table[state]
+        if action_mask is None:
+            best_action = int(row.argmax())
+        else:
+            best_action = int(np.where(action_mask, row, -np.inf).argmax())
+        return best_action, row[best_action]
 
-        if state["player"][0] == 1 and state["player"][1] == 0:
-            print(f"best action is {best_action}")
 
-        return best_action
+# One process of Runner.train_parallel: the same loop as Runner.train on the
+# shared q table, reporting new best solutions and progress to the coordinator
+# and picking up the best trajectories other workers found from its inbox.
+def _train_worker(level, obs_mode, model_dir, shm_name, shape, dtype, worker, num_workers, num_episodes, seed, best_reward, inbox, outbox):
+    np.random.seed(seed)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        runner = Runner(level, model_dir=model_dir, q_table=np.ndarray(shape, dtype=dtype, buffer=shm.buf), obs_mode=obs_mode)
+        max_epsilon = runner.max_epsilon * (1 - worker / (2 * num_workers))
+        alpha = runner.alpha
+        best_history = ((np.zeros(0, dtype=np.int64),) * 3, 0)
+        history_buffer = np.zeros((3, runner.max_episode_steps), dtype=np.int64)
+
+        for episode in range(num_episodes):
+            epsilon = np.power(1 - episode / num_episodes,2) * max_epsilon
+            reward, actions, episode_action_list = runner._play_episode(epsilon, history_buffer)
+            history = tuple(history_buffer[:, :actions])
+
+            if episode % 100 == 0:
+                try:
+                    while True:
+                        found = inbox.get_nowait()
+                        if found[1] > best_history[1] or not len(best_history[0][0]):
+                            best_history = found
+                except queue.Empty:
+                    pass
+
+            if reward > best_reward.value:
+                best_history = (tuple(history_buffer[:, :actions].copy()), reward)
+                outbox.put(("best", worker, episode, epsilon, reward, episode_action_list, best_history[0]))
+
+            runner._q_update([(history, reward, alpha), (best_history[0], best_history[1], runner.bias_best * alpha)], runner.gamma)
+
+            if episode % 1000 == 0 or episode == num_episodes - 1:
+                outbox.put(("progress", worker, episode, epsilon, reward, actions))
 
-    def _get_best_action_from(self, state):
-        best_action = None
-        best_score = None
-        for action in range(7):
-            action_score = self._q_table(state, action)
-            if best_score == None or action_score > best_score:
-                best_score = action_score
-                best_action = action
-        return best_action, best_score
+        outbox.put(("done", worker, num_episodes, 0, 0))
+    finally:
+        runner = None
+        shm.close()
 
 
-Runner(level="level19", load=False).train()
\ No newline at end of file
+if __name__ == "__main__":
+    Runner(level="level19", load=False).train()
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Replays action sequences on a direkt level and checks what they achieve.
+
+Sequences are dot separated action strings, the format of the action column
+of models/<level>.npy_solution.csv. They are played headlessly on a
+DirektVector_v0, one sub-environment per distinct sequence, in batches of
+batch_size, so re-checking thousands of candidates after a rules change is a
+few NumPy steps per action. Actions follow Direkt_v0.step: invalid ones burn
+a step for -1.
+
+By default every line of the level's _solution.csv is replayed, and lines
+whose recorded reward is a win that no longer replays to that reward are
+reported and make the command fail. --frames renders the shortest winning
+sequence to a (T, H, W, 3) rgb_array frame stack saved with np.save.
+
+    python replay.py level19 [--actions 1.3.2.2 ...] [--from-file candidates.txt] [--frames level19.npy]
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+
+from gym_envs.direkt.array_level import ArrayLevel
+from gym_envs.direkt.direkt_vector import DirektVector_v0
+from gym_envs.direkt.raster import Rasterizer
+from solver import MODEL_DIR, level_sheet
+
+# level sheets are relative to it, see LevelTemplate.load
+GAME_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gym_envs", "direkt")
+OUTCOMES = {-1: "lose", 0: "timeout", 1: "win"}
+
+
+class Replay:
+    """Outcome of replaying action sequences, one entry per sequence.
+
+    ``outcome`` is -1 lost, 0 timeout (the actions or max_steps ran out) or 1
+    won; ``steps`` the number of actions played, so a sequence that ended the
+    game did so at action ``steps - 1``; ``reward`` what Direkt_v0 paid for them.
+    """
+
+    def __init__(self, outcome, steps):
+        self.outcome = outcome
+        self.steps = steps
+        self.reward = np.where(outcome == 1, 201 - steps, np.where(outcome == -1, -99 - steps, -steps))
+
+    def __len__(self):
+        return len(self.outcome)
+
+    def status(self, i):
+        return OUTCOMES[int(self.outcome[i])]
+
+
+def parse_actions(string):
+    tokens = [a for a in string.strip().split('.') if a]
+    if any(a not in "0123456" or len(a) != 1 for a in tokens):
+        raise ValueError(f"actions must be dot separated digits 0 to 6, got {string.strip()!r}")
+    return [int(a) for a in tokens]
+
+
+# parse_actions as an argparse type, a bad string is a usage error
+def action_string(string):
+    try:
+        return parse_actions(string)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+# the lines of models/<level>.npy_solution.csv as dicts, oldest first
+def read_solutions(level, model_dir=MODEL_DIR):
+    path = os.path.join(model_dir, f"{level}.npy_solution.csv")
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as f:
+        return [{"time": row[0], "source": row[1], "epsilon": row[2], "reward": int(row[3]), "actions": parse_actions(row[4])}
+                for row in csv.reader(f) if row]
+
+
+# Plays every sequence from the start of the level, stopping each at the
+# first action that ends the game or after max_steps actions.
+def replay(level, sequences, max_steps=None, batch_size=4096):
+    index = {}
+    rows = [index.setdefault(tuple(actions), len(index)) for actions in sequences]
+    unique = list(index)
+    outcome = np.zeros(len(unique), dtype=np.int8)
+    steps = np.array([len(actions) for actions in unique], dtype=np.int64)
+    if max_steps is not None:
+        steps = np.minimum(steps, max_steps)
+
+    vector = None
+    for start in range(0, len(unique), batch_size):
+        batch = unique[start:start + batch_size]
+        lengths = steps[start:start + batch_size]
+        if vector is None or vector.num_envs != len(batch):
+            vector = DirektVector_v0(len(batch), level=level_sheet(level))
+        vector.reset_states()
+
+        # finished games are fed waits, their later results are ignored
+        actions = np.full((len(batch), lengths.max(initial=0)), 5, dtype=np.int64)
+        for i, sequence in enumerate(batch):
+            actions[i, :lengths[i]] = sequence[:lengths[i]]
+        result = outcome[start:start + batch_size]
+        for t in range(actions.shape[1]):
+            live = (result == 0) & (t < lengths)
+            if not live.any():
+                break
+            played = vector.take_actions(actions[:, t])
+            ended = live & (played != 0)
+            result[ended] = played[ended]
+            lengths[ended] = t + 1
+    return Replay(outcome[rows], steps[rows])
+
+
+# rgb_array frames of the level before and after every action, (T + 1, H, W, 3)
+# uint8, shorter if the game ends before the actions do
+def render_frames(level, actions):
+    game = ArrayLevel(level_sheet(level))
+    states = [game.get_state()]
+    for action in actions:
+        # invalid actions burn a step and change nothing, like Direkt_v0.step
+        result = game.take_action(action) if action in game.get_valid_actions() else 0
+        states.append(game.get_state())
+        if result != 0:
+            break
+    return Rasterizer(game.template).draw_batch(states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay action sequences of a direkt level and check them.")
+    parser.add_argument("level", help="level name (level19) or path relative to gym_envs/direkt")
+    parser.add_argument("--actions", nargs="*", type=action_string, default=[], help="dot separated action strings")
+    parser.add_argument("--from-file", default=None, help="file of action strings, one per line")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--max-steps", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--frames", default=None, help="save the frames of the shortest win to this .npy file")
+    args = parser.parse_args()
+
+    if not os.path.isfile(os.path.join(GAME_DIR, level_sheet(args.level))):
+        parser.error(f"no level file {level_sheet(args.level)} in {GAME_DIR}")
+    name = os.path.splitext(os.path.basename(args.level))[0]
+    candidates = [{"source": "--actions", "reward": None, "actions": a} for a in args.actions]
+    if args.from_file:
+        try:
+            with open(args.from_file) as f:
+                lines = [(n, line) for n, line in enumerate(f, 1) if line.strip()]
+        except OSError as e:
+            parser.error(f"--from-file: {e}")
+        for n, line in lines:
+            try:
+                candidates.append({"source": args.from_file, "reward": None, "actions": parse_actions(line)})
+            except ValueError as e:
+                parser.error(f"--from-file {args.from_file} line {n}: {e}")
+    if not candidates:
+        candidates = read_solutions(name, args.model_dir)
+    if not candidates:
+        print("nothing to replay")
+        raise SystemExit(1)
+
+    result = replay(args.level, [c["actions"] for c in candidates], args.max_steps, args.batch_size)
+    broken = []
+    # the table gets long for bulk checks, then only mismatches are listed
+    verbose = len(candidates) <= 100
+    if verbose:
+        print(f"{'#':>5}  {'source':<12}{'recorded':>10}{'outcome':>9}{'steps':>7}{'reward':>8}")
+    for i, candidate in enumerate(candidates):
+        recorded = candidate["reward"]
+        claims_win = recorded is not None and recorded > 0
+        mismatch = claims_win and recorded != result.reward[i]
+        if mismatch:
+            broken.append(i)
+        if verbose or mismatch:
+            print(f"{i:>5}  {candidate['source']:<12}{'-' if recorded is None else recorded:>10}{result.status(i):>9}{result.steps[i]:>7}{result.reward[i]:>8}")
+
+    wins = np.flatnonzero(result.outcome == 1)
+    print(f"{len(wins)}/{len(result)} sequences win, {len(broken)} recorded wins no longer replay")
+    if args.frames and len(wins):
+        best = wins[np.argmin(result.steps[wins])]
+        frames = render_frames(args.level, candidates[best]["actions"][:result.steps[best]])
+        np.save(args.frames, frames)
+        print(f"frames:  {args.frames} {frames.shape}")
+    if broken:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
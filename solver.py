@@ -0,0 +1,330 @@
+"""Exact solver for direkt levels.
+
+The game is deterministic, so the shortest winning action sequence can be
+found by searching over game states instead of sampling. A state is the
+player cell, gate rotations, enemy cells and directions and, when they
+matter for the level, the player direction (triggers) and tick parity (slow
+enemies). Every state is stored once in a transposition table that also
+remembers how it was reached.
+
+Three searches are available:
+
+    bfs      breadth-first, optimal
+    astar    A* on the distance to the goal ignoring enemies and gates,
+             optimal; with --weight W > 1 the solution is at most W times
+             longer than optimal but far fewer states are expanded
+    idastar  iterative deepening A*, optimal, memory bounded by --tt-size
+
+    python solver.py level19 [--algorithm astar] [--weight 1.5] [--write]
+"""
+import argparse
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+from gym_envs.direkt.array_level import ArrayLevel
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "models")
+ALGORITHMS = ["bfs", "astar", "idastar"]
+
+
+class Solution:
+
+    def __init__(self, actions, nodes_expanded, states_deduplicated, states_seen, wall_time):
+        # None if the level cannot be won
+        self.actions = actions
+        self.nodes_expanded = nodes_expanded
+        self.states_deduplicated = states_deduplicated
+        self.states_seen = states_seen
+        self.wall_time = wall_time
+
+    # reward Direkt_v0 pays for playing the solution: -1 per step, 200 for the winning one
+    @property
+    def reward(self):
+        if self.actions is None:
+            return None
+        return 201 - len(self.actions)
+
+    # same format as the action column of models/<level>.npy_solution.csv
+    def action_string(self):
+        return '.'.join([str(a) for a in self.actions])
+
+    def __repr__(self):
+        return (f"Solution(actions={self.actions}, nodes_expanded={self.nodes_expanded}, "
+                f"states_deduplicated={self.states_deduplicated}, wall_time={self.wall_time:.3f})")
+
+
+def level_sheet(level):
+    if level.endswith(".json"):
+        return level
+    return f"levels/{level}.json"
+
+
+# Number of moves from every cell to the nearest goal cell, walking the grid
+# as if there were no enemies and every gate could be turned out of the way
+# (math.inf if no goal is reachable). Every move action covers one cell and no
+# other action moves the player, so this never overestimates the actions left.
+def goal_distances(arrays):
+    dist = [math.inf] * arrays.num_cells
+    frontier = deque()
+    for cell in range(arrays.num_cells):
+        if arrays.is_goal[cell]:
+            dist[cell] = 0
+            frontier.append(cell)
+
+    neighbors = arrays.neighbor.tolist()
+    while frontier:
+        cell = frontier.popleft()
+        for n in neighbors[cell]:
+            if n >= 0 and dist[n] == math.inf:
+                dist[n] = dist[cell] + 1
+                frontier.append(n)
+    return dist
+
+
+class Search:
+    """Expands game states of one level by driving an ``ArrayLevel``."""
+
+    def __init__(self, level):
+        self.game = ArrayLevel(level_sheet(level))
+        a = self.game.arrays
+        self.track_direction = bool((a.trigger_gate >= 0).any())
+        self.track_parity = a.num_slow > 0
+        self.goal_distance = goal_distances(a)
+        self.start = self.capture()
+
+    # Level.get_state with the player direction and the tick reduced to what
+    # decides how the game continues (0 or the tick parity where they do not
+    # matter), so equivalent states compare equal
+    def capture(self):
+        game = self.game
+        return (
+            game.player_cell,
+            game.player_dir if self.track_direction else 0,
+            game.game_tick % 2 if self.track_parity else 0,
+            tuple(game._gates),
+            tuple(game._enemy_cell),
+            tuple(game._enemy_dir),
+        )
+
+    def restore(self, state):
+        self.game.set_state(state)
+
+    # yields (action, result, next state) for every valid action that does not lose;
+    # the next state is None when the action wins
+    def successors(self, state):
+        self.restore(state)
+        for action in self.game.get_valid_actions():
+            self.restore(state)
+            result = self.game.take_action(action)
+            if result == -1:
+                continue
+            if result == 1:
+                yield action, result, None
+            else:
+                yield action, result, self.capture()
+
+    def heuristic(self, state):
+        return self.goal_distance[state[0]]
+
+
+def _path(parents, state):
+    actions = []
+    while parents[state] is not None:
+        state, action = parents[state]
+        actions.append(action)
+    actions.reverse()
+    return actions
+
+
+# Breadth-first search for the shortest winning action sequence.
+def bfs(search, max_depth=None, max_nodes=None, deadline=None):
+    parents = {search.start: None}
+    frontier = deque([(search.start, 0)])
+    nodes_expanded = 0
+    states_deduplicated = 0
+
+    while frontier:
+        state, depth = frontier.popleft()
+        if max_depth is not None and depth >= max_depth:
+            continue
+        if max_nodes is not None and nodes_expanded >= max_nodes:
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        nodes_expanded += 1
+
+        for action, result, child in search.successors(state):
+            if result == 1:
+                return _path(parents, state) + [action], nodes_expanded, states_deduplicated, len(parents)
+            if child in parents:
+                states_deduplicated += 1
+                continue
+            parents[child] = (state, action)
+            frontier.append((child, depth + 1))
+
+    return None, nodes_expanded, states_deduplicated, len(parents)
+
+
+# (Weighted) A*: expands by g + weight * h. weight 1 is optimal, weight w > 1
+# returns a solution at most w times longer than the optimal one.
+def astar(search, weight=1.0, max_depth=None, max_nodes=None, deadline=None):
+    best_g = {search.start: 0}
+    parents = {search.start: None}
+    tie = itertools.count()
+    # entries are (f, -g, tie, state, winning action); a winning action marks
+    # a finished solution that only counts once it is popped
+    frontier = [(weight * search.heuristic(search.start), 0, next(tie), search.start, None)]
+    nodes_expanded = 0
+    states_deduplicated = 0
+
+    while frontier:
+        _, neg_g, _, state, winning_action = heapq.heappop(frontier)
+        g = -neg_g
+        if winning_action is not None:
+            return _path(parents, state) + [winning_action], nodes_expanded, states_deduplicated, len(parents)
+        if g > best_g[state]:
+            continue
+        if max_depth is not None and g >= max_depth:
+            continue
+        if max_nodes is not None and nodes_expanded >= max_nodes:
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        nodes_expanded += 1
+
+        for action, result, child in search.successors(state):
+            if result == 1:
+                heapq.heappush(frontier, (g + 1, -(g + 1), next(tie), state, action))
+                continue
+            if child in best_g and best_g[child] <= g + 1:
+                states_deduplicated += 1
+                continue
+            h = search.heuristic(child)
+            if h == math.inf:
+                continue
+            best_g[child] = g + 1
+            parents[child] = (state, action)
+            heapq.heappush(frontier, (g + 1 + weight * h, -(g + 1), next(tie), child, None))
+
+    return None, nodes_expanded, states_deduplicated, len(parents)
+
+
+# IDA*: depth-first searches bounded by g + h, raising the bound to the smallest
+# f that exceeded it until a solution appears. Memory is the current path plus
+# a transposition table of at most tt_size states, which prunes states already
+# reached at the same or a lower g during the current iteration.
+def idastar(search, tt_size=1 << 20, max_depth=None, max_nodes=None, deadline=None):
+    bound = search.heuristic(search.start)
+    nodes_expanded = 0
+    states_deduplicated = 0
+    states_seen = 0
+    path = []
+
+    def visit(state, g, table):
+        nonlocal nodes_expanded, states_deduplicated
+        f = g + search.heuristic(state)
+        if f > bound:
+            return f
+        if max_depth is not None and g >= max_depth:
+            return math.inf
+        if max_nodes is not None and nodes_expanded >= max_nodes:
+            return math.inf
+        if deadline is not None and time.perf_counter() >= deadline:
+            return math.inf
+        nodes_expanded += 1
+
+        smallest = math.inf
+        for action, result, child in search.successors(state):
+            if result == 1:
+                path.append(action)
+                return True
+            seen = table.get(child)
+            if seen is not None and seen <= g + 1:
+                states_deduplicated += 1
+                continue
+            if seen is not None or len(table) < tt_size:
+                table[child] = g + 1
+
+            path.append(action)
+            found = visit(child, g + 1, table)
+            if found is True:
+                return True
+            path.pop()
+            smallest = min(smallest, found)
+        return smallest
+
+    while bound < math.inf:
+        table = {search.start: 0}
+        found = visit(search.start, 0, table)
+        states_seen = max(states_seen, len(table))
+        if found is True:
+            return path, nodes_expanded, states_deduplicated, states_seen
+        bound = found
+
+    return None, nodes_expanded, states_deduplicated, states_seen
+
+
+# Finds a solution of the level with the given algorithm (see ALGORITHMS).
+#
+# max_depth bounds the number of actions, max_nodes the number of expanded
+# states and max_seconds the wall time; when no solution is found within them
+# the Solution's actions are None.
+def solve(level, algorithm="bfs", weight=1.0, tt_size=1 << 20, max_depth=None, max_nodes=None, max_seconds=None):
+    start_time = time.perf_counter()
+    deadline = None if max_seconds is None else start_time + max_seconds
+    search = Search(level)
+    if algorithm == "bfs":
+        found = bfs(search, max_depth=max_depth, max_nodes=max_nodes, deadline=deadline)
+    elif algorithm == "astar":
+        found = astar(search, weight=weight, max_depth=max_depth, max_nodes=max_nodes, deadline=deadline)
+    elif algorithm == "idastar":
+        found = idastar(search, tt_size=tt_size, max_depth=max_depth, max_nodes=max_nodes, deadline=deadline)
+    else:
+        raise ValueError(f"unknown algorithm {algorithm!r}, expected one of {ALGORITHMS}")
+
+    actions, nodes_expanded, states_deduplicated, states_seen = found
+    return Solution(actions, nodes_expanded, states_deduplicated, states_seen, time.perf_counter() - start_time)
+
+
+# source takes the place of the episode number qvalue_learner writes
+def write_solution(level, solution, source="solver", model_dir=MODEL_DIR):
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, f"{level}.npy_solution.csv"), 'a') as fd:
+        fd.write(','.join([datetime.now().strftime('%Y-%m-%d %H:%M:%S'), source, str(0), str(solution.reward), solution.action_string()]) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the shortest solution of a direkt level.")
+    parser.add_argument("level", help="level name (level19) or path relative to gym_envs/direkt")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="bfs")
+    parser.add_argument("--weight", type=float, default=1.0, help="A* heuristic weight, > 1 trades optimality for speed")
+    parser.add_argument("--tt-size", type=int, default=1 << 20, help="IDA* transposition table entries")
+    parser.add_argument("--max-depth", type=int, default=None)
+    parser.add_argument("--max-nodes", type=int, default=None)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    parser.add_argument("--write", action="store_true", help="append the solution to models/<level>.npy_solution.csv")
+    args = parser.parse_args()
+
+    solution = solve(args.level, algorithm=args.algorithm, weight=args.weight, tt_size=args.tt_size,
+                     max_depth=args.max_depth, max_nodes=args.max_nodes, max_seconds=args.max_seconds)
+    print(f"nodes expanded:      {solution.nodes_expanded}")
+    print(f"states deduplicated: {solution.states_deduplicated}")
+    print(f"states seen:         {solution.states_seen}")
+    print(f"wall time:           {solution.wall_time:.3f}s")
+    if solution.actions is None:
+        print("no solution found")
+        raise SystemExit(1)
+
+    print(f"length:              {len(solution.actions)} (reward {solution.reward})")
+    print(solution.action_string())
+    if args.write:
+        write_solution(os.path.splitext(os.path.basename(args.level))[0], solution)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Full transition model of a direkt level and exact dynamic programming on it.
+
+The game is deterministic, so every state reachable from the start can be
+enumerated once and its seven actions recorded:
+
+    next_state[s, a]  int32 index of the state action a leads to, -1 when the
+                      action ends the game; invalid actions burn a step and
+                      stay in s, like Direkt_v0.step
+    result[s, a]      int8, -1 lose, 0 continue, 1 win
+
+State 0 is the start. ``state_id[s]`` is the ``StateLayout`` id of state s,
+the row the state has in qvalue_learner's q table. On these tables value or
+policy iteration find the optimal policy in a few NumPy sweeps, with the
+rewards Direkt_v0 pays: -1 per step, -100 for losing and 200 for winning.
+
+    python transition_model.py level19 [--method policy] [--write-q] [--write-solution]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from gym_envs.direkt.direkt_v0 import StateLayout
+from qvalue_learner import Runner
+from solver import MODEL_DIR, Search, Solution, write_solution
+
+METHODS = ["value", "policy"]
+
+
+class TransitionModel:
+
+    def __init__(self, next_state, result, state_id):
+        self.next_state = next_state
+        self.result = result
+        self.state_id = state_id
+
+    @property
+    def num_states(self):
+        return len(self.next_state)
+
+    # Enumerates every state reachable from the start of the level.
+    @classmethod
+    def compile(cls, level, max_states=None):
+        search = Search(level)
+        game = search.game
+        layout = StateLayout(game.template)
+
+        states = [search.start]
+        index = {search.start: 0}
+        next_state = []
+        result = []
+        state_id = []
+        i = 0
+        while i < len(states):
+            if max_states is not None and len(states) > max_states:
+                raise Exception(f"{level} has more than {max_states} reachable states")
+            state = states[i]
+            search.restore(state)
+            state_id.append(layout.state_id(game))
+
+            nxt = [i] * 7
+            res = [0] * 7
+            for action in game.get_valid_actions():
+                search.restore(state)
+                res[action] = game.take_action(action)
+                if res[action] != 0:
+                    nxt[action] = -1
+                    continue
+                child = search.capture()
+                j = index.get(child)
+                if j is None:
+                    j = index[child] = len(states)
+                    states.append(child)
+                nxt[action] = j
+            next_state.append(nxt)
+            result.append(res)
+            i += 1
+
+        return cls(np.array(next_state, dtype=np.int32), np.array(result, dtype=np.int8), np.array(state_id, dtype=np.int64))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, next_state=self.next_state, result=self.result, state_id=self.state_id)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["next_state"], data["result"], data["state_id"])
+
+    # reward Direkt_v0 pays for every (state, action)
+    def rewards(self):
+        return np.where(self.result == -1, -100.0, np.where(self.result == 1, 200.0, -1.0))
+
+    # q values of every (state, action) given the values of the states
+    def q_values(self, values, gamma, rewards=None):
+        if rewards is None:
+            rewards = self.rewards()
+        continues = self.result == 0
+        return rewards + gamma * np.where(continues, values[np.maximum(self.next_state, 0)], 0.0)
+
+    # Follows the greedy policy of q from the start, returns the winning
+    # actions or None if the policy loses or goes round in circles.
+    def greedy_solution(self, q):
+        policy = q.argmax(axis=1)
+        state = 0
+        actions = []
+        for _ in range(self.num_states):
+            action = int(policy[state])
+            actions.append(action)
+            if self.result[state, action] != 0:
+                return actions if self.result[state, action] == 1 else None
+            state = self.next_state[state, action]
+        return None
+
+
+# Bellman optimality sweeps until no state value moves by more than tol.
+# Returns the q values and the number of sweeps.
+#
+# Values start at -1 / (1 - gamma), the value of surviving forever without
+# winning. That is already exact for every state whose best option is to
+# stay alive, and from there the others settle after about as many sweeps as
+# their winning or losing line is long, instead of converging geometrically.
+def value_iteration(model, gamma=.99, tol=1e-6, max_sweeps=100000):
+    rewards = model.rewards()
+    discount = gamma * (model.result == 0)
+    safe_next = np.maximum(model.next_state, 0)
+    values = np.full(model.num_states, -1 / (1 - gamma))
+    for sweep in range(1, max_sweeps + 1):
+        new_values = (rewards + discount * values[safe_next]).max(axis=1)
+        delta = np.abs(new_values - values).max()
+        values = new_values
+        if delta < tol:
+            break
+    return model.q_values(values, gamma, rewards), sweep
+
+
+# Alternates evaluating the current policy, by sweeps of its own Bellman
+# equation, with making it greedy, until it no longer changes. Returns the q
+# values and the number of improvements.
+def policy_iteration(model, gamma=.99, tol=1e-6, max_iterations=1000):
+    rewards = model.rewards()
+    rows = np.arange(model.num_states)
+    policy = rewards.argmax(axis=1)
+    values = np.full(model.num_states, -1 / (1 - gamma))
+    for iteration in range(1, max_iterations + 1):
+        policy_rewards = rewards[rows, policy]
+        policy_next = model.next_state[rows, policy]
+        continues = policy_next >= 0
+        policy_next = np.maximum(policy_next, 0)
+        while True:
+            new_values = policy_rewards + gamma * np.where(continues, values[policy_next], 0.0)
+            delta = np.abs(new_values - values).max()
+            values = new_values
+            if delta < tol:
+                break
+
+        q = model.q_values(values, gamma, rewards)
+        # only switch actions that are clearly better, so ties cannot cycle
+        better = q.max(axis=1) > q[rows, policy] + tol
+        if not better.any():
+            return q, iteration
+        policy = np.where(better, q.argmax(axis=1), policy)
+    return q, iteration
+
+
+# Writes q as the q table of a fresh Runner(level, obs_mode="state_id"); states
+# that cannot be reached keep zeros.
+def write_q_table(level, model, q, q_store="dense", overwrite=False, model_dir=None):
+    runner = Runner(level, load=False, overwrite=overwrite, q_store=q_store, model_dir=model_dir)
+    if q_store == "dense":
+        runner.q_table[model.state_id] = q
+        runner.mapped.mark(model.state_id)
+    else:
+        runner.q_table[np.repeat(model.state_id, 7), np.tile(np.arange(7), model.num_states)] = q.ravel()
+    runner._checkpoint()
+    return runner.model_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a direkt level and solve it exactly.")
+    parser.add_argument("level", help="level name (level19)")
+    parser.add_argument("--method", choices=METHODS, default="value")
+    parser.add_argument("--gamma", type=float, default=.99)
+    parser.add_argument("--max-states", type=int, default=None)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--write-q", action="store_true", help="write the q table to <model-dir>/<level>.npy")
+    parser.add_argument("--q-store", choices=["dense", "sparse"], default="dense")
+    parser.add_argument("--overwrite", action="store_true", help="allow --write-q to replace a trained model")
+    parser.add_argument("--write-solution", action="store_true", help="append the solution to <model-dir>/<level>.npy_solution.csv")
+    args = parser.parse_args()
+
+    os.makedirs(args.model_dir, exist_ok=True)
+    start_time = time.perf_counter()
+    model = TransitionModel.compile(args.level, max_states=args.max_states)
+    compiled = time.perf_counter()
+    model.save(os.path.join(args.model_dir, f"{args.level}.transitions.npz"))
+    print(f"states:      {model.num_states}")
+    print(f"compile:     {compiled - start_time:.3f}s")
+
+    if args.method == "value":
+        q, sweeps = value_iteration(model, gamma=args.gamma)
+    else:
+        q, sweeps = policy_iteration(model, gamma=args.gamma)
+    solved = time.perf_counter()
+    print(f"solve:       {solved - compiled:.3f}s ({sweeps} {'sweeps' if args.method == 'value' else 'improvements'})")
+
+    if args.write_q:
+        print(f"q table:     {write_q_table(args.level, model, q, args.q_store, args.overwrite, args.model_dir)}")
+
+    actions = model.greedy_solution(q)
+    if actions is None:
+        print("no solution found")
+        raise SystemExit(1)
+    solution = Solution(actions, model.num_states, 0, model.num_states, solved - start_time)
+    print(f"length:      {len(actions)} (reward {solution.reward})")
+    print(solution.action_string())
+    if args.write_solution:
+        write_solution(args.level, solution, source=f"{args.method}_iteration", model_dir=args.model_dir)
+
+
+if __name__ == "__main__":
+    main()